@@ -2,6 +2,7 @@
 ASGI config for django_aggregator project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+The stream of new jobs (/events/jobs/) only works through it, e.g. with ``uvicorn django_aggregator.asgi:application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
@@ -13,4 +14,14 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'django_aggregator.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once Django is set up, as it uses the models.
+from django_jobs.events import EVENTS_PATH, job_events  # noqa: E402
+
+
+async def application(scope, receive, send):
+    # The server-sent events of new jobs are served here, with no thread per connection, everything else by Django.
+    if scope["type"] == "http" and scope["path"] == EVENTS_PATH:
+        return await job_events(scope, receive, send)
+    return await django_application(scope, receive, send)
@@ -2,6 +2,7 @@ from __future__ import absolute_import, unicode_literals
 from celery import Celery
 import os
 from celery.schedules import crontab
+from django.conf import settings
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'django_aggregator.settings')
 
@@ -9,23 +10,23 @@ app = Celery('django_aggregator')
 app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks()
 
+# The file result backend doesn't create its directory.
+if app.conf.result_backend.startswith("file://"):
+    os.makedirs(app.conf.result_backend[len("file://"):], exist_ok=True)
+
 # We have to be careful regarding the task's path.
 # If we don't provide a proper path, Celery won't be able to recognize the task and it will throw error.
 app.conf.beat_schedule = {
-    'scraping-remote-co': {
-        'task': 'django_jobs.tasks.scrape_content_from_remote_co',
-        # Execute on Mondays and Fridays.
-        'schedule': crontab(0, 0, day_of_week=[1, 5]),
-    },
-    'scraping-we-work-remotely': {
-        'task': 'django_jobs.tasks.scrape_weworkremotely',
-        # Execute on Tuesdays and Saturdays.
-        'schedule': crontab(0, 0, day_of_week=[2, 5]),
+    'dispatching-due-scrapes': {
+        'task': 'django_jobs.tasks.dispatch_due_scrapes',
+        # Every source has its own interval, which the scheduler learns from the runs (see django_jobs/scheduling.py).
+        # Beat only checks every few minutes which sources are due.
+        'schedule': settings.SCRAPER_DISPATCH_INTERVAL,
     },
-    'scraping-remotive': {
-        'task': 'django_jobs.tasks.scrape_remotive',
-        # Execute on Wednesdays and Sundays.
-        'schedule': crontab(0, 0, day_of_week=[3, 6]),
+    'archiving-old-jobs': {
+        'task': 'django_jobs.tasks.archive_old_jobs_task',
+        # Every night, a few hours after the scrapers, when nobody is writing.
+        'schedule': crontab(0, 3),
     },
 
 }
\ No newline at end of file
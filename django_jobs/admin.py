@@ -1,6 +1,35 @@
 from django.contrib import admin
-from .models import Jobs, Company
+from django.db import transaction
+from .duplicates import promote_canonicals
+from .ingestion import update_company_stats
+from .models import (
+    Jobs, Company, PageValidator, DataVersion, ScrapeRun, ArchivedJob, PageSnapshot, SourceSchedule, HostThrottle,
+)
 # Register your models here.
 
-admin.site.register(Jobs)
 admin.site.register(Company)
+admin.site.register(PageValidator)
+admin.site.register(DataVersion)
+admin.site.register(ScrapeRun)
+admin.site.register(ArchivedJob)
+admin.site.register(PageSnapshot)
+admin.site.register(SourceSchedule)
+admin.site.register(HostThrottle)
+
+
+@admin.register(Jobs)
+class JobsAdmin(admin.ModelAdmin):
+    # The duplicates of a deleted job are listed instead of it, and the company stats are counted again.
+
+    def delete_model(self, request, obj):
+        job_id, company_id = obj.id, obj.company_id
+        with transaction.atomic():
+            super().delete_model(request, obj)
+            update_company_stats({company_id} | promote_canonicals([job_id]))
+
+    def delete_queryset(self, request, queryset):
+        jobs = list(queryset.values_list("id", "company_id"))
+        with transaction.atomic():
+            super().delete_queryset(request, queryset)
+            promoted = promote_canonicals([job_id for job_id, company_id in jobs])
+            update_company_stats({company_id for job_id, company_id in jobs} | promoted)
@@ -1,6 +1,32 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_migrate, post_save
+
+
+def install_search_index(sender, using, **kwargs):
+    # SQLite drops the triggers of a table when Django rebuilds it during a migration, so we put them back.
+    from django.db import connections
+    from .search import install_search_index
+    install_search_index(connections[using])
+
+
+def configure_connection(sender, connection, **kwargs):
+    from .storage import configure_connection
+    configure_connection(sender, connection, **kwargs)
+
+
+def forget_company(sender, instance, **kwargs):
+    from .companies import forget_company
+    forget_company(sender, instance, **kwargs)
 
 
 class DjangoJobsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'django_jobs'
+
+    def ready(self):
+        post_migrate.connect(install_search_index, sender=self)
+        connection_created.connect(configure_connection)
+        company = self.get_model("Company")
+        post_save.connect(forget_company, sender=company)
+        post_delete.connect(forget_company, sender=company)
@@ -0,0 +1,165 @@
+"""
+Offline benchmarks for the scrapers.
+The recorded pages from the 'fixtures' directory and the generated (synthetic) pages are replayed through the real
+scraping code, with HTTP stubbed out, and every stage is measured: parsing, saving and the whole task.
+Everything is saved in a transaction which is rolled back, so the database is left as it was.
+"""
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from pathlib import Path
+import logging
+import tempfile
+import time
+import tracemalloc
+from ..fetching import FetchEngine
+from ..ingestion import ingest_jobs
+from ..known_links import reset_known_links
+from ..sites import SITES, get_parser_backend
+from .synthetic import generate_page
+
+
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
+
+
+class ReplayResponse:
+    # The parts of requests.Response the scrapers are using.
+    def __init__(self, content, status_code=200):
+        self.content = content
+        self.status_code = status_code
+        self.headers = {}
+
+    def iter_content(self, chunk_size):
+        return iter_chunks(self.content, chunk_size)
+
+    def close(self):
+        pass
+
+
+class ReplayEngine(FetchEngine):
+    """
+    A fetch engine which never touches the network.
+    The given pages are served for their urls, and every other url gets an empty page.
+    """
+
+    def __init__(self, pages):
+        super().__init__(max_workers=4, per_host_limit=2, timeout=1)
+        self.pages = pages
+
+    def fetch(self, url, headers=None, stream=False):
+        return ReplayResponse(self.pages.get(url, b"<html></html>"))
+
+
+def iter_chunks(content, chunk_size=16 * 1024):
+    for start in range(0, len(content), chunk_size):
+        yield content[start:start + chunk_size]
+
+
+class Rollback(Exception):
+    pass
+
+
+def load_fixture(source):
+    return (FIXTURES_DIR / f"{source}.html").read_bytes()
+
+
+def datasets(sizes):
+    # The recorded page of every source, and the generated pages with the given number of cards.
+    for source in SITES:
+        yield source, "fixture", load_fixture(source)
+        for size in sizes:
+            yield source, f"synthetic-{size}", generate_page(source, size)
+
+
+def measure(function, repeat=1):
+    """
+    Running the function and measuring it.
+    Returns the result of the last run, the best time, the number of queries and the peak memory (in KiB).
+    The memory is measured in a separate run, because tracemalloc slows everything down.
+    """
+    best = None
+    with CaptureQueriesContext(connection) as queries:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = function()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+    queries_count = len(queries) // repeat
+
+    tracemalloc.start()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, best, queries_count, peak / 1024
+
+
+def in_rollback(function):
+    # Running the function in a transaction which is always rolled back, and starting every run with no known links.
+    def wrapper():
+        reset_known_links()
+        try:
+            with transaction.atomic():
+                result = function()
+                raise Rollback()
+        except Rollback:
+            pass
+        finally:
+            reset_known_links()
+        return result
+    return wrapper
+
+
+def run_benchmarks(sizes=(10, 1000, 100000), repeat=3):
+    """
+    Running the benchmarks for every source and every page.
+    Returns a list of results, one for every stage:
+    - 'parse': parsing the page with the site spec;
+    - 'stream': parsing the page as it would be downloaded, in chunks, without keeping the jobs;
+    - 'persist': saving the parsed jobs into an empty database;
+    - 'task': the whole scraping task for the page (fetch from the replay engine, parse, save).
+    """
+    from ..tasks import scrape_sources
+
+    results = []
+    for source, dataset, page in datasets(sizes):
+        spec = SITES[source]
+        url = spec.seeds[0]
+
+        parsed, seconds, queries, peak = measure(lambda: spec.parse(page, url), repeat)
+        cards = len(parsed.records)
+        results.append(result_row(source, dataset, "parse", len(page), cards, seconds, queries, peak))
+
+        _, seconds, queries, peak = measure(lambda: sum(1 for record in spec.stream(iter_chunks(page), url)), repeat)
+        results.append(result_row(source, dataset, "stream", len(page), cards, seconds, queries, peak))
+
+        _, seconds, queries, peak = measure(in_rollback(lambda: ingest_jobs(parsed.records)), repeat)
+        results.append(result_row(source, dataset, "persist", len(page), cards, seconds, queries, peak))
+
+        engine = ReplayEngine({url: page})
+        # The task logs a line for every page, we don't need it here. The snapshots go to a temporary directory.
+        logging.disable(logging.INFO)
+        try:
+            with tempfile.TemporaryDirectory() as snapshot_dir, override_settings(SCRAPER_SNAPSHOT_DIR=snapshot_dir):
+                _, seconds, queries, peak = measure(in_rollback(lambda: scrape_sources([source], engine)), repeat)
+        finally:
+            logging.disable(logging.NOTSET)
+            engine.close()
+        results.append(result_row(source, dataset, "task", len(page), cards, seconds, queries, peak))
+    return results
+
+
+def result_row(source, dataset, stage, page_bytes, cards, seconds, queries, peak):
+    return {
+        "source": source,
+        "dataset": dataset,
+        "stage": stage,
+        "parser": get_parser_backend(),
+        "page_bytes": page_bytes,
+        "cards": cards,
+        "seconds": round(seconds, 6),
+        "cards_per_second": round(cards / seconds, 1) if seconds else None,
+        "queries": queries,
+        "queries_per_job": round(queries / cards, 3) if cards else None,
+        "peak_memory_kib": round(peak, 1),
+    }
@@ -0,0 +1,246 @@
+"""
+Load tests for the web views.
+A synthetic dataset of the given size is saved, and a few concurrent clients request every page of
+django_jobs/urls.py (with the Django test client, so it's the views, the middleware and the database that are
+measured, not the network). For every page we report the latency percentiles, the queries per request and the size
+of the response, and compare them with the budget of the page.
+The pages are cached in a separate local-memory cache, so a shared cache (CACHE_URL) is never touched.
+"""
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+import datetime
+import math
+import random
+import threading
+import time
+from ..caching import bump_data_version
+from ..ingestion import update_company_stats
+from ..metrics import add_parse_failures
+from ..models import ArchivedJob, Company, Jobs, ScrapeRun
+from ..normalization import normalize_company
+from ..sites import SITES
+from .synthetic import COMPANIES, TITLES
+
+
+# The most queries and the slowest 95th percentile (in milliseconds) every page is allowed, with the page cache on.
+# A page over its budget fails the load test. The numbers of queries don't depend on the size of the data.
+DEFAULT_BUDGETS = {
+    "homepage": {"queries": 2, "p95_ms": 500},
+    "company-detail": {"queries": 3, "p95_ms": 500},
+    "search": {"queries": 3, "p95_ms": 1000},
+    "archive": {"queries": 3, "p95_ms": 1000},
+    "export-csv": {"queries": 1, "p95_ms": 5000},
+    "export-ndjson": {"queries": 1, "p95_ms": 5000},
+    "jobs-feed": {"queries": 2, "p95_ms": 500},
+    "metrics": {"queries": 4, "p95_ms": 500},
+}
+
+LOAD_TEST_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "load-test"}}
+NO_CACHES = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+
+SEED_BATCH_SIZE = 1000
+
+
+def company_weights(companies, skew):
+    # A Zipf-like distribution: with skew 0 every company has as many jobs, with skew 1 the first one has the most.
+    return [1 / (rank + 1) ** skew for rank in range(companies)]
+
+
+def seed_dataset(companies=100, jobs=10000, archived=1000, skew=1.0, runs=1000, seed=0):
+    """
+    Saving the synthetic companies, jobs, archived jobs and scraping runs.
+    The jobs are spread over the last 90 days, and over the companies according to 'skew'.
+    The runs (for the metrics page) go back one hour each, taking turns between the sources.
+    Returns the number of rows saved, by model.
+    """
+    rng = random.Random(seed)
+    today = timezone.now().date()
+    names = [f"{COMPANIES[number % len(COMPANIES)]} {number}" for number in range(companies)]
+
+    with transaction.atomic():
+        Company.objects.bulk_create(
+            [Company(name=name, normalized_name=normalize_company(name)) for name in names],
+            batch_size=SEED_BATCH_SIZE,
+        )
+        company_ids = list(Company.objects.filter(name__in=names).order_by("id").values_list("id", flat=True))
+        weights = company_weights(len(company_ids), skew)
+        for start in range(0, jobs, SEED_BATCH_SIZE):
+            Jobs.objects.bulk_create([
+                Jobs(
+                    title=f"{rng.choice(TITLES)} {number}",
+                    company_id=rng.choices(company_ids, weights)[0],
+                    date=today - datetime.timedelta(days=rng.randrange(90)),
+                    link=f"https://load-test.example.com/jobs/{number}",
+                )
+                for number in range(start, min(start + SEED_BATCH_SIZE, jobs))
+            ])
+        ArchivedJob.objects.bulk_create(
+            [
+                ArchivedJob(
+                    title=f"{rng.choice(TITLES)} {number}",
+                    company_name=rng.choice(names),
+                    date=today - datetime.timedelta(days=365 + rng.randrange(365)),
+                    link=f"https://load-test.example.com/archive/{number}",
+                )
+                for number in range(archived)
+            ],
+            batch_size=SEED_BATCH_SIZE,
+        )
+        sources = sorted(SITES)
+        now = timezone.now()
+        scrape_runs = []
+        for number in range(runs):
+            started = now - datetime.timedelta(hours=number + 1)
+            scrape_runs.append(ScrapeRun(
+                source=sources[number % len(sources)],
+                started=started,
+                finished=started + datetime.timedelta(seconds=rng.uniform(5, 60)),
+                pages=rng.randint(1, 20),
+                inserted=rng.randint(0, 50),
+                fetch_seconds=rng.uniform(1, 30),
+                parse_seconds=rng.uniform(0.1, 2),
+                parse_failures={"company": 1} if rng.random() < 0.2 else {},
+            ))
+        ScrapeRun.objects.bulk_create(scrape_runs, batch_size=SEED_BATCH_SIZE)
+        for source in sources:
+            failures = sum(1 for run in scrape_runs if run.source == source and run.parse_failures)
+            if failures:
+                add_parse_failures(source, {"company": failures})
+        update_company_stats(company_ids)
+        bump_data_version()
+    return {"companies": companies, "jobs": jobs, "archived": archived, "runs": runs}
+
+
+def load_targets(seed=0):
+    """
+    The pages of django_jobs/urls.py, as functions which return a random path of the page.
+    The companies with the most jobs are picked the most often, like the visitors do.
+    """
+    rng = random.Random(seed)
+    companies = list(Company.objects.order_by("-job_count").values_list("id", "job_count"))
+    company_ids = [company_id for company_id, job_count in companies]
+    weights = [job_count + 1 for company_id, job_count in companies]
+    words = sorted({word.lower() for title in TITLES for word in title.split()})
+    first_id = Jobs.objects.order_by("id").values_list("id", flat=True).first() or 0
+    latest_id = Jobs.objects.order_by("-id").values_list("id", flat=True).first() or 0
+
+    def with_query(name, **params):
+        query = "&".join(f"{key}={value}" for key, value in params.items())
+        return f"{reverse(f'django_jobs:{name}')}{'?' + query if query else ''}"
+
+    return {
+        "homepage": lambda: with_query("homepage"),
+        "company-detail": lambda: reverse(
+            "django_jobs:company-detail", args=[rng.choices(company_ids, weights)[0]]
+        ),
+        "search": lambda: with_query("search", query=rng.choice(words)),
+        "archive": lambda: with_query("archive", query=rng.choice(words)),
+        "export-csv": lambda: with_query("export-csv", company=rng.choice(company_ids)),
+        "export-ndjson": lambda: with_query("export-ndjson", company=rng.choice(company_ids)),
+        # Most of the pollers are up to date, the others catch up from a random cursor.
+        "jobs-feed": lambda: with_query(
+            "jobs-feed", since=latest_id if rng.random() < 0.8 else rng.randint(first_id, latest_id),
+        ),
+        "metrics": lambda: with_query("metrics"),
+    }
+
+
+def percentile(values, percent):
+    # The nearest-rank percentile of a list of numbers.
+    values = sorted(values)
+    if not values:
+        return None
+    rank = math.ceil(percent / 100 * len(values))
+    return values[min(max(rank, 1), len(values)) - 1]
+
+
+def request_page(client, path):
+    # Requesting a page and reading all of it. Returns the status, the seconds, the queries and the size.
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        response = client.get(path)
+        content = b"".join(response.streaming_content) if response.streaming else response.content
+        seconds = time.perf_counter() - start
+    return response.status_code, seconds, len(queries), len(content)
+
+
+def load_page(path_for, clients, requests):
+    """
+    Sending 'requests' requests for a page, from 'clients' threads at the same time.
+    Every thread has its own client and its own database connection.
+    """
+    samples = []
+    lock = threading.Lock()
+
+    def run(count):
+        client = Client(raise_request_exception=False)
+        try:
+            for _ in range(count):
+                sample = request_page(client, path_for())
+                with lock:
+                    samples.append(sample)
+        finally:
+            connection.close()
+
+    threads = [
+        threading.Thread(target=run, args=(requests // clients + (1 if number < requests % clients else 0),))
+        for number in range(clients)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, time.perf_counter() - start
+
+
+def run_load_test(clients=8, requests=100, names=None, cache=True, seed=0):
+    """
+    Load testing the pages (all of them, or the given names) on the data in the current database.
+    Returns a result for every page: the latency percentiles (in milliseconds), the queries per request (mean and
+    max), the mean response size, the requests per second and the number of errors (4xx and 5xx).
+    With 'cache' False, the page cache is off, so every request renders the page.
+    """
+    targets = load_targets(seed)
+    results = []
+    with override_settings(CACHES=LOAD_TEST_CACHES if cache else NO_CACHES):
+        caches["default"].clear()
+        for name, path_for in targets.items():
+            if names and name not in names:
+                continue
+            samples, elapsed = load_page(path_for, clients, requests)
+            latencies = [seconds * 1000 for status, seconds, queries, size in samples]
+            queries = [queries for status, seconds, queries, size in samples]
+            results.append({
+                "name": name,
+                "requests": len(samples),
+                "errors": sum(1 for status, seconds, queries, size in samples if status >= 400),
+                "p50_ms": round(percentile(latencies, 50), 3),
+                "p95_ms": round(percentile(latencies, 95), 3),
+                "p99_ms": round(percentile(latencies, 99), 3),
+                "queries_mean": round(sum(queries) / len(queries), 2),
+                "queries_max": max(queries),
+                "bytes_mean": round(sum(size for status, seconds, queries, size in samples) / len(samples)),
+                "requests_per_second": round(len(samples) / elapsed, 1) if elapsed else None,
+            })
+    return results
+
+
+def check_budgets(results, budgets=None):
+    # The pages which went over their budget (or answered with errors), as messages. Empty if everything is fine.
+    budgets = DEFAULT_BUDGETS if budgets is None else budgets
+    failures = []
+    for result in results:
+        name = result["name"]
+        budget = budgets.get(name, {})
+        if result["errors"]:
+            failures.append(f"{name}: {result['errors']} of {result['requests']} requests failed.")
+        if "queries" in budget and result["queries_max"] > budget["queries"]:
+            failures.append(f"{name}: {result['queries_max']} queries per request, the budget is {budget['queries']}.")
+        if "p95_ms" in budget and result["p95_ms"] > budget["p95_ms"]:
+            failures.append(f"{name}: p95 is {result['p95_ms']} ms, the budget is {budget['p95_ms']} ms.")
+    return failures
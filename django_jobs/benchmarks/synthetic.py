@@ -0,0 +1,91 @@
+import random
+
+
+# The markup of a single job card, for every source, in the same shape the websites use.
+CARDS = {
+    "remote_co": """
+<a href="/job/{slug}/" class="card m-0 border-left-0 border-right-0 border-top-0 border-bottom">
+  <div class="card-body px-3 py-0 pl-md-0">
+    <div class="row no-gutters align-items-center">
+      <div class="col-lg-1 col-md-2 d-none d-md-block"><img src="/wp-content/uploads/{slug}.png" alt="{company}"></div>
+      <div class="col position-static">
+        <span class="font-weight-bold larger">{title}</span>
+        <p class="m-0 text-secondary">{company}<span class="badge badge-success"> | <small>Full-time</small></span>
+        <span> | <small>International</small></span></p>
+      </div>
+      <div class="col-lg-2 text-lg-right"><date>{days} days ago</date></div>
+    </div>
+  </div>
+</a>""",
+    "weworkremotely": """
+<li class="feature">
+  <div class="tooltip">Featured</div>
+  <a href="/company/{company_slug}"><div class="flag-logo" style="background-image:url(/logos/{slug}.png)"></div></a>
+  <a href="/remote-jobs/{slug}">
+    <span class="company">{company}</span>
+    <span class="title">{title}</span>
+    <span class="featured">Featured</span>
+    <span class="company">Full-Time</span>
+    <span class="region company">Anywhere in the World</span>
+    <span class="date"><time datetime="2021-04-{day:02d}T10:00:00Z">Apr {day}</time></span>
+  </a>
+</li>""",
+    "remotive": """
+<li class="tw-cursor-pointer job-list-item tw-block tw-rounded-md tw-p-4">
+  <div class="job-tile tw-flex">
+    <img class="tw-w-12 tw-h-12" src="https://remotive.io/job/{slug}/logo" alt="{company}">
+    <div class="tw-ml-4">
+      <a class="job-tile-title" href="remote-jobs/software-dev/{slug}"><span>{title}</span></a>
+      <p class="tw-text-sm"><span itemprop="hiringOrganization">{company}</span>
+      <span itemprop="datePosted">2021-04-{day:02d} 08:30:00</span></p>
+    </div>
+  </div>
+  <div class="job-tile-tags"><a class="job-tag">python</a><a class="job-tag">django</a><a class="job-tag">aws</a></div>
+</li>""",
+}
+
+# The parts of the page around the list of jobs: scripts, navigation, footer...
+PAGE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+  <meta charset="utf-8">
+  <title>Remote Jobs</title>
+  {scripts}
+</head>
+<body>
+  <nav class="navbar">{navigation}</nav>
+  <main><ul class="jobs">{cards}</ul>
+  <nav class="pagination"><a class="page-numbers" rel="next" href="?page=2">Next</a></nav></main>
+  <footer>{navigation}</footer>
+</body>
+</html>"""
+
+TITLES = ["Backend Engineer", "Python Developer", "Frontend Developer", "DevOps Engineer", "Data Engineer",
+          "Full Stack Developer", "QA Engineer", "Site Reliability Engineer", "Mobile Developer", "Tech Lead"]
+COMPANIES = ["Acme", "Globex", "Initech", "Umbrella", "Hooli", "Stark Industries", "Wayne Enterprises",
+             "Soylent", "Tyrell", "Cyberdyne"]
+
+
+def generate_page(source, cards, seed=0):
+    """
+    Generating a listing page with the given number of job cards for the source.
+    The jobs have unique links, and the titles, companies and dates are repeated like on the real websites.
+    """
+    rng = random.Random(seed)
+    card = CARDS[source]
+    items = []
+    for number in range(cards):
+        title = rng.choice(TITLES)
+        company = f"{rng.choice(COMPANIES)} {number % 500}"
+        items.append(card.format(
+            slug=f"{title.lower().replace(' ', '-')}-{seed}-{number}",
+            company_slug=company.lower().replace(" ", "-"),
+            title=title,
+            company=company,
+            days=rng.randint(1, 9),
+            day=rng.randint(1, 28),
+        ))
+
+    scripts = "".join(f'<script src="/static/js/bundle-{number}.js"></script>' for number in range(20))
+    navigation = "".join(f'<a href="/remote-jobs/category-{number}/">Category {number}</a>' for number in range(40))
+    return PAGE.format(scripts=scripts, navigation=navigation, cards="".join(items)).encode()
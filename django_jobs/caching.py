@@ -0,0 +1,61 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.http import HttpResponse
+from django.utils import timezone
+import hashlib
+from .models import DataVersion
+
+
+# There is only one counter, so it always has the same primary key.
+DATA_VERSION_ID = 1
+
+
+def get_data_version():
+    # A single primary key lookup. Returns 0 if the scrapers never added anything.
+    return DataVersion.objects.filter(pk=DATA_VERSION_ID).values_list("version", flat=True).first() or 0
+
+
+def bump_data_version():
+    # Increasing the counter in the database, so every process (web or worker) sees the new version.
+    updated = DataVersion.objects.filter(pk=DATA_VERSION_ID).update(version=F("version") + 1, updated=timezone.now())
+    if not updated:
+        DataVersion.objects.get_or_create(pk=DATA_VERSION_ID, defaults={"version": 1})
+
+
+def page_cache_key(request, version):
+    # The full path includes the query string, so every page, cursor and search query has its own entry.
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f"django_jobs:response:{version}:{path}"
+
+
+class VersionedCacheMixin:
+    """
+    Caching the rendered pages until the scrapers add new jobs.
+    The cache key contains the data version, so the old entries are simply never read again after a scrape
+    (they expire on their own). Works with any cache backend, including the local-memory and the file cache.
+    The content is cached with the headers of the response (Content-Type, Vary, Content-Language...), the cookies
+    are not.
+    """
+    cache_timeout = None
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method != "GET":
+            return super().dispatch(request, *args, **kwargs)
+
+        key = page_cache_key(request, get_data_version())
+        cached = cache.get(key)
+        if cached is not None:
+            content, headers = cached
+            response = HttpResponse(content)
+            for header, value in headers:
+                response[header] = value
+            return response
+
+        response = super().dispatch(request, *args, **kwargs)
+        if response.status_code == 200:
+            if hasattr(response, "render"):
+                response.render()
+            timeout = self.cache_timeout if self.cache_timeout is not None else settings.JOBS_PAGE_CACHE_TIMEOUT
+            cache.set(key, (response.content, list(response.items())), timeout)
+        return response
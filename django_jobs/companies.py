@@ -0,0 +1,119 @@
+from collections import OrderedDict
+from django.conf import settings
+from django.db import transaction
+import threading
+from .models import Company
+from .normalization import normalize_company
+
+
+# SQLite limits the number of variables in a single statement, so the lookups are chunked.
+LOOKUP_BATCH_SIZE = 500
+
+
+class CompanyResolver:
+    """
+    Mapping the company names from the scrapers to Company ids.
+    The names are compared by their normalized form, so 'Acme Inc.', 'ACME, inc' and 'Acme ' are one company.
+    The ids of the recently used companies are kept in memory (the least recently used ones are dropped first),
+    so a scrape of companies we already know costs no queries at all.
+    A company which is renamed or deleted is dropped from the cache by the signals of its process. The workers
+    don't see the signals of the other processes: when the ingestion fails on a deleted company, their cache
+    is cleared instead (see ingest_jobs and django_jobs/pipeline.py).
+    """
+
+    def __init__(self, max_size=None):
+        self.max_size = max_size or settings.SCRAPER_COMPANY_CACHE
+        self._ids = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def _get(self, key):
+        with self._lock:
+            company_id = self._ids.get(key)
+            if company_id is not None:
+                self._ids.move_to_end(key)
+            return company_id
+
+    def _remember(self, ids):
+        with self._lock:
+            for key, company_id in ids.items():
+                self._ids[key] = company_id
+                self._ids.move_to_end(key)
+            while len(self._ids) > self.max_size:
+                self._ids.popitem(last=False)
+
+    def _lookup(self, keys):
+        ids = {}
+        for start in range(0, len(keys), LOOKUP_BATCH_SIZE):
+            chunk = keys[start:start + LOOKUP_BATCH_SIZE]
+            ids.update(Company.objects.filter(normalized_name__in=chunk).values_list("normalized_name", "id"))
+        return ids
+
+    def resolve(self, names):
+        """
+        Returns a dict of the given names and their company ids.
+        - Cached companies cost nothing;
+        - The others are looked up with one query (per chunk);
+        - The missing ones are created with one bulk insert and read back with one more query.
+        """
+        keys = {name: normalize_company(name) for name in names}
+        ids = {}
+        for key in set(keys.values()):
+            company_id = self._get(key)
+            if company_id is not None:
+                ids[key] = company_id
+
+        missing = sorted(set(keys.values()) - set(ids))
+        if missing:
+            found = self._lookup(missing)
+            to_create = {}
+            for name, key in keys.items():
+                if key not in ids and key not in found:
+                    # The first spelling we see becomes the name of the company.
+                    to_create.setdefault(key, Company(name=name.strip(), normalized_name=key))
+            if to_create:
+                # Another worker may be creating the same companies, the unique key keeps just one of them.
+                Company.objects.bulk_create(list(to_create.values()), ignore_conflicts=True)
+                found.update(self._lookup(list(to_create)))
+            ids.update(found)
+            # The ids are cached only once they are committed, a rolled back company must not be used again.
+            transaction.on_commit(lambda: self._remember(found))
+
+        return {name: ids[key] for name, key in keys.items()}
+
+    def forget(self, company_id):
+        with self._lock:
+            for key in [key for key, cached_id in self._ids.items() if cached_id == company_id]:
+                del self._ids[key]
+
+    def clear(self):
+        with self._lock:
+            self._ids.clear()
+
+
+_resolver = None
+_resolver_lock = threading.Lock()
+
+
+def get_company_resolver():
+    # One resolver for the whole process, so the cache stays warm between the scrapes.
+    global _resolver
+    with _resolver_lock:
+        if _resolver is None:
+            _resolver = CompanyResolver()
+        return _resolver
+
+
+def reset_company_resolver():
+    # Forgetting all the cached companies, e.g. when the companies are deleted from the database.
+    global _resolver
+    with _resolver_lock:
+        _resolver = None
+
+
+def forget_company(sender, instance, created=False, **kwargs):
+    # Connected to the 'post_save' and 'post_delete' signals of Company (see django_jobs/apps.py).
+    if not created and _resolver is not None:
+        _resolver.forget(instance.pk)
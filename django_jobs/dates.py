@@ -0,0 +1,8 @@
+from django.conf import settings
+import datetime
+
+
+def retention_cutoff(today=None):
+    # The jobs posted before this date belong in the archive.
+    today = today or datetime.date.today()
+    return today - datetime.timedelta(days=settings.JOBS_RETENTION_DAYS)
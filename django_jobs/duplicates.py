@@ -0,0 +1,199 @@
+"""
+Finding the same job posted on more than one source.
+Every job gets a MinHash signature of its normalized title and company name. The signature is split into bands,
+and every band is saved as a bucket key (locality-sensitive hashing), so a new job is compared only with the few
+jobs which share a bucket with it, never with the whole table. The candidates are then checked exactly:
+the sources, the similarity of the title and company, and the posting dates. Two jobs of the same source are
+never the same posting: a website doesn't list one opening twice, and 'Engineer II' and 'Engineer III' are alike.
+Matching jobs get the id of the first job of the group as their 'cluster_id', and the listings show only that one.
+When that job is archived or deleted, the oldest job left in the group takes its place (see promote_canonicals).
+"""
+from django.conf import settings
+from django.db.models import BigIntegerField, Case, F, Q, Value, When
+from functools import lru_cache
+import hashlib
+import struct
+from urllib.parse import urlsplit
+from .models import Jobs, DuplicateBucket
+from .normalization import normalize_company, normalize_title
+
+
+# 10 bands of 3 hashes: jobs which are 80% similar share a bucket with a probability of 99.9%.
+BANDS = 10
+ROWS = 3
+SIGNATURE_SIZE = BANDS * ROWS
+# Every shingle is hashed with blake2b (stable between processes, unlike hash()), and every 64-byte digest gives
+# us 16 of the 32-bit hash functions, so 2 digests with different salts are enough for the whole signature.
+DIGEST_SALTS = [b"minhash0", b"minhash1"]
+UNPACK_DIGEST = struct.Struct("<16I").unpack
+
+# SQLite limits the number of variables in a single statement, so the lookups are chunked.
+LOOKUP_BATCH_SIZE = 500
+
+# Listing only one job of every group of duplicates.
+NOT_DUPLICATE = Q(cluster_id__isnull=True) | Q(cluster_id=F("id"))
+
+
+def collapse_duplicates(queryset):
+    return queryset.filter(NOT_DUPLICATE)
+
+
+def shingles(text):
+    # The overlapping 3-character pieces of the text.
+    return {text[start:start + 3] for start in range(max(len(text) - 2, 1))}
+
+
+def link_source(link):
+    # The website of a job, from its link ('www.' is left out, both forms are the same source).
+    host = urlsplit(link).netloc.lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def describe(job_id, title, company, date, link, cluster_id=None):
+    # Everything we need to compare a job with the others.
+    title_shingles = shingles(normalize_title(title))
+    company_shingles = shingles(normalize_company(company))
+    return {
+        "id": job_id,
+        "date": date,
+        "source": link_source(link),
+        "title": title_shingles,
+        "company": company_shingles,
+        "cluster": cluster_id or job_id,
+        # The company shingles are marked, so they never match the title ones.
+        "shingles": title_shingles | {f"@{piece}" for piece in company_shingles},
+    }
+
+
+def similarity(first, second):
+    # The Jaccard similarity of two sets of shingles.
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+@lru_cache(maxsize=65536)
+def shingle_hashes(piece):
+    # The same shingles come up again and again ('dev', 'eng'...), so their hashes are cached.
+    data = piece.encode()
+    values = []
+    for salt in DIGEST_SALTS:
+        values.extend(UNPACK_DIGEST(hashlib.blake2b(data, digest_size=64, salt=salt).digest()))
+    return values[:SIGNATURE_SIZE]
+
+
+def minhash(pieces):
+    # The smallest value of every hash function over all the shingles.
+    if not pieces:
+        return [0] * SIGNATURE_SIZE
+    return list(map(min, zip(*[shingle_hashes(piece) for piece in pieces])))
+
+
+def bucket_keys(pieces):
+    # One signed 64-bit key for every band of the signature.
+    signature = minhash(pieces)
+    keys = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS:(band + 1) * ROWS]
+        digest = hashlib.blake2b(f"{band}:{rows}".encode(), digest_size=8).digest()
+        keys.append(int.from_bytes(digest, "big", signed=True))
+    return keys
+
+
+def is_duplicate(job, other):
+    # Both the titles and the companies have to be similar: 'Acme 2' isn't 'Acme 12', whatever the title is.
+    return (
+        job["source"] != other["source"]
+        and abs((job["date"] - other["date"]).days) <= settings.JOBS_DUPLICATE_DAYS
+        and similarity(job["company"], other["company"]) >= settings.JOBS_DUPLICATE_THRESHOLD
+        and similarity(job["title"], other["title"]) >= settings.JOBS_DUPLICATE_THRESHOLD
+    )
+
+
+def _chunks(items, size=LOOKUP_BATCH_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def assign_clusters(new_jobs):
+    """
+    Indexing the given new jobs, (id, title, company name, date, link) tuples, and putting each of them into the cluster
+    of the job it duplicates. The jobs are handled in the order of their ids, so a job can also duplicate a job
+    from the same batch. A few queries per chunk of jobs, whatever the size of the table.
+    Returns the number of duplicates found.
+    """
+    jobs = {}
+    for job_id, title, company, date, link in new_jobs:
+        job = describe(job_id, title, company, date, link)
+        job["keys"] = bucket_keys(job["shingles"])
+        jobs[job_id] = job
+    if not jobs:
+        return 0
+
+    # The jobs we already have which share a bucket with one of the new jobs.
+    buckets = {}
+    all_keys = list({key for job in jobs.values() for key in job["keys"]})
+    for chunk in _chunks(all_keys):
+        for key, job_id in DuplicateBucket.objects.filter(key__in=chunk).values_list("key", "job_id"):
+            buckets.setdefault(key, set()).add(job_id)
+
+    candidates = {}
+    candidate_ids = sorted({job_id for ids in buckets.values() for job_id in ids} - set(jobs))
+    for chunk in _chunks(candidate_ids):
+        rows = Jobs.objects.filter(id__in=chunk).values_list(
+            "id", "title", "company__name", "date", "link", "cluster_id",
+        )
+        for row in rows:
+            candidates[row[0]] = describe(*row)
+
+    clusters = {}
+    for job_id in sorted(jobs):
+        job = jobs[job_id]
+        matches = sorted({other_id for key in job["keys"] for other_id in buckets.get(key, ())})
+        for other_id in matches:
+            other = candidates.get(other_id)
+            if other is not None and other_id < job_id and is_duplicate(job, other):
+                clusters[job_id] = other["cluster"]
+                break
+        # The new job is a candidate for the next jobs of the batch as well.
+        job["cluster"] = clusters.get(job_id, job_id)
+        candidates[job_id] = job
+        for key in job["keys"]:
+            buckets.setdefault(key, set()).add(job_id)
+
+    DuplicateBucket.objects.bulk_create(
+        [DuplicateBucket(job_id=job_id, key=key) for job_id, job in jobs.items() for key in job["keys"]],
+        ignore_conflicts=True,
+    )
+    for chunk in _chunks(list(clusters)):
+        Jobs.objects.filter(id__in=chunk).update(
+            cluster_id=Case(*[When(id=job_id, then=clusters[job_id]) for job_id in chunk])
+        )
+    return len(clusters)
+
+
+def promote_canonicals(removed_ids):
+    """
+    Keeping the groups of duplicates listed after some of their jobs were archived or deleted (it's called once
+    they are gone). The removed jobs which were the first job of a group are replaced by the oldest job left in
+    the group: its 'cluster_id' is cleared and the other jobs of the group point to it.
+    Returns the ids of the companies of the promoted jobs, their job counts change.
+    """
+    promoted = {}
+    company_ids = set()
+    for chunk in _chunks(list(removed_ids)):
+        rows = Jobs.objects.filter(cluster_id__in=chunk).order_by("id").values_list("id", "cluster_id", "company_id")
+        for job_id, cluster_id, company_id in rows:
+            if cluster_id not in promoted:
+                promoted[cluster_id] = job_id
+                company_ids.add(company_id)
+
+    for chunk in _chunks(list(promoted)):
+        Jobs.objects.filter(cluster_id__in=chunk).update(
+            cluster_id=Case(
+                When(id__in=[promoted[cluster_id] for cluster_id in chunk], then=Value(None)),
+                *[When(cluster_id=cluster_id, then=Value(promoted[cluster_id])) for cluster_id in chunk],
+                output_field=BigIntegerField(),
+            )
+        )
+    return company_ids
@@ -0,0 +1,206 @@
+"""
+Pushing the new jobs to the clients as server-sent events (GET /events/jobs/), through the ASGI application.
+One hub per process polls the database for jobs newer than the last one it has seen, and every batch is encoded
+once and handed to all the connections. An idle connection is only a coroutine waiting on its queue, so a single
+process holds thousands of them without a thread per client.
+- A client which reconnects with the Last-Event-ID header (or '?since=<id>') gets the jobs it missed first;
+- A client which can't keep up (its queue is full) is disconnected, and catches up when it reconnects;
+- A comment is sent every JOBS_EVENTS_KEEPALIVE seconds, so the proxies don't close the idle connections.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Max
+from urllib.parse import parse_qs
+import asyncio
+import logging
+from .exports import EXPORT_COLUMNS, EXPORT_FIELDS
+from .models import Jobs
+
+
+logger = logging.getLogger("django_jobs.events")
+
+EVENTS_PATH = "/events/jobs/"
+KEEPALIVE = b": keepalive\n\n"
+
+
+def latest_job_id():
+    return Jobs.objects.aggregate(latest=Max("id"))["latest"] or 0
+
+
+def read_jobs(since, until=None, limit=None):
+    # The jobs with an id greater than 'since' (and up to 'until'), oldest first, like in the JSON feed.
+    queryset = Jobs.objects.filter(id__gt=since).order_by("id")
+    if until is not None:
+        queryset = queryset.filter(id__lte=until)
+    rows = queryset.values_list(*EXPORT_FIELDS)[:limit or settings.JOBS_FEED_LIMIT]
+    return [dict(zip(EXPORT_COLUMNS, row)) for row in rows]
+
+
+def format_event(jobs):
+    # The id of the event is the id of the last job, so it's the cursor the client sends back when it reconnects.
+    data = DjangoJSONEncoder(ensure_ascii=False).encode(jobs)
+    return f"id: {jobs[-1]['id']}\nevent: jobs\ndata: {data}\n\n".encode()
+
+
+class Subscriber:
+    # The events waiting to be sent to one connection. None in the queue ends the stream.
+    # 'last_id' is the id of the newest job published before it subscribed, the newer ones come through the queue.
+
+    def __init__(self, last_id):
+        self.queue = asyncio.Queue(maxsize=settings.JOBS_EVENTS_QUEUE_SIZE)
+        self.last_id = last_id
+
+    def publish(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Too slow for us. Its events are dropped and the stream is ended, the client catches up when it reconnects.
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+            return False
+        return True
+
+
+class JobEventHub:
+    """
+    Fanning out the new jobs to all the subscribers of the process.
+    The database is polled by a single task, only while somebody is subscribed.
+    'last_id' is the id of the newest job published so far.
+    """
+
+    def __init__(self):
+        self.subscribers = set()
+        self.last_id = None
+        self._poller = None
+
+    async def subscribe(self):
+        if self.last_id is None:
+            last_id = await sync_to_async(latest_job_id)()
+            # Another connection may have set it while we were waiting for the database.
+            if self.last_id is None:
+                self.last_id = last_id
+        # Nothing is awaited from here on, so no event can be published between reading 'last_id' and adding
+        # the subscriber: it gets every job after its 'last_id' exactly once.
+        subscriber = Subscriber(self.last_id)
+        self.subscribers.add(subscriber)
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.ensure_future(self._poll())
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.discard(subscriber)
+        if not self.subscribers and self._poller is not None:
+            self._poller.cancel()
+            self._poller = None
+            # The jobs added while nobody is listening don't have to be published later.
+            self.last_id = None
+
+    def publish(self, jobs):
+        event = format_event(jobs)
+        for subscriber in list(self.subscribers):
+            if not subscriber.publish(event):
+                self.subscribers.discard(subscriber)
+        self.last_id = jobs[-1]["id"]
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(settings.JOBS_EVENTS_POLL_INTERVAL)
+            try:
+                # A big batch of new jobs is published in a few events.
+                while True:
+                    jobs = await sync_to_async(read_jobs)(self.last_id)
+                    if jobs:
+                        self.publish(jobs)
+                    if len(jobs) < settings.JOBS_FEED_LIMIT:
+                        break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception(f"Polling for new jobs failed. See the Exception: {e}")
+
+
+_hub = None
+
+
+def get_hub():
+    # One hub per process, so every batch of jobs is read from the database once.
+    global _hub
+    if _hub is None:
+        _hub = JobEventHub()
+    return _hub
+
+
+def get_since(scope):
+    # The cursor of a client which reconnects: the Last-Event-ID header, or the 'since' parameter.
+    headers = dict(scope.get("headers") or [])
+    values = [headers.get(b"last-event-id", b"").decode("latin-1")]
+    values += parse_qs(scope.get("query_string", b"").decode("latin-1")).get("since", [])
+    for value in values:
+        if value.strip().isdigit():
+            return int(value)
+    return None
+
+
+async def wait_for_disconnect(receive):
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def job_events(scope, receive, send):
+    # The ASGI application of the event stream.
+    if scope["method"] not in ("GET", "HEAD"):
+        await send({"type": "http.response.start", "status": 405, "headers": [(b"allow", b"GET, HEAD")]})
+        await send({"type": "http.response.body", "body": b""})
+        return
+
+    hub = get_hub()
+    subscriber = await hub.subscribe()
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream; charset=utf-8"),
+                (b"cache-control", b"no-cache"),
+                # Telling nginx not to buffer the stream.
+                (b"x-accel-buffering", b"no"),
+            ],
+        })
+        if scope["method"] == "HEAD":
+            await send({"type": "http.response.body", "body": b""})
+            return
+        await send({"type": "http.response.body", "body": KEEPALIVE, "more_body": True})
+
+        # The jobs the client missed, up to the ones the hub publishes to the subscriber.
+        since, until = get_since(scope), subscriber.last_id
+        while since is not None and since < until:
+            jobs = await sync_to_async(read_jobs)(since, until)
+            if not jobs:
+                break
+            await send({"type": "http.response.body", "body": format_event(jobs), "more_body": True})
+            since = jobs[-1]["id"]
+
+        while not disconnected.done():
+            next_event = asyncio.ensure_future(subscriber.queue.get())
+            done, pending = await asyncio.wait(
+                {next_event, disconnected}, timeout=settings.JOBS_EVENTS_KEEPALIVE, return_when=asyncio.FIRST_COMPLETED,
+            )
+            if next_event not in done:
+                next_event.cancel()
+                if not disconnected.done():
+                    await send({"type": "http.response.body", "body": KEEPALIVE, "more_body": True})
+                continue
+            event = next_event.result()
+            if event is None:
+                break
+            await send({"type": "http.response.body", "body": event, "more_body": True})
+        if not disconnected.done():
+            await send({"type": "http.response.body", "body": b""})
+    finally:
+        disconnected.cancel()
+        hub.unsubscribe(subscriber)
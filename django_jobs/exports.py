@@ -0,0 +1,66 @@
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+import csv
+import io
+from .models import Jobs
+
+
+# The columns of the export, in order. The company name comes from a join, so there is one query for everything.
+# Duplicates are exported as well, 'cluster_id' tells which jobs are the same posting.
+EXPORT_FIELDS = ["id", "title", "company_id", "company__name", "date", "link", "cluster_id"]
+EXPORT_COLUMNS = ["id", "title", "company_id", "company", "date", "link", "cluster_id"]
+
+
+def export_rows(since=None, company=None, chunk_size=None):
+    """
+    The jobs to export, oldest id first, as tuples of EXPORT_FIELDS.
+    The rows are read with a database iterator, 'chunk_size' rows at a time (a server-side cursor on PostgreSQL),
+    so only one chunk is ever held in memory, no matter how many jobs we have.
+    - since: only the jobs from this date on;
+    - company: only the jobs of the company with this id.
+    """
+    queryset = Jobs.objects.order_by("id")
+    if since:
+        queryset = queryset.filter(date__gte=since)
+    if company:
+        queryset = queryset.filter(company_id=company)
+    return queryset.values_list(*EXPORT_FIELDS).iterator(chunk_size=chunk_size or settings.JOBS_EXPORT_CHUNK_SIZE)
+
+
+def batched(rows, size):
+    # Grouping the rows, so the response is written in a few big pieces instead of one tiny piece per job.
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def stream_csv(rows, chunk_size=None):
+    # The header goes out straight away, before the first query, so the client gets the first byte quickly.
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    yield buffer.getvalue()
+
+    for batch in batched(rows, chunk_size or settings.JOBS_EXPORT_CHUNK_SIZE):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(batch)
+        yield buffer.getvalue()
+
+
+def stream_ndjson(rows, chunk_size=None):
+    # One JSON object per line (JSON Lines), so the consumers can read the export line by line as well.
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for batch in batched(rows, chunk_size or settings.JOBS_EXPORT_CHUNK_SIZE):
+        yield "".join(encoder.encode(dict(zip(EXPORT_COLUMNS, row))) + "\n" for row in batch)
+
+
+EXPORT_FORMATS = {
+    "csv": (stream_csv, "text/csv; charset=utf-8"),
+    "ndjson": (stream_ndjson, "application/x-ndjson; charset=utf-8"),
+}
@@ -0,0 +1,147 @@
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+import requests
+import random
+import threading
+import time
+from .throttling import get_rate_limiter
+
+
+headers_list = [
+    {  # Firefox/Linux
+        'User-Agent': 'Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:86.0) Gecko/20100101 Firefox/86.0',  # Change
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+        'Accept-Language': 'en-US,en;q=0.5',
+        'Connection': 'keep-alive',
+        'Upgrade-Insecure-Requests': '1',
+    },
+    {  # Chrome/Linux
+        'authority': 'remote.co',
+        'sec-ch-ua': '"Google Chrome";v="89", "Chromium";v="89", ";Not A Brand";v="99"',
+        'sec-ch-ua-mobile': '?0',
+        'upgrade-insecure-requests': '1',
+        'user-agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) '
+                      'Chrome/89.0.4389.82 Safari/537.36',
+        'accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,'
+                  'image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.9',
+        'sec-fetch-site': 'none',
+        'sec-fetch-mode': 'navigate',
+        'sec-fetch-user': '?1',
+        'sec-fetch-dest': 'document',
+        'accept-language': 'en-US,en;q=0.9',
+    },
+]
+
+
+def hold_until_read(response, limit):
+    # Releasing the place of a streamed response in the limit of its host once, when its body is read or it's closed.
+    lock = threading.Lock()
+    held = [True]
+    iter_content, close = response.iter_content, response.close
+
+    def release():
+        with lock:
+            if held[0]:
+                held[0] = False
+                limit.release()
+
+    def read_and_release(*args, **kwargs):
+        yield from iter_content(*args, **kwargs)
+        release()
+
+    def close_and_release():
+        try:
+            close()
+        finally:
+            release()
+
+    # response.content reads the body through iter_content as well.
+    response.iter_content = read_and_release
+    response.close = close_and_release
+
+
+class FetchEngine:
+    """
+    The engine which is used by all the scraping tasks to download pages.
+    - Requests are sent from a thread pool, so many pages are downloaded in parallel;
+    - Each host has its own requests.Session, so the connections are kept alive and reused;
+    - Each host has a limit on how many requests can be sent to it at the same time;
+    - Each host has a rate limit, shared with the other workers (see django_jobs/throttling.py).
+    """
+
+    def __init__(self, max_workers=None, per_host_limit=None, timeout=None, limiter=None):
+        self.max_workers = max_workers or settings.SCRAPER_MAX_WORKERS
+        self.per_host_limit = per_host_limit or settings.SCRAPER_PER_HOST_LIMIT
+        self.timeout = timeout or settings.SCRAPER_TIMEOUT
+        self.limiter = limiter or get_rate_limiter()
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="fetch")
+        self._sessions = {}
+        self._host_limits = {}
+        self._lock = threading.Lock()
+
+    def _host_state(self, host):
+        # Creating the session and the concurrency limit the first time we see the host.
+        with self._lock:
+            if host not in self._sessions:
+                session = requests.Session()
+                # We never send more than 'per_host_limit' requests to one host, so the pool doesn't need to be bigger.
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.per_host_limit)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._sessions[host] = session
+                self._host_limits[host] = threading.BoundedSemaphore(self.per_host_limit)
+            return self._sessions[host], self._host_limits[host]
+
+    def fetch(self, url, headers=None, stream=False):
+        """
+        Downloading a single page. The call blocks while the host is at its concurrency limit or its rate limit.
+        'headers' are added on top of the randomly chosen browser headers (e.g. the conditional headers).
+        With 'stream', only the headers are read, and the body is left for response.iter_content(). The body is
+        still downloaded from the host, so the request keeps its place in the limit of the host until the body
+        is read to the end or the response is closed.
+        """
+        session, limit = self._host_state(urlsplit(url).netloc)
+        # We randomize headers from headers_list so the website won't detect we are using requests library.
+        request_headers = dict(random.choice(headers_list))
+        request_headers.update(headers or {})
+        limit.acquire()
+        try:
+            wait_seconds = self.limiter.wait(url, session, self.timeout)
+            start = time.perf_counter()
+            response = session.get(url, headers=request_headers, timeout=self.timeout, stream=stream)
+            # Keeping the time it took (and the time it waited for its turn), so the scrapers can report it.
+            response.fetch_seconds = time.perf_counter() - start
+            response.wait_seconds = wait_seconds
+            self.limiter.record(url, response)
+        except BaseException:
+            limit.release()
+            raise
+        if not stream:
+            limit.release()
+            return response
+        hold_until_read(response, limit)
+        return response
+
+    def submit(self, url, headers=None, stream=False):
+        # Scheduling the download on the thread pool and returning the Future.
+        return self.executor.submit(self.fetch, url, headers, stream)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        for session in self._sessions.values():
+            session.close()
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_fetch_engine():
+    # The engine is created once per worker process, so the sessions (and their connections) stay warm between tasks.
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = FetchEngine()
+        return _engine
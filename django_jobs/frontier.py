@@ -0,0 +1,87 @@
+from collections import deque, Counter
+from concurrent.futures import wait, FIRST_COMPLETED
+from urllib.parse import urldefrag
+from django.conf import settings
+import logging
+
+
+logger = logging.getLogger("django_jobs.scraping")
+
+
+class CrawlFrontier:
+    """
+    The queue of pages which are waiting to be scraped.
+    - Every url is queued only once per crawl (fragments are ignored while comparing the urls);
+    - Each source can queue at most 'max_pages' pages, so a broken pagination can't crawl forever.
+    """
+
+    def __init__(self, max_pages=None):
+        self.max_pages = max_pages or settings.SCRAPER_MAX_PAGES
+        self._queue = deque()
+        self._seen = set()
+        self._pages = Counter()
+
+    def add(self, url, source):
+        # Queuing the url for the source. Returns False if the url was already seen or the source is at its limit.
+        url = urldefrag(url)[0]
+        if url in self._seen or self._pages[source] >= self.max_pages:
+            return False
+        self._seen.add(url)
+        self._pages[source] += 1
+        self._queue.append((url, source))
+        return True
+
+    def pop(self):
+        return self._queue.popleft()
+
+    def __len__(self):
+        return len(self._queue)
+
+    def state(self):
+        # The urls we saw and the numbers of pages per source, so the crawl can go on in another task.
+        return {"seen": sorted(self._seen), "pages": dict(self._pages)}
+
+    @classmethod
+    def from_state(cls, state, max_pages=None):
+        frontier = cls(max_pages)
+        frontier._seen.update(state["seen"])
+        frontier._pages.update(state["pages"])
+        return frontier
+
+
+def crawl(engine, frontier, handle_page, request_headers=None, stream=False):
+    """
+    Downloading every page from the frontier with the fetch engine.
+    Only a few pages are in flight at the same time, and each page is handed to 'handle_page' as soon as it is
+    downloaded. 'handle_page(url, source, response, error)' returns the links it found on the page, which are
+    added to the frontier. Nothing is kept after the page is handled, so the memory doesn't grow with the crawl.
+    'request_headers(url)' can return extra headers for the request (e.g. the conditional headers).
+    With 'stream', the responses are handed over before their bodies are downloaded. Every response is closed
+    once it's handled, so a streamed one gives its place in the limit of the host back even if it wasn't read.
+    A url which fails in any way (not only in the download) is logged and skipped, the rest of the crawl goes on.
+    """
+    pending = {}
+    while len(frontier) or pending:
+        while len(frontier) and len(pending) < engine.max_workers:
+            url, source = frontier.pop()
+            headers = request_headers(url) if request_headers else None
+            pending[engine.submit(url, headers, stream)] = (url, source)
+
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            url, source = pending.pop(future)
+            # Any failure of the download (e.g. a malformed url) is handed over as the error of the page.
+            try:
+                response, error = future.result(), None
+            except Exception as e:
+                response, error = None, e
+
+            try:
+                for link in handle_page(url, source, response, error):
+                    frontier.add(link, source)
+            except Exception as e:
+                logger.exception(f"Scraping {url} failed. See the Exception: {e}")
+            finally:
+                # A streamed response holds its place in the limit of the host until it's closed.
+                if response is not None:
+                    response.close()
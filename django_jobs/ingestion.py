@@ -0,0 +1,127 @@
+from collections import namedtuple
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from .companies import get_company_resolver
+from .dates import retention_cutoff
+from .duplicates import assign_clusters, collapse_duplicates
+from .models import Jobs, Company, ArchivedJob
+from .storage import copy_jobs, uses_copy
+
+
+# A single job post extracted by one of the scrapers, before it touches the database.
+JobRecord = namedtuple("JobRecord", ["title", "company", "date", "link"])
+
+# Summary of one ingestion run, so the tasks can report what actually happened.
+IngestionResult = namedtuple("IngestionResult", ["inserted", "duplicates"])
+
+# SQLite limits the number of variables in a single statement, so the lookups are chunked.
+LOOKUP_BATCH_SIZE = 500
+
+
+def _chunks(items, size=LOOKUP_BATCH_SIZE):
+    # Splitting a list into smaller lists of a given size.
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def update_company_stats(company_ids):
+    """
+    Recounting the jobs and the latest job date of the given companies.
+    Only the jobs the company page lists are counted: the duplicates of a job we already have are left out.
+    It's a single UPDATE (per chunk), and it's always exact, even if another worker inserted or removed some
+    of the jobs in the meantime.
+    """
+    jobs = collapse_duplicates(Jobs.objects.filter(company=OuterRef("pk"))).order_by().values("company")
+    for chunk in _chunks(list(company_ids)):
+        Company.objects.filter(id__in=chunk).update(
+            job_count=Coalesce(Subquery(jobs.annotate(total=Count("id")).values("total")), 0),
+            latest_job_date=Subquery(jobs.annotate(latest=Max("date")).values("latest")),
+        )
+
+
+def _save_new_jobs(new_records):
+    # Inserting the new jobs, clustering them and counting them. Returns the records which were inserted.
+    if connection.vendor == "sqlite":
+        # Taking the write lock of the database first (an UPDATE which changes nothing, like BEGIN IMMEDIATE), so
+        # no other connection can insert jobs until we commit. Under WAL, a transaction which read before another
+        # connection committed can't write at all ("database is locked", busy_timeout doesn't help).
+        Jobs.objects.filter(id=0).update(link=F("link"))
+    company_ids = get_company_resolver().resolve({record.company for record in new_records})
+    # The unique constraint on 'link' protects us if another worker inserted the same job in the meantime.
+    if uses_copy(connection):
+        job_ids = copy_jobs(connection, [
+            (record.title, company_ids[record.company], record.date.isoformat(), record.link)
+            for record in new_records
+        ])
+    else:
+        # The links another worker saved since ingest_jobs looked them up are not ours, whatever their ids are.
+        links = [record.link for record in new_records]
+        taken_links = set()
+        for chunk in _chunks(links):
+            taken_links.update(Jobs.objects.filter(link__in=chunk).values_list("link", flat=True))
+        Jobs.objects.bulk_create(
+            [
+                Jobs(title=record.title, company_id=company_ids[record.company], date=record.date, link=record.link)
+                for record in new_records if record.link not in taken_links
+            ],
+            ignore_conflicts=True,
+        )
+        # bulk_create doesn't give us the ids (on SQLite, or with ignore_conflicts), so we read them back.
+        # On SQLite we hold the write lock, so every other link is one we inserted. On the other backends (without
+        # COPY) a job another worker commits during our insert can still be counted here, its link is skipped
+        # by the unique constraint either way.
+        job_ids = {}
+        for chunk in _chunks([link for link in links if link not in taken_links]):
+            job_ids.update(Jobs.objects.filter(link__in=chunk).values_list("link", "id"))
+    # Only the jobs we actually inserted are clustered and counted.
+    inserted = [record for record in new_records if record.link in job_ids]
+    assign_clusters([
+        (job_ids[record.link], record.title, record.company, record.date, record.link) for record in inserted
+    ])
+    update_company_stats({company_ids[record.company] for record in inserted})
+    return inserted
+
+
+def ingest_jobs(records):
+    """
+    Persisting the whole scrape at once instead of doing a few queries for every job post.
+    - Duplicate links inside the scrape itself are dropped;
+    - Links we already have in the database (or in the archive) are skipped;
+    - Companies are resolved by their normalized names (from the cache, or with one query) and created in bulk
+      when missing;
+    - New jobs are inserted with a single bulk statement (or with COPY on PostgreSQL, see django_jobs/storage.py);
+    - New jobs which are the same posting as a job we already have (from another source) join its cluster;
+    - The job counts and latest job dates of the companies are updated.
+    Returns IngestionResult with the number of inserted rows and the number of duplicates. The jobs another worker
+    inserted in the meantime count as duplicates.
+    """
+    # Keeping only the first record for each link.
+    unique_records = {}
+    for record in records:
+        unique_records.setdefault(record.link, record)
+
+    links = list(unique_records)
+    existing_links = set()
+    for chunk in _chunks(links):
+        existing_links.update(Jobs.objects.filter(link__in=chunk).values_list("link", flat=True))
+
+    # The old jobs may be in the archive already. The new ones can't be, so usually there is nothing to look up.
+    cutoff = retention_cutoff()
+    old_links = [link for link, record in unique_records.items() if record.date < cutoff and link not in existing_links]
+    for chunk in _chunks(old_links):
+        existing_links.update(ArchivedJob.objects.filter(link__in=chunk).values_list("link", flat=True))
+
+    new_records = [record for link, record in unique_records.items() if link not in existing_links]
+    if not new_records:
+        return IngestionResult(inserted=0, duplicates=len(records))
+
+    try:
+        with transaction.atomic():
+            inserted = _save_new_jobs(new_records)
+    except IntegrityError:
+        # A company from the cache may have been deleted by another process, whose signals we don't see.
+        get_company_resolver().clear()
+        raise
+
+    return IngestionResult(inserted=len(inserted), duplicates=len(records) - len(inserted))
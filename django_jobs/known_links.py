@@ -0,0 +1,104 @@
+from collections import deque
+from django.conf import settings
+import threading
+from .models import Jobs
+
+
+class KnownLinkIndex:
+    """
+    The links of the most recent jobs we already have from one source.
+    The scrapers check the links here instead of asking the database for every job on the page.
+    Only the last 'max_size' links are kept, the oldest ones are dropped first.
+    'last_id' is the id of the newest job the index has read from the database.
+    """
+
+    def __init__(self, links=(), max_size=None):
+        self.max_size = max_size or settings.SCRAPER_KNOWN_LINKS
+        self.last_id = 0
+        self._links = set()
+        self._order = deque()
+        self.add(links)
+
+    def add(self, links):
+        for link in links:
+            if link in self._links:
+                continue
+            self._links.add(link)
+            self._order.append(link)
+            if len(self._order) > self.max_size:
+                self._links.discard(self._order.popleft())
+
+    def __contains__(self, link):
+        return link in self._links
+
+    def __len__(self):
+        return len(self._links)
+
+    def known_before(self, link):
+        # Without a crawl (see CrawlLinks), every link we know counts toward the early stop.
+        return link in self._links
+
+
+class CrawlLinks:
+    """
+    The known links of a source, as one crawl sees them.
+    The categories of a source overlap, so the new jobs the crawl saved from one category are often listed first
+    in the next one. They are skipped like the other known links, but they don't count toward the early stop:
+    only the links known before the crawl tell us that the rest of the listing is something we already have.
+    'added' are the links the crawl saved so far.
+    """
+
+    def __init__(self, index, added=()):
+        self.index = index
+        self.added = set(added)
+
+    def add(self, links):
+        links = list(links)
+        self.added.update(links)
+        self.index.add(links)
+
+    def __contains__(self, link):
+        return link in self.index or link in self.added
+
+    def known_before(self, link):
+        return link in self.index and link not in self.added
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def load_links(index, spec):
+    # Adding the links of the jobs saved since the index last read the database (the most recent ones, the first time).
+    rows = list(
+        Jobs.objects.filter(link__startswith=spec.link_base, id__gt=index.last_id)
+        .order_by("-id")
+        .values_list("id", "link")[:index.max_size]
+    )
+    if rows:
+        index.last_id = rows[0][0]
+    # Adding the oldest links first, so they are the first ones to be dropped.
+    index.add(link for job_id, link in reversed(rows))
+
+
+def get_known_links(spec, refresh=False):
+    """
+    The index is loaded from the database the first time it's needed, and kept warm in the worker after that.
+    With 'refresh', the jobs other workers saved since then are read as well (a single query on the primary key).
+    A job which is committed with a lower id than one we read already is missed, so its card is parsed again and
+    skipped by the database.
+    """
+    with _indexes_lock:
+        if spec.name not in _indexes:
+            index = KnownLinkIndex()
+            load_links(index, spec)
+            _indexes[spec.name] = index
+        elif refresh:
+            load_links(_indexes[spec.name], spec)
+        return _indexes[spec.name]
+
+
+def reset_known_links():
+    # Forgetting all the indexes, e.g. when the jobs are deleted from the database.
+    with _indexes_lock:
+        _indexes.clear()
@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+import json
+import platform
+import subprocess
+from django_jobs.benchmarks import run_benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures the scrapers offline: parse and persist throughput, queries per job and peak memory, "
+        "using the recorded pages and generated pages of different sizes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes", type=lambda value: [int(size) for size in value.split(",")], default=[10, 1000, 100000],
+            help="Comma separated numbers of job cards for the generated pages (default: 10,1000,100000).",
+        )
+        parser.add_argument("--repeat", type=int, default=3, help="How many times every stage is timed.")
+        parser.add_argument("--output", help="Path of the JSON file the results are written to.")
+
+    def handle(self, *args, **options):
+        results = run_benchmarks(sizes=options["sizes"], repeat=options["repeat"])
+
+        self.stdout.write(
+            f"{'source':<16}{'dataset':<18}{'stage':<9}{'cards':>8}{'seconds':>11}{'cards/s':>12}"
+            f"{'queries/job':>13}{'peak KiB':>11}"
+        )
+        for row in results:
+            self.stdout.write(
+                f"{row['source']:<16}{row['dataset']:<18}{row['stage']:<9}{row['cards']:>8}"
+                f"{row['seconds']:>11.4f}{row['cards_per_second'] or 0:>12.1f}"
+                f"{row['queries_per_job'] or 0:>13.3f}{row['peak_memory_kib']:>11.1f}"
+            )
+
+        if options["output"]:
+            report = {
+                "created": timezone.now().isoformat(),
+                "commit": current_commit(),
+                "python": platform.python_version(),
+                "results": results,
+            }
+            with open(options["output"], "w") as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"The results are written to {options['output']}."))
+
+
+def current_commit():
+    # The commit the benchmarks were run on, so the results from different commits can be compared.
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django_jobs.caching import bump_data_version
+from django_jobs.duplicates import assign_clusters
+from django_jobs.ingestion import update_company_stats
+from django_jobs.models import Jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Adds the jobs which are not in the duplicate index yet (e.g. the jobs saved before the index existed) "
+        "and puts the duplicates into clusters, oldest jobs first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="How many jobs are indexed at a time.")
+
+    def handle(self, *args, **options):
+        indexed = duplicates = 0
+        while True:
+            with transaction.atomic():
+                jobs = list(
+                    Jobs.objects.filter(duplicatebucket__isnull=True)
+                    .order_by("id")
+                    .values_list("id", "title", "company__name", "date", "link", "company_id")[:options["batch_size"]]
+                )
+                if not jobs:
+                    break
+                duplicates += assign_clusters([job[:5] for job in jobs])
+                # The duplicates aren't counted in the company stats.
+                update_company_stats({job[5] for job in jobs})
+                indexed += len(jobs)
+
+        if duplicates:
+            bump_data_version()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} jobs, found {duplicates} duplicates."))
@@ -0,0 +1,89 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+import copy
+import json
+from django_jobs.benchmarks.load import DEFAULT_BUDGETS, check_budgets, run_load_test, seed_dataset
+
+
+def parse_budget(value):
+    # 'homepage:queries=3,p95_ms=100' -> ('homepage', {'queries': 3, 'p95_ms': 100.0})
+    try:
+        name, limits = value.split(":", 1)
+        budget = {}
+        for limit in limits.split(","):
+            key, number = limit.split("=", 1)
+            if key not in ("queries", "p95_ms"):
+                raise ValueError(key)
+            budget[key] = int(number) if key == "queries" else float(number)
+    except ValueError:
+        raise CommandError(f"'{value}' is not a budget, e.g. 'homepage:queries=3,p95_ms=100'.")
+    return name, budget
+
+
+class Command(BaseCommand):
+    help = (
+        "Load tests the web pages on a synthetic dataset: p50/p95/p99 latency, queries per request and response "
+        "size, with concurrent clients. Fails if a page goes over its query or latency budget. "
+        "The data is saved in a separate test database, which is removed at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--companies", type=int, default=100, help="How many companies are generated.")
+        parser.add_argument("--jobs", type=int, default=10000, help="How many jobs are generated.")
+        parser.add_argument("--archived", type=int, default=1000, help="How many archived jobs are generated.")
+        parser.add_argument("--runs", type=int, default=1000, help="How many scraping runs are generated.")
+        parser.add_argument(
+            "--skew", type=float, default=1.0,
+            help="How unevenly the jobs are spread over the companies (0: evenly, 1 and more: a few big companies).",
+        )
+        parser.add_argument("--clients", type=int, default=8, help="How many clients send requests at the same time.")
+        parser.add_argument("--requests", type=int, default=200, help="How many requests are sent for every page.")
+        parser.add_argument(
+            "--page", action="append", choices=sorted(DEFAULT_BUDGETS), dest="pages",
+            help="Only this page. Can be given more than once.",
+        )
+        parser.add_argument("--no-cache", action="store_true", help="Renders every page, without the page cache.")
+        parser.add_argument(
+            "--budget", action="append", type=parse_budget, default=[],
+            help="The budget of a page, instead of the default one, e.g. 'homepage:queries=3,p95_ms=100'.",
+        )
+        parser.add_argument("--output", help="Path of the JSON file the results are written to.")
+
+    def handle(self, *args, **options):
+        budgets = copy.deepcopy(DEFAULT_BUDGETS)
+        for name, budget in options["budget"]:
+            budgets.setdefault(name, {}).update(budget)
+
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            dataset = seed_dataset(
+                companies=options["companies"], jobs=options["jobs"], archived=options["archived"],
+                skew=options["skew"], runs=options["runs"],
+            )
+            results = run_load_test(
+                clients=options["clients"], requests=options["requests"], names=options["pages"],
+                cache=not options["no_cache"],
+            )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.stdout.write(
+            f"{'page':<16}{'requests':>9}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+            f"{'queries':>9}{'max':>5}{'bytes':>10}{'req/s':>9}"
+        )
+        for row in results:
+            self.stdout.write(
+                f"{row['name']:<16}{row['requests']:>9}{row['errors']:>8}{row['p50_ms']:>10.2f}"
+                f"{row['p95_ms']:>10.2f}{row['p99_ms']:>10.2f}{row['queries_mean']:>9.2f}{row['queries_max']:>5}"
+                f"{row['bytes_mean']:>10}{row['requests_per_second'] or 0:>9.1f}"
+            )
+
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump({"dataset": dataset, "budgets": budgets, "results": results}, output, indent=2)
+            self.stdout.write(f"The results are written to {options['output']}.")
+
+        failures = check_budgets(results, budgets)
+        if failures:
+            raise CommandError("Over the budget:\n" + "\n".join(failures))
+        self.stdout.write(self.style.SUCCESS("Every page is within its budget."))
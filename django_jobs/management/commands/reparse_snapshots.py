@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+import datetime
+from django_jobs.caching import bump_data_version
+from django_jobs.sites import SITES
+from django_jobs.snapshots import reparse_snapshots
+
+
+def parse_moment(value):
+    # A date ('2021-04-27') means the start of that day. Times without a timezone are in the current timezone.
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(value)
+        moment = datetime.datetime.combine(day, datetime.time())
+    return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
+
+
+class Command(BaseCommand):
+    help = (
+        "Parses the stored page snapshots again with the current parsers and saves the jobs we don't have yet. "
+        "Nothing is downloaded."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--since", help="Only the pages fetched from this date or time on.")
+        parser.add_argument("--until", help="Only the pages fetched before this date or time.")
+        parser.add_argument(
+            "--source", action="append", choices=sorted(SITES), dest="sources",
+            help="Only the pages from this source. Can be given more than once.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            since = parse_moment(options["since"]) if options["since"] else None
+            until = parse_moment(options["until"]) if options["until"] else None
+        except ValueError as e:
+            raise CommandError(f"'{e}' is not a date (YYYY-MM-DD) or a date and time.")
+
+        pages, result = reparse_snapshots(since=since, until=until, sources=options["sources"])
+        if result.inserted:
+            bump_data_version()
+        self.stdout.write(self.style.SUCCESS(
+            f"Parsed {pages} pages: {result.inserted} new jobs, {result.duplicates} duplicates."
+        ))
@@ -0,0 +1,180 @@
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from django.db import transaction
+from django.db.models import Count, F, Max, Q, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+import json
+import logging
+import time
+from .models import ParseFailureCount, ScrapeRun
+from .throttling import get_rate_limiter
+
+
+logger = logging.getLogger("django_jobs.scraping")
+
+# The counters we keep for every source, in the same order as the ScrapeRun fields.
+COUNTERS = ["pages", "pages_unchanged", "errors", "bytes_downloaded", "cards_found", "inserted", "duplicates"]
+PHASES = ["fetch", "parse", "persist"]
+
+
+def add_parse_failures(source, failures):
+    # Increasing the totals of the source, which every worker may do at the same time.
+    for field, count in failures.items():
+        counter, created = ParseFailureCount.objects.get_or_create(
+            source=source, field=field, defaults={"count": count},
+        )
+        if not created:
+            ParseFailureCount.objects.filter(pk=counter.pk).update(count=F("count") + count)
+
+
+class ScrapeMetrics:
+    """
+    Collecting the numbers of one scraping run, per source.
+    At the end of the run, every source gets a ScrapeRun row and a structured (JSON) log line.
+    """
+
+    def __init__(self):
+        self.started = timezone.now()
+        self.counters = defaultdict(Counter)
+        self.failures = defaultdict(Counter)
+        # The saved ScrapeRun rows, once the run is finished.
+        self.runs = []
+
+    def add(self, source, **values):
+        self.counters[source].update(values)
+
+    def add_failures(self, source, failures):
+        self.failures[source].update(failures)
+
+    @contextmanager
+    def timer(self, source, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.counters[source][f"{phase}_seconds"] += time.perf_counter() - start
+
+    def state(self):
+        # The numbers collected so far as plain JSON, so the run can be carried on by another task.
+        return {
+            "started": self.started.isoformat(),
+            "counters": {source: dict(counters) for source, counters in self.counters.items()},
+            "failures": {source: dict(failures) for source, failures in self.failures.items()},
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        metrics = cls()
+        metrics.started = parse_datetime(state["started"])
+        for source, counters in state["counters"].items():
+            metrics.counters[source].update(counters)
+        for source, failures in state["failures"].items():
+            metrics.failures[source].update(failures)
+        return metrics
+
+    @property
+    def inserted(self):
+        return sum(counters["inserted"] for counters in self.counters.values())
+
+    def save(self):
+        finished = timezone.now()
+        runs = []
+        for source, counters in self.counters.items():
+            run = ScrapeRun(
+                source=source,
+                started=self.started,
+                finished=finished,
+                parse_failures=dict(self.failures[source]),
+                **{name: counters[name] for name in COUNTERS},
+                **{f"{phase}_seconds": round(counters[f"{phase}_seconds"], 6) for phase in PHASES},
+            )
+            runs.append(run)
+            logger.info(json.dumps({
+                "event": "scrape_run",
+                "source": source,
+                "duration_seconds": round((finished - self.started).total_seconds(), 3),
+                **{name: getattr(run, name) for name in COUNTERS},
+                **{f"{phase}_seconds": getattr(run, f"{phase}_seconds") for phase in PHASES},
+                "parse_failures": run.parse_failures,
+            }))
+        with transaction.atomic():
+            ScrapeRun.objects.bulk_create(runs)
+            for run in runs:
+                add_parse_failures(run.source, run.parse_failures)
+        self.runs = runs
+        return runs
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_metrics():
+    """
+    The scraping metrics in the Prometheus text format.
+    - The totals over all the runs are counters;
+    - The numbers from the last run of every source are gauges.
+    """
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            label_text = ",".join(f'{key}="{escape_label(label)}"' for key, label in labels.items())
+            lines.append(f"{name}{{{label_text}}} {value}")
+
+    totals = list(
+        ScrapeRun.objects.values("source")
+        .annotate(
+            runs=Count("id"),
+            latest=Max("started"),
+            **{name: Sum(name) for name in COUNTERS},
+            **{f"{phase}_seconds": Sum(f"{phase}_seconds") for phase in PHASES},
+        )
+        .order_by("source")
+    )
+
+    metric("django_jobs_scrape_runs_total", "counter", "Number of scraping runs.",
+           [({"source": row["source"]}, row["runs"]) for row in totals])
+    for name in COUNTERS:
+        metric(f"django_jobs_scrape_{name}_total", "counter", f"Total {name.replace('_', ' ')} over all runs.",
+               [({"source": row["source"]}, row[name]) for row in totals])
+    metric("django_jobs_scrape_phase_seconds_total", "counter", "Total time spent in each scraping phase.",
+           [({"source": row["source"], "phase": phase}, round(row[f"{phase}_seconds"], 6))
+            for row in totals for phase in PHASES])
+
+    # The last run of every source, in one query (each source and start time is a lookup in the index).
+    last_runs = {}
+    if totals:
+        latest = Q()
+        for row in totals:
+            latest |= Q(source=row["source"], started=row["latest"])
+        for run in ScrapeRun.objects.filter(latest).order_by("source", "-id"):
+            last_runs.setdefault(run.source, run)
+
+    failures = ParseFailureCount.objects.order_by("source", "field").values_list("source", "field", "count")
+    metric("django_jobs_scrape_parse_failures_total", "counter", "Job cards skipped because a field was missing.",
+           [({"source": source, "field": field}, count) for source, field, count in failures])
+    metric("django_jobs_scrape_last_run_timestamp_seconds", "gauge", "When the last run of the source started.",
+           [({"source": source}, run.started.timestamp()) for source, run in sorted(last_runs.items())])
+    metric("django_jobs_scrape_last_run_duration_seconds", "gauge", "How long the last run of the source took.",
+           [({"source": source}, (run.finished - run.started).total_seconds())
+            for source, run in sorted(last_runs.items())])
+    metric("django_jobs_scrape_last_run_phase_seconds", "gauge", "Time spent in each phase during the last run.",
+           [({"source": source, "phase": phase}, getattr(run, f"{phase}_seconds"))
+            for source, run in sorted(last_runs.items()) for phase in PHASES])
+    metric("django_jobs_scrape_last_run_inserted", "gauge", "New jobs from the last run of the source.",
+           [({"source": source}, run.inserted) for source, run in sorted(last_runs.items())])
+
+    # The rate limits of the hosts, right now.
+    limits = get_rate_limiter().status()
+    metric("django_jobs_host_rate", "gauge", "Requests per second the scrapers are allowed to send to the host.",
+           [({"host": limit["host"]}, round(limit["rate"], 6)) for limit in limits])
+    metric("django_jobs_host_wait_seconds", "gauge", "How long a new request to the host would wait for its turn.",
+           [({"host": limit["host"]}, round(limit["wait_seconds"], 6)) for limit in limits])
+    metric("django_jobs_host_blocked", "gauge", "1 if the host asked us to stop for a while (429/503).",
+           [({"host": limit["host"]}, int(limit["blocked"])) for limit in limits])
+
+    return "\n".join(lines) + "\n"
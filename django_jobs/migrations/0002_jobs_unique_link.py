@@ -0,0 +1,29 @@
+from django.db import migrations, models
+
+
+def remove_duplicate_links(apps, schema_editor):
+    # Before adding the unique constraint, we keep only the oldest job for each link.
+    Jobs = apps.get_model('django_jobs', 'Jobs')
+    duplicates = (
+        Jobs.objects.values('link')
+        .annotate(first_id=models.Min('id'), total=models.Count('id'))
+        .filter(total__gt=1)
+    )
+    for duplicate in duplicates:
+        Jobs.objects.filter(link=duplicate['link']).exclude(id=duplicate['first_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_jobs', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_links, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='jobs',
+            name='link',
+            field=models.URLField(unique=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2 on 2026-10-18 16:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_jobs', '0003_pagevalidator'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='jobs',
+            index=models.Index(fields=['-date', '-id'], name='jobs_date_id_idx'),
+        ),
+    ]
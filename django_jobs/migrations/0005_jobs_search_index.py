@@ -0,0 +1,26 @@
+from django.db import migrations
+from ._search_sql import SEARCH_TABLE, drop_search_triggers, install_search_index, rebuild_search_index
+
+
+def create_search_index(apps, schema_editor):
+    # The full-text index is a SQLite virtual table, so it's created with raw SQL (see django_jobs/search.py).
+    install_search_index(schema_editor)
+    rebuild_search_index(schema_editor)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    drop_search_triggers(schema_editor)
+    schema_editor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_jobs', '0004_jobs_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 3.2 on 2026-10-18 16:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_jobs', '0006_dataversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScrapeRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=50)),
+                ('started', models.DateTimeField()),
+                ('finished', models.DateTimeField()),
+                ('pages', models.PositiveIntegerField(default=0)),
+                ('pages_unchanged', models.PositiveIntegerField(default=0)),
+                ('errors', models.PositiveIntegerField(default=0)),
+                ('bytes_downloaded', models.PositiveBigIntegerField(default=0)),
+                ('cards_found', models.PositiveIntegerField(default=0)),
+                ('inserted', models.PositiveIntegerField(default=0)),
+                ('duplicates', models.PositiveIntegerField(default=0)),
+                ('fetch_seconds', models.FloatField(default=0)),
+                ('parse_seconds', models.FloatField(default=0)),
+                ('persist_seconds', models.FloatField(default=0)),
+                ('parse_failures', models.JSONField(default=dict)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='scraperun',
+            index=models.Index(fields=['source', '-started'], name='scraperun_source_started_idx'),
+        ),
+    ]
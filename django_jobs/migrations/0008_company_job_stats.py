@@ -0,0 +1,52 @@
+# Generated by Django 3.2 on 2026-10-18 16:44
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+from . import _search_sql
+
+
+def drop_search_triggers(apps, schema_editor):
+    # The companies table is rebuilt on SQLite, which doesn't work while the search triggers point to it.
+    _search_sql.drop_search_triggers(schema_editor)
+
+
+def install_search_triggers(apps, schema_editor):
+    _search_sql.install_search_index(schema_editor)
+
+
+def fill_company_stats(apps, schema_editor):
+    # Counting the jobs we already have, once. After this, the ingestion keeps the numbers up to date.
+    Company = apps.get_model('django_jobs', 'Company')
+    Jobs = apps.get_model('django_jobs', 'Jobs')
+    jobs = Jobs.objects.filter(company=models.OuterRef('pk')).order_by().values('company')
+    Company.objects.update(
+        job_count=Coalesce(models.Subquery(jobs.annotate(total=models.Count('id')).values('total')), 0),
+        latest_job_date=models.Subquery(jobs.annotate(latest=models.Max('date')).values('latest')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_jobs', '0007_scraperun'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_search_triggers, install_search_triggers),
+        migrations.AddField(
+            model_name='company',
+            name='job_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='company',
+            name='latest_job_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='jobs',
+            index=models.Index(fields=['company', '-date', '-id'], name='jobs_company_date_idx'),
+        ),
+        migrations.RunPython(fill_company_stats, migrations.RunPython.noop),
+        migrations.RunPython(install_search_triggers, drop_search_triggers),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.2 on 2026-10-18 16:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_jobs', '0008_company_job_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=200)),
+                ('company_name', models.CharField(max_length=200)),
+                ('date', models.DateField()),
+                ('link', models.URLField(unique=True)),
+                ('archived', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Archived jobs',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='archivedjob',
+            index=models.Index(fields=['-date', '-id'], name='archivedjob_date_id_idx'),
+        ),
+    ]
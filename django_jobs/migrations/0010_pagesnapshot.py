@@ -0,0 +1,32 @@
+# Generated by Django 3.2 on 2026-10-18 16:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_jobs', '0009_archivedjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PageSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=50)),
+                ('url', models.URLField(max_length=500)),
+                ('content_hash', models.CharField(db_index=True, max_length=64)),
+                ('size', models.PositiveIntegerField(default=0)),
+                ('fetched', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='pagesnapshot',
+            index=models.Index(fields=['source', 'fetched'], name='pagesnapshot_source_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pagesnapshot',
+            index=models.Index(fields=['fetched'], name='pagesnapshot_fetched_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 3.2 on 2026-10-18 16:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+from . import _search_sql
+
+
+def drop_search_triggers(apps, schema_editor):
+    # The jobs table is rebuilt on SQLite, which doesn't work while the search triggers point to it.
+    _search_sql.drop_search_triggers(schema_editor)
+
+
+def install_search_triggers(apps, schema_editor):
+    _search_sql.install_search_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_jobs', '0010_pagesnapshot'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_search_triggers, install_search_triggers),
+        migrations.AddField(
+            model_name='jobs',
+            name='cluster_id',
+            field=models.BigIntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='DuplicateBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.BigIntegerField(db_index=True)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='django_jobs.jobs')),
+            ],
+        ),
+        migrations.RunPython(install_search_triggers, drop_search_triggers),
+    ]
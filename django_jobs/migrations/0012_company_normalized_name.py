@@ -0,0 +1,80 @@
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+import re
+import unicodedata
+from . import _search_sql
+
+
+# A frozen copy of normalize_company from django_jobs/normalization.py. The migration mustn't change when the
+# normalizer does: if the names are normalized differently later, they are normalized again in a new migration.
+COMPANY_SUFFIXES = {'inc', 'llc', 'ltd', 'limited', 'gmbh', 'corp', 'corporation', 'co', 'sa', 'ag', 'bv', 'plc'}
+
+
+def normalize_company(name):
+    text = unicodedata.normalize('NFKD', name or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    parts = re.findall(r'[^\W_]+', text.lower())
+    while len(parts) > 1 and parts[-1] in COMPANY_SUFFIXES:
+        parts.pop()
+    return ' '.join(parts) or (name or '').strip()
+
+
+def drop_search_triggers(apps, schema_editor):
+    # The companies table is rebuilt on SQLite, which doesn't work while the search triggers point to it.
+    _search_sql.drop_search_triggers(schema_editor)
+
+
+def install_search_triggers(apps, schema_editor):
+    # The jobs of the merged companies have to be indexed with their new company name.
+    _search_sql.install_search_index(schema_editor)
+    _search_sql.rebuild_search_index(schema_editor)
+
+
+def merge_companies(apps, schema_editor):
+    # Before adding the unique constraint, the companies with the same normalized name are merged into the oldest one.
+    Company = apps.get_model('django_jobs', 'Company')
+    Jobs = apps.get_model('django_jobs', 'Jobs')
+
+    kept = {}
+    merged = {}
+    for company_id, name in Company.objects.order_by('id').values_list('id', 'name').iterator():
+        key = normalize_company(name)
+        if key in kept:
+            merged.setdefault(kept[key], []).append(company_id)
+        else:
+            kept[key] = company_id
+            Company.objects.filter(id=company_id).update(normalized_name=key)
+
+    for company_id, duplicates in merged.items():
+        Jobs.objects.filter(company_id__in=duplicates).update(company_id=company_id)
+        Company.objects.filter(id__in=duplicates).delete()
+
+    jobs = Jobs.objects.filter(company=models.OuterRef('pk')).order_by().values('company')
+    Company.objects.filter(id__in=list(merged)).update(
+        job_count=Coalesce(models.Subquery(jobs.annotate(total=models.Count('id')).values('total')), 0),
+        latest_job_date=models.Subquery(jobs.annotate(latest=models.Max('date')).values('latest')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_jobs', '0011_job_clusters'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_search_triggers, install_search_triggers),
+        migrations.AddField(
+            model_name='company',
+            name='normalized_name',
+            field=models.CharField(default='', max_length=200),
+            preserve_default=False,
+        ),
+        migrations.RunPython(merge_companies, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='company',
+            name='normalized_name',
+            field=models.CharField(editable=False, max_length=200, unique=True),
+        ),
+        migrations.RunPython(install_search_triggers, drop_search_triggers),
+    ]
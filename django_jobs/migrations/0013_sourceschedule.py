@@ -0,0 +1,30 @@
+# Generated by Django 3.2 on 2026-10-18 16:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_jobs', '0012_company_normalized_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SourceSchedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=50, unique=True)),
+                ('interval', models.PositiveIntegerField(help_text='Seconds between two runs.')),
+                ('next_run', models.DateTimeField()),
+                ('last_run', models.DateTimeField(blank=True, null=True)),
+                ('rate', models.FloatField(default=0)),
+                ('failures', models.PositiveIntegerField(default=0)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='sourceschedule',
+            index=models.Index(fields=['next_run'], name='sourceschedule_next_run_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.2 on 2026-10-18 17:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_jobs', '0013_sourceschedule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HostThrottle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('host', models.CharField(max_length=255, unique=True)),
+                ('tokens', models.FloatField()),
+                ('rate', models.FloatField()),
+                ('updated', models.DateTimeField()),
+                ('blocked_until', models.DateTimeField(blank=True, null=True)),
+                ('crawl_delay', models.FloatField(blank=True, null=True)),
+            ],
+        ),
+    ]
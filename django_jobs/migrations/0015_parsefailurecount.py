@@ -0,0 +1,42 @@
+# Generated by Django 3.2 on 2026-10-18 17:43
+
+from collections import Counter, defaultdict
+from django.db import migrations, models
+
+
+def count_parse_failures(apps, schema_editor):
+    # Adding up the failures of the runs we already have, once. After this, every saved run adds its own.
+    ScrapeRun = apps.get_model('django_jobs', 'ScrapeRun')
+    ParseFailureCount = apps.get_model('django_jobs', 'ParseFailureCount')
+    failures = defaultdict(Counter)
+    runs = ScrapeRun.objects.exclude(parse_failures={}).values_list('source', 'parse_failures')
+    for source, parse_failures in runs.iterator():
+        failures[source].update(parse_failures)
+    ParseFailureCount.objects.bulk_create([
+        ParseFailureCount(source=source, field=field, count=count)
+        for source, counts in failures.items() for field, count in counts.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_jobs', '0014_hostthrottle'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParseFailureCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=50)),
+                ('field', models.CharField(max_length=50)),
+                ('count', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='parsefailurecount',
+            constraint=models.UniqueConstraint(fields=('source', 'field'), name='parsefailurecount_source_field_uniq'),
+        ),
+        migrations.RunPython(count_parse_failures, migrations.RunPython.noop),
+    ]
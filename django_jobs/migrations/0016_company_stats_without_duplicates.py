@@ -0,0 +1,25 @@
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def count_company_stats(apps, schema_editor):
+    # Counting the jobs of every company again, without the duplicates, like the ingestion does from now on.
+    Company = apps.get_model('django_jobs', 'Company')
+    Jobs = apps.get_model('django_jobs', 'Jobs')
+    not_duplicate = models.Q(cluster_id__isnull=True) | models.Q(cluster_id=models.F('id'))
+    jobs = Jobs.objects.filter(not_duplicate, company=models.OuterRef('pk')).order_by().values('company')
+    Company.objects.update(
+        job_count=Coalesce(models.Subquery(jobs.annotate(total=models.Count('id')).values('total')), 0),
+        latest_job_date=models.Subquery(jobs.annotate(latest=models.Max('date')).values('latest')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_jobs', '0015_parsefailurecount'),
+    ]
+
+    operations = [
+        migrations.RunPython(count_company_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,72 @@
+"""
+A frozen copy of the full-text index SQL of django_jobs/search.py, for the migrations.
+The migrations mustn't depend on the search code, which keeps changing after them. If the index or its triggers change,
+the new SQL goes in a new migration and this copy stays as it is.
+The module name starts with an underscore, so the migration loader doesn't take it for a migration.
+"""
+
+SEARCH_TABLE = "django_jobs_jobs_fts"
+
+SEARCH_TRIGGERS = ("insert", "delete", "update", "company_update")
+
+SEARCH_INDEX_SQL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE}
+    USING fts5(title, company, tokenize = 'unicode61 remove_diacritics 2')
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_insert AFTER INSERT ON django_jobs_jobs BEGIN
+        INSERT INTO {SEARCH_TABLE} (rowid, title, company)
+        SELECT new.id, new.title, name FROM django_jobs_company WHERE id = new.company_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_delete AFTER DELETE ON django_jobs_jobs BEGIN
+        DELETE FROM {SEARCH_TABLE} WHERE rowid = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_update AFTER UPDATE OF title, company_id ON django_jobs_jobs BEGIN
+        DELETE FROM {SEARCH_TABLE} WHERE rowid = old.id;
+        INSERT INTO {SEARCH_TABLE} (rowid, title, company)
+        SELECT new.id, new.title, name FROM django_jobs_company WHERE id = new.company_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_company_update AFTER UPDATE OF name ON django_jobs_company BEGIN
+        DELETE FROM {SEARCH_TABLE} WHERE rowid IN (SELECT id FROM django_jobs_jobs WHERE company_id = new.id);
+        INSERT INTO {SEARCH_TABLE} (rowid, title, company)
+        SELECT id, title, new.name FROM django_jobs_jobs WHERE company_id = new.id;
+    END
+    """,
+]
+
+REBUILD_SEARCH_INDEX_SQL = [
+    f"DELETE FROM {SEARCH_TABLE}",
+    f"""
+    INSERT INTO {SEARCH_TABLE} (rowid, title, company)
+    SELECT django_jobs_jobs.id, django_jobs_jobs.title, django_jobs_company.name
+    FROM django_jobs_jobs JOIN django_jobs_company ON django_jobs_company.id = django_jobs_jobs.company_id
+    """,
+]
+
+
+def install_search_index(schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for statement in SEARCH_INDEX_SQL:
+        schema_editor.execute(statement)
+
+
+def drop_search_triggers(schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for trigger in SEARCH_TRIGGERS:
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_{trigger}")
+
+
+def rebuild_search_index(schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for statement in REBUILD_SEARCH_INDEX_SQL:
+        schema_editor.execute(statement)
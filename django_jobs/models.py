@@ -1,10 +1,17 @@
+from django.core.exceptions import ValidationError
 from django.db import models
 from datetime import date
+from .normalization import normalize_company
 
 
 class Company(models.Model):
     """The short model for Company."""
     name = models.CharField(max_length=200)
+    # The name without case, punctuation and legal forms ('Acme, Inc.' -> 'acme'), so every company is saved once.
+    normalized_name = models.CharField(max_length=200, unique=True, editable=False)
+    # Kept up to date by the ingestion, so the pages never have to count the jobs of a company.
+    job_count = models.PositiveIntegerField(default=0)
+    latest_job_date = models.DateField(null=True, blank=True)
 
     class Meta:
         verbose_name_plural = "Companies"
@@ -12,19 +19,227 @@ class Company(models.Model):
     def __str__(self):
         return self.name
 
+    def clean(self):
+        self.normalized_name = normalize_company(self.name)
+
+    def validate_unique(self, exclude=None):
+        # The normalized name isn't on the forms (e.g. in the admin), so its uniqueness is checked with the name.
+        super().validate_unique(exclude)
+        if exclude and "name" in exclude:
+            return
+        existing = (
+            Company.objects.filter(normalized_name=normalize_company(self.name)).exclude(pk=self.pk)
+            .values_list("name", flat=True).first()
+        )
+        if existing is not None:
+            raise ValidationError({"name": f"This is the same company as '{existing}'."})
+
+    def save(self, *args, **kwargs):
+        self.normalized_name = normalize_company(self.name)
+        super().save(*args, **kwargs)
+
 
 class Jobs(models.Model):
     """The Model which contains data about the job."""
     title = models.CharField(max_length=200)
     company = models.ForeignKey(Company, on_delete=models.CASCADE)
     date = models.DateField(default=date.today)
-    link = models.URLField()
+    link = models.URLField(unique=True)
+    # The id of the first job of the same posting seen on another source.
+    # Empty for the jobs which are not duplicates, so the listings show only the jobs with an empty cluster.
+    cluster_id = models.BigIntegerField(null=True, blank=True, db_index=True)
 
     class Meta:
         verbose_name_plural = "Jobs"
+        indexes = [
+            # Used by the homepage, which lists the jobs newest first and paginates on (date, id).
+            models.Index(fields=["-date", "-id"], name="jobs_date_id_idx"),
+            # Used by the company page, which lists the jobs of one company newest first.
+            models.Index(fields=["company", "-date", "-id"], name="jobs_company_date_idx"),
+        ]
 
     def __str__(self):
         return self.title
 
 
+class DuplicateBucket(models.Model):
+    """
+    The locality-sensitive hashing (LSH) index of the jobs: one row for every band of a job's MinHash signature.
+    Jobs which share a bucket are likely to be the same posting (see django_jobs/duplicates.py).
+    """
+    job = models.ForeignKey(Jobs, on_delete=models.CASCADE)
+    key = models.BigIntegerField(db_index=True)
+
+    def __str__(self):
+        return f"{self.job_id}: {self.key}"
+
+
+class PageValidator(models.Model):
+    """The HTTP validators and the content hash of the last version we scraped from a page."""
+    url = models.URLField(max_length=500, unique=True)
+    etag = models.CharField(max_length=200, blank=True)
+    last_modified = models.CharField(max_length=100, blank=True)
+    content_hash = models.CharField(max_length=64, blank=True)
+    updated = models.DateTimeField(auto_now=True)
 
+    def __str__(self):
+        return self.url
+
+    def conditional_headers(self):
+        # The headers which allow the website to answer with '304 Not Modified' if the page didn't change.
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class DataVersion(models.Model):
+    """
+    A counter which goes up every time the scrapers add new jobs.
+    The cached pages are keyed on it, so they are invalidated right after a scrape.
+    """
+    version = models.PositiveIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Version {self.version}"
+
+
+class ScrapeRun(models.Model):
+    """
+    The numbers from one scraping run of one source: how long each phase took and what we got out of it.
+    The seconds are the sum over all the pages, so the fetch time can be longer than the run itself.
+    """
+    source = models.CharField(max_length=50)
+    started = models.DateTimeField()
+    finished = models.DateTimeField()
+    pages = models.PositiveIntegerField(default=0)
+    pages_unchanged = models.PositiveIntegerField(default=0)
+    errors = models.PositiveIntegerField(default=0)
+    bytes_downloaded = models.PositiveBigIntegerField(default=0)
+    cards_found = models.PositiveIntegerField(default=0)
+    inserted = models.PositiveIntegerField(default=0)
+    duplicates = models.PositiveIntegerField(default=0)
+    fetch_seconds = models.FloatField(default=0)
+    parse_seconds = models.FloatField(default=0)
+    persist_seconds = models.FloatField(default=0)
+    # The number of job cards which were skipped because a field was missing, per field.
+    parse_failures = models.JSONField(default=dict)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["source", "-started"], name="scraperun_source_started_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.source} ({self.started:%Y-%m-%d %H:%M})"
+
+
+class ParseFailureCount(models.Model):
+    """
+    The number of job cards skipped because a field was missing, per source and field, over all the runs.
+    It's increased when a run is saved, so the metrics don't have to add up the failures of every ScrapeRun.
+    """
+    source = models.CharField(max_length=50)
+    field = models.CharField(max_length=50)
+    count = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["source", "field"], name="parsefailurecount_source_field_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.source}: {self.field} ({self.count})"
+
+
+class ArchivedJob(models.Model):
+    """
+    A job post which was moved out of the Jobs table because it's too old.
+    The cold table has no foreign keys and no full-text index, so it stays cheap to write and never slows down
+    the pages. The company is kept by name.
+    """
+    title = models.CharField(max_length=200)
+    company_name = models.CharField(max_length=200)
+    date = models.DateField()
+    link = models.URLField(unique=True)
+    archived = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name_plural = "Archived jobs"
+        indexes = [
+            models.Index(fields=["-date", "-id"], name="archivedjob_date_id_idx"),
+        ]
+
+    def __str__(self):
+        return self.title
+
+
+class PageSnapshot(models.Model):
+    """
+    One fetch of one page. The page itself is stored compressed on the disk, named after its content hash
+    (see django_jobs/snapshots.py), so the same page fetched many times is stored only once.
+    """
+    source = models.CharField(max_length=50)
+    url = models.URLField(max_length=500)
+    content_hash = models.CharField(max_length=64, db_index=True)
+    size = models.PositiveIntegerField(default=0)
+    fetched = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["source", "fetched"], name="pagesnapshot_source_idx"),
+            models.Index(fields=["fetched"], name="pagesnapshot_fetched_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.url} ({self.fetched:%Y-%m-%d %H:%M})"
+
+
+class SourceSchedule(models.Model):
+    """
+    When a source is scraped next, and what the scheduler learned about it so far.
+    The interval gets shorter for the sources which post a lot of jobs and longer for the quiet or failing ones
+    (see django_jobs/scheduling.py). It's saved after every run, so a restart doesn't lose anything.
+    """
+    source = models.CharField(max_length=50, unique=True)
+    interval = models.PositiveIntegerField(help_text="Seconds between two runs.")
+    next_run = models.DateTimeField()
+    last_run = models.DateTimeField(null=True, blank=True)
+    # New jobs per hour, a moving average over the last runs.
+    rate = models.FloatField(default=0)
+    # Failed runs in a row.
+    failures = models.PositiveIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["next_run"], name="sourceschedule_next_run_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.source} (next run {self.next_run:%Y-%m-%d %H:%M})"
+
+
+class HostThrottle(models.Model):
+    """
+    The token bucket of one host, shared by all the workers which download from it.
+    Every request takes a token, and the tokens come back at 'rate' per second, up to a small burst.
+    The rate goes up slowly while the host answers normally and is halved when it tells us to slow down
+    (see django_jobs/throttling.py).
+    """
+    host = models.CharField(max_length=255, unique=True)
+    # Can be negative: the requests which are already waiting for their turn.
+    tokens = models.FloatField()
+    # Requests per second.
+    rate = models.FloatField()
+    updated = models.DateTimeField()
+    # Set when the host answered with '429 Too Many Requests' or '503 Service Unavailable'.
+    blocked_until = models.DateTimeField(null=True, blank=True)
+    # From robots.txt, in seconds.
+    crawl_delay = models.FloatField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.host} ({self.rate:.2f} requests/s)"
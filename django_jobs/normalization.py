@@ -0,0 +1,31 @@
+import re
+import unicodedata
+
+
+# The words which tell nothing about the job itself, every source adds them in its own way.
+TITLE_NOISE = {"remote", "anywhere", "worldwide", "m", "f", "d", "w"}
+TITLE_SYNONYMS = {"sr": "senior", "jr": "junior", "dev": "developer", "eng": "engineer", "mgr": "manager"}
+
+# The legal forms of the companies, which some sources show and some don't.
+COMPANY_SUFFIXES = {"inc", "llc", "ltd", "limited", "gmbh", "corp", "corporation", "co", "sa", "ag", "bv", "plc"}
+
+
+def words(text):
+    # Lowercase words without accents and punctuation. Letters of other scripts are kept as they are.
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return re.findall(r"[^\W_]+", text.lower())
+
+
+def normalize_title(title):
+    # 'Sr. Python Dev (Remote)' -> 'senior python developer'
+    return " ".join(TITLE_SYNONYMS.get(word, word) for word in words(title) if word not in TITLE_NOISE)
+
+
+def normalize_company(name):
+    # 'Acme, Inc.' -> 'acme'. A name without any letters or digits ('???', '+++') is kept as it is, so such
+    # companies don't all end up with the same empty key.
+    parts = words(name)
+    while len(parts) > 1 and parts[-1] in COMPANY_SUFFIXES:
+        parts.pop()
+    return " ".join(parts) or (name or "").strip()
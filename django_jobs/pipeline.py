@@ -0,0 +1,282 @@
+"""
+Scraping split into three stages, so every kind of work runs on the workers which are good at it:
+- fetch: downloading a page. It's waiting on the network, so it runs on a thread pool with many slots;
+- parse: extracting the jobs and the pagination links from the page. It's CPU work, so it runs on prefork workers;
+- persist: saving the jobs of many pages in one transaction. It runs on a single worker, so SQLite has one writer.
+The pages are crawled in waves: the first pages of all the categories, then the pages they link to and so on.
+Every page of a wave is fetched and parsed on its own, and the persist stage runs once the whole wave is parsed.
+It saves the wave and plans the next one (see the tasks in django_jobs/tasks.py).
+The fetch and parse stages don't save anything but the rate limits of the hosts, and everything the stages pass on
+is plain JSON.
+The raw page goes from the fetch to the parse workers through the snapshot directory (or inside the message,
+when the snapshots are disabled), so both kinds of workers have to see the same SCRAPER_SNAPSHOT_DIR.
+"""
+from collections import defaultdict
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+import base64
+import datetime
+import hashlib
+import logging
+import requests
+import time
+from .caching import bump_data_version
+from .companies import get_company_resolver
+from .fetching import get_fetch_engine
+from .frontier import CrawlFrontier
+from .ingestion import JobRecord, ingest_jobs
+from .known_links import CrawlLinks, get_known_links
+from .metrics import ScrapeMetrics
+from .models import PageSnapshot, PageValidator
+from .scheduling import record_runs
+from .sites import SITES, ParseResult
+from .snapshots import iter_snapshot, snapshots_enabled, write_snapshot
+
+
+logger = logging.getLogger("django_jobs.scraping")
+
+
+def plan_wave(frontier, crawl_links=None):
+    """
+    Taking all the pages queued in the frontier, with the validators from the last run.
+    The fetch workers get everything they need in the page itself, so they don't have to ask the database.
+    'crawl_links' are the links the crawl saved so far, by source (see CrawlLinks).
+    """
+    pages = []
+    while len(frontier):
+        pages.append(frontier.pop())
+    validators = {
+        validator.url: validator
+        for validator in PageValidator.objects.filter(url__in=[url for url, source in pages])
+    }
+    wave = []
+    for url, source in pages:
+        validator = validators.get(url)
+        wave.append({
+            "url": url,
+            "source": source,
+            "headers": validator.conditional_headers() if validator else {},
+            "known_hash": validator.content_hash if validator else "",
+            "crawl_links": (crawl_links or {}).get(source, []),
+        })
+    return wave
+
+
+def start_crawl(names, scheduled=False):
+    """
+    The first wave of pages of the given sources, and the state of the crawl which goes along with the waves.
+    If 'scheduled' is True, the scheduler learns from the run once it's finished.
+    """
+    frontier = CrawlFrontier()
+    for name in names:
+        for url in SITES[name].seeds:
+            frontier.add(url, name)
+    wave = plan_wave(frontier)
+    crawl = {"scheduled": scheduled, "frontier": frontier.state(), "metrics": ScrapeMetrics().state(), "links": {}}
+    return wave, crawl
+
+
+def fetch_page(page, engine=None):
+    """
+    Downloading a page of the wave.
+    The page is kept as a snapshot, and if its content hash is the same as the last time, it isn't parsed at all.
+    """
+    url, label = page["url"], SITES[page["source"]].label
+    try:
+        response = (engine or get_fetch_engine()).fetch(url, page["headers"])
+    except requests.RequestException as e:
+        logger.warning(f"Fetching from '{label}' failed ({url}). See the Exception: {e}")
+        return dict(page, error=str(e))
+
+    fetched = dict(
+        page,
+        status=response.status_code,
+        fetch_seconds=getattr(response, "fetch_seconds", 0),
+        size=len(response.content),
+        fetched=timezone.now().isoformat(),
+        etag=response.headers.get("ETag", ""),
+        last_modified=response.headers.get("Last-Modified", ""),
+    )
+    if response.status_code == 304 or response.status_code >= 400:
+        return fetched
+
+    content_hash = hashlib.sha256(response.content).hexdigest()
+    fetched.update(content_hash=content_hash, snapshot=False, unchanged=content_hash == page["known_hash"])
+    if snapshots_enabled():
+        try:
+            write_snapshot(response.content, content_hash)
+            fetched["snapshot"] = True
+        except OSError as e:
+            logger.warning(f"Saving the snapshot of {url} failed. See the Exception: {e}")
+    if not fetched["unchanged"] and not fetched["snapshot"]:
+        fetched["content"] = base64.b64encode(response.content).decode("ascii")
+    return fetched
+
+
+def failed_page(page, error):
+    # A page which failed in the fetch or the parse stage. The persist stage counts it as an error.
+    return dict({key: value for key, value in page.items() if key != "content"}, error=str(error))
+
+
+def needs_parsing(page):
+    return "status" in page and page["status"] < 300 and not page["unchanged"]
+
+
+def parse_page(page):
+    """
+    Extracting the jobs and the pagination links from a downloaded page.
+    The jobs we saw recently are skipped, and the parsing stops once we reach the jobs we already have.
+    """
+    if not needs_parsing(page):
+        return page
+    page = dict(page)
+    content = page.pop("content", None)
+    spec = SITES[page["source"]]
+    start = time.perf_counter()
+    try:
+        # The index learns the links from the database, once the persist stage saved them. The jobs of a page
+        # which failed to be saved are not skipped when the page is parsed again.
+        known = CrawlLinks(get_known_links(spec, refresh=True), page["crawl_links"])
+        if content is not None:
+            parsed = spec.parse(
+                base64.b64decode(content), page["url"], known=known, stop_after=settings.SCRAPER_EARLY_STOP,
+            )
+        else:
+            # The snapshot is parsed while it's read, so the page is never in memory as a whole, and the rest of
+            # the file isn't even read once the parsing stops early.
+            chunks = iter_snapshot(page["content_hash"])
+            try:
+                stream = spec.stream(chunks, page["url"], known=known, stop_after=settings.SCRAPER_EARLY_STOP)
+                parsed = ParseResult(list(stream), stream.links, stream.failures, stream.skipped, stream.stopped)
+            finally:
+                chunks.close()
+    except Exception as e:
+        logger.exception(f"Parsing the page from '{spec.label}' ({page['url']}) failed. See the Exception: {e}")
+        return dict(page, error=str(e))
+    return dict(
+        page,
+        records=[[record.title, record.company, record.date.isoformat(), record.link] for record in parsed.records],
+        links=parsed.links,
+        failures=dict(parsed.failures),
+        skipped=parsed.skipped,
+        parse_seconds=time.perf_counter() - start,
+    )
+
+
+def count_page(page, metrics):
+    """
+    Adding the numbers of a fetched (and maybe parsed) page to the metrics.
+    Returns True if the page has jobs to save.
+    """
+    name, url, label = page["source"], page["url"], SITES[page["source"]].label
+    metrics.add(name, pages=1)
+    if page.get("error"):
+        metrics.add(name, errors=1)
+        return False
+
+    metrics.add(name, fetch_seconds=page["fetch_seconds"], bytes_downloaded=page["size"])
+    if page["status"] == 304 or page.get("unchanged"):
+        metrics.add(name, pages_unchanged=1)
+        return False
+    if page["status"] >= 400:
+        metrics.add(name, errors=1)
+        logger.warning(f"Fetching from '{label}' failed ({url}). The website answered with {page['status']}.")
+        return False
+
+    metrics.add(name, parse_seconds=page["parse_seconds"])
+    metrics.add_failures(name, page["failures"])
+    return True
+
+
+def save_wave(pages, metrics):
+    """
+    Saving the jobs, the validators and the snapshots of all the pages in one transaction.
+    Returns the saved pages and the number of new jobs.
+    """
+    parsed = [page for page in pages if count_page(page, metrics)]
+    records = defaultdict(list)
+    for page in parsed:
+        records[page["source"]].extend(
+            JobRecord(title, company, datetime.date.fromisoformat(date), link)
+            for title, company, date, link in page["records"]
+        )
+
+    results = {}
+    try:
+        with transaction.atomic():
+            # One ingestion per source, so every source gets its own numbers.
+            for name, source_records in records.items():
+                with metrics.timer(name, "persist"):
+                    results[name] = ingest_jobs(source_records)
+
+            # The validators are saved only together with the jobs, so a failed page is scraped again next time.
+            validators = {
+                validator.url: validator
+                for validator in PageValidator.objects.filter(url__in=[page["url"] for page in parsed])
+            }
+            for page in parsed:
+                validator = validators.get(page["url"]) or PageValidator(url=page["url"])
+                validator.etag = page["etag"]
+                validator.last_modified = page["last_modified"]
+                validator.content_hash = page["content_hash"]
+                validator.save()
+
+            PageSnapshot.objects.bulk_create([
+                PageSnapshot(source=page["source"], url=page["url"], content_hash=page["content_hash"],
+                             size=page["size"], fetched=parse_datetime(page["fetched"]))
+                for page in pages if page.get("snapshot")
+            ])
+    except Exception as e:
+        if isinstance(e, IntegrityError):
+            # The foreign keys are checked when this transaction commits, so ingest_jobs can't see a company
+            # from the cache which another process deleted. It's looked up again next time.
+            get_company_resolver().clear()
+        for page in parsed:
+            metrics.add(page["source"], errors=1)
+        logger.exception(f"Saving {len(pages)} scraped pages failed. See the Exception: {e}")
+        return [], 0
+
+    for page in parsed:
+        name = page["source"]
+        metrics.add(
+            name,
+            cards_found=len(page["records"]) + page["skipped"] + sum(page["failures"].values()),
+            duplicates=page["skipped"],
+        )
+    for name, result in results.items():
+        metrics.add(name, inserted=result.inserted, duplicates=result.duplicates)
+        logger.info(
+            f"Scraping from '{SITES[name].label}' saved: {result.inserted} new jobs, "
+            f"{result.duplicates} duplicates."
+        )
+    return parsed, sum(result.inserted for result in results.values())
+
+
+def persist_pages(pages, crawl):
+    """
+    Saving a parsed wave and planning the next one from the pagination links of the saved pages.
+    Returns the next wave and the new state of the crawl. When there is nothing left to crawl, the run is finished:
+    the metrics are saved, and the scheduler learns from the run if it was a scheduled one.
+    """
+    metrics = ScrapeMetrics.from_state(crawl["metrics"])
+    saved, inserted = save_wave(pages, metrics)
+    # The cached pages are invalidated after every wave which added something, not only at the end of the crawl.
+    if inserted:
+        bump_data_version()
+
+    frontier = CrawlFrontier.from_state(crawl["frontier"])
+    crawl_links = {name: list(links) for name, links in crawl["links"].items()}
+    for page in saved:
+        for link in page["links"]:
+            frontier.add(link, page["source"])
+        crawl_links.setdefault(page["source"], []).extend(record[3] for record in page["records"])
+    wave = plan_wave(frontier, crawl_links)
+    crawl = dict(crawl, frontier=frontier.state(), metrics=metrics.state(), links=crawl_links)
+
+    if not wave:
+        runs = metrics.save()
+        if crawl["scheduled"]:
+            record_runs(runs)
+    return wave, crawl
@@ -0,0 +1,84 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+import logging
+from .caching import bump_data_version
+from .dates import retention_cutoff
+from .duplicates import promote_canonicals
+from .ingestion import update_company_stats
+from .models import Jobs, ArchivedJob
+
+
+logger = logging.getLogger("django_jobs.retention")
+
+
+def archive_batch(cutoff, batch_size):
+    """
+    Moving up to 'batch_size' of the oldest jobs into the archive, in one short transaction.
+    Returns the number of archived jobs.
+    """
+    with transaction.atomic():
+        jobs = list(
+            Jobs.objects.filter(date__lt=cutoff)
+            .order_by("date", "id")
+            .values_list("id", "title", "company_id", "company__name", "date", "link")[:batch_size]
+        )
+        if not jobs:
+            return 0
+        # A link can only be archived once, so running the same batch again (e.g. after a crash) is harmless.
+        ArchivedJob.objects.bulk_create(
+            [
+                ArchivedJob(title=title, company_name=company_name, date=date, link=link)
+                for _, title, _, company_name, date, link in jobs
+            ],
+            ignore_conflicts=True,
+        )
+        job_ids = [job[0] for job in jobs]
+        Jobs.objects.filter(id__in=job_ids).delete()
+        # The duplicates of the archived jobs which are still recent enough are listed instead of them.
+        promoted = promote_canonicals(job_ids)
+        update_company_stats({job[2] for job in jobs} | promoted)
+    return len(jobs)
+
+
+def archive_old_jobs(cutoff=None, batch_size=None):
+    """
+    Moving all the jobs older than the retention period from the Jobs table into the archive.
+    Every batch is its own transaction, so the database is never locked for long and the scrapers can write
+    in between (SQLite allows only one writer at a time).
+    Returns the number of archived jobs.
+    """
+    cutoff = cutoff or retention_cutoff()
+    batch_size = batch_size or settings.JOBS_ARCHIVE_BATCH_SIZE
+    archived = 0
+    while True:
+        count = archive_batch(cutoff, batch_size)
+        archived += count
+        if count < batch_size:
+            break
+
+    if archived:
+        # The cached pages still show the archived jobs.
+        bump_data_version()
+    logger.info(f"Archived {archived} jobs posted before {cutoff}.")
+    return archived
+
+
+def search_archive(query=None, company=None, since=None, until=None):
+    """
+    Looking up the archived jobs. This is the slow path: there is no full-text index here, the words are matched
+    with LIKE against the titles and the company names.
+    - query: words which all have to be in the title or the company name;
+    - company: (a part of) the company name;
+    - since / until: the range of the posting dates.
+    """
+    queryset = ArchivedJob.objects.order_by("-date", "-id")
+    for term in (query or "").split():
+        queryset = queryset.filter(Q(title__icontains=term) | Q(company_name__icontains=term))
+    if company:
+        queryset = queryset.filter(company_name__icontains=company)
+    if since:
+        queryset = queryset.filter(date__gte=since)
+    if until:
+        queryset = queryset.filter(date__lte=until)
+    return queryset
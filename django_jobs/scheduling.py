@@ -0,0 +1,104 @@
+"""
+The adaptive scheduler of the scrapers.
+Every source has its own interval. After every run we know how many new jobs the source got since the last run,
+so we keep a moving average of its posting rate (new jobs per hour) and pick the interval which should give us
+about SCRAPER_TARGET_NEW_JOBS new jobs per run, within SCRAPER_MIN_INTERVAL and SCRAPER_MAX_INTERVAL.
+The interval changes at most twice (or half) per run, so a single odd run doesn't throw it off. Runs which
+bring nothing new, or fail completely, make the interval longer (the failures double it every time).
+"""
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+import datetime
+from .models import SourceSchedule
+from .sites import SITES
+
+
+# How much the last run counts in the moving average of the posting rate.
+RATE_SMOOTHING = 0.3
+
+
+def clamp(interval):
+    return int(min(max(interval, settings.SCRAPER_MIN_INTERVAL), settings.SCRAPER_MAX_INTERVAL))
+
+
+def get_schedules(now=None):
+    # The schedules of all the sources. A new source is due right away.
+    now = now or timezone.now()
+    schedules = {schedule.source: schedule for schedule in SourceSchedule.objects.all()}
+    missing = [name for name in SITES if name not in schedules]
+    if missing:
+        SourceSchedule.objects.bulk_create(
+            [SourceSchedule(source=name, interval=clamp(settings.SCRAPER_DEFAULT_INTERVAL), next_run=now)
+             for name in missing],
+            ignore_conflicts=True,
+        )
+        schedules = {schedule.source: schedule for schedule in SourceSchedule.objects.all()}
+    return schedules
+
+
+def claim_due_sources(now=None):
+    """
+    Returns the names of the sources which are due, in the order they became due.
+    Their next run is moved one interval ahead right away, so the next check doesn't start the same sources
+    again while they are still being scraped. The real next run is set when the run is finished.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        get_schedules(now)
+        due = list(
+            SourceSchedule.objects.select_for_update()
+            .filter(next_run__lte=now, source__in=list(SITES))
+            .order_by("next_run")
+        )
+        for schedule in due:
+            schedule.next_run = now + datetime.timedelta(seconds=schedule.interval)
+            schedule.save(update_fields=["next_run", "updated"])
+    return [schedule.source for schedule in due]
+
+
+def next_interval(schedule, inserted, failed, hours):
+    """
+    The new interval of the source after a run, and its new posting rate.
+    - inserted: the number of new jobs the run got;
+    - failed: True if not a single page could be downloaded;
+    - hours: the time since the last run.
+    """
+    if failed:
+        # Backing off: the website is down or it's blocking us, asking more often won't help.
+        return clamp(schedule.interval * 2), schedule.rate
+
+    rate = inserted / max(hours, 1 / 60)
+    if schedule.last_run is not None:
+        rate = RATE_SMOOTHING * rate + (1 - RATE_SMOOTHING) * schedule.rate
+    ideal = settings.SCRAPER_TARGET_NEW_JOBS / rate * 3600 if rate else settings.SCRAPER_MAX_INTERVAL
+    interval = min(max(ideal, schedule.interval / 2), schedule.interval * 2)
+    if not inserted:
+        # Nothing new: the interval gets longer, even if the average still says it's a busy source.
+        interval = max(interval, schedule.interval * 1.5)
+    return clamp(interval), rate
+
+
+def record_runs(runs):
+    """
+    Learning from the finished runs (ScrapeRun rows) and setting the next run of their sources.
+    Returns the updated schedules.
+    """
+    schedules = get_schedules()
+    updated = []
+    for run in runs:
+        schedule = schedules.get(run.source)
+        if schedule is None:
+            continue
+        failed = run.pages > 0 and run.errors >= run.pages
+        last_run = schedule.last_run or run.started - datetime.timedelta(seconds=schedule.interval)
+        hours = (run.started - last_run).total_seconds() / 3600
+        schedule.interval, schedule.rate = next_interval(schedule, run.inserted, failed, hours)
+        schedule.failures = schedule.failures + 1 if failed else 0
+        if not failed:
+            # The failed runs didn't see anything, the next run will count the jobs since the last good one.
+            schedule.last_run = run.started
+        schedule.next_run = run.finished + datetime.timedelta(seconds=schedule.interval)
+        schedule.save()
+        updated.append(schedule)
+    return updated
@@ -0,0 +1,128 @@
+from django.db import connection
+from django.db.models import Q
+import re
+from .duplicates import collapse_duplicates
+from .models import Jobs
+
+
+# The full-text index of job titles and company names (SQLite FTS5). The rowid of each entry is the id of the job.
+SEARCH_TABLE = "django_jobs_jobs_fts"
+
+# The index is kept in sync by triggers, so every write path (the scrapers' bulk inserts, the admin...) updates it.
+SEARCH_INDEX_SQL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE}
+    USING fts5(title, company, tokenize = 'unicode61 remove_diacritics 2')
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_insert AFTER INSERT ON django_jobs_jobs BEGIN
+        INSERT INTO {SEARCH_TABLE} (rowid, title, company)
+        SELECT new.id, new.title, name FROM django_jobs_company WHERE id = new.company_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_delete AFTER DELETE ON django_jobs_jobs BEGIN
+        DELETE FROM {SEARCH_TABLE} WHERE rowid = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_update AFTER UPDATE OF title, company_id ON django_jobs_jobs BEGIN
+        DELETE FROM {SEARCH_TABLE} WHERE rowid = old.id;
+        INSERT INTO {SEARCH_TABLE} (rowid, title, company)
+        SELECT new.id, new.title, name FROM django_jobs_company WHERE id = new.company_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_company_update AFTER UPDATE OF name ON django_jobs_company BEGIN
+        DELETE FROM {SEARCH_TABLE} WHERE rowid IN (SELECT id FROM django_jobs_jobs WHERE company_id = new.id);
+        INSERT INTO {SEARCH_TABLE} (rowid, title, company)
+        SELECT id, title, new.name FROM django_jobs_jobs WHERE company_id = new.id;
+    END
+    """,
+]
+
+
+def has_search_index(using=connection):
+    return using.vendor == "sqlite"
+
+
+def install_search_index(using=connection):
+    """
+    Creating the full-text index and the triggers which keep it in sync.
+    It's safe to call it more than once. SQLite drops the triggers when Django rebuilds a table during a migration,
+    so this is called after every migration as well.
+    """
+    if not has_search_index(using):
+        return
+    with using.cursor() as cursor:
+        for statement in SEARCH_INDEX_SQL:
+            cursor.execute(statement)
+
+
+def drop_search_triggers(using=connection):
+    """
+    Dropping the triggers (the index itself stays).
+    A migration which rebuilds the jobs or the companies table on SQLite has to do this first: the triggers refer
+    to both tables, and SQLite refuses to rename the rebuilt table while a trigger points to a missing one.
+    """
+    if not has_search_index(using):
+        return
+    with using.cursor() as cursor:
+        for trigger in ("insert", "delete", "update", "company_update"):
+            cursor.execute(f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_{trigger}")
+
+
+def rebuild_search_index(using=connection):
+    # Indexing all the jobs from scratch.
+    if not has_search_index(using):
+        return
+    with using.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        cursor.execute(
+            f"""
+            INSERT INTO {SEARCH_TABLE} (rowid, title, company)
+            SELECT django_jobs_jobs.id, django_jobs_jobs.title, django_jobs_company.name
+            FROM django_jobs_jobs JOIN django_jobs_company ON django_jobs_company.id = django_jobs_jobs.company_id
+            """
+        )
+
+
+def search_terms(query):
+    # Splitting the user's input into words. Punctuation is dropped, so it can't break the FTS query syntax.
+    return re.findall(r"\w+", query or "")
+
+
+def search_jobs(query, offset=0, limit=50):
+    """
+    Searching for the jobs whose title or company name contain all the words from the query.
+    Every word is treated as a prefix ('dev' finds 'developer'). The results are ranked, best matches first,
+    and the same job from different sources is shown once.
+    On databases without the full-text index, we fall back to a (slow) LIKE search.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return []
+
+    if not has_search_index():
+        condition = Q()
+        for term in terms:
+            condition &= Q(title__icontains=term) | Q(company__name__icontains=term)
+        queryset = collapse_duplicates(Jobs.objects.filter(condition)).select_related("company")
+        return list(queryset.order_by("-date", "-id")[offset:offset + limit])
+
+    match = " ".join(f'"{term}"*' for term in terms)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT {SEARCH_TABLE}.rowid FROM {SEARCH_TABLE}
+            JOIN django_jobs_jobs ON django_jobs_jobs.id = {SEARCH_TABLE}.rowid
+            WHERE {SEARCH_TABLE} MATCH %s
+            AND (django_jobs_jobs.cluster_id IS NULL OR django_jobs_jobs.cluster_id = django_jobs_jobs.id)
+            ORDER BY bm25({SEARCH_TABLE}, 2.0, 1.0), {SEARCH_TABLE}.rowid DESC LIMIT %s OFFSET %s
+            """,
+            [match, limit, offset],
+        )
+        ids = [row[0] for row in cursor.fetchall()]
+
+    jobs = Jobs.objects.select_related("company").in_bulk(ids)
+    return [jobs[job_id] for job_id in ids if job_id in jobs]
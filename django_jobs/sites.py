@@ -0,0 +1,516 @@
+from collections import Counter, namedtuple
+from functools import lru_cache
+from urllib.parse import urljoin, urlsplit
+from bs4 import BeautifulSoup, SoupStrainer
+from django.conf import settings
+import soupsieve as sv
+import codecs
+import datetime
+import re
+from .ingestion import JobRecord
+
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+
+# The result of parsing one listing page: the jobs, the links to the next pages, the number of failures per field,
+# the number of cards we skipped because we already have them and whether the parsing stopped early.
+ParseResult = namedtuple("ParseResult", ["records", "links", "failures", "skipped", "stopped"])
+
+# A compound selector simple enough to be checked while the page is being parsed, e.g. 'li.feature' or 'a[rel=next]'.
+SIMPLE_SELECTOR = re.compile(r'^(?P<tag>[a-z0-9]+)?(?P<rest>(?:\.[\w-]+|\[[\w-]+=["\']?[^\]"\']*["\']?\])*)$')
+SELECTOR_PART = re.compile(r'\.(?P<cls>[\w-]+)|\[(?P<attr>[\w-]+)=["\']?(?P<value>[^\]"\']*)["\']?\]')
+# One step of a selector which can be turned into XPath: a tag, classes, [attr], [attr=value] and [attr^=value].
+XPATH_STEP = re.compile(r'^(?P<tag>[a-z0-9]+|\*)?(?P<rest>(?:\.[\w-]+|\[[\w-]+(?:\^?=["\']?[^\]"\']*["\']?)?\])*)$')
+XPATH_STEP_PART = re.compile(
+    r'\.(?P<cls>[\w-]+)|\[(?P<attr>[\w-]+)(?:(?P<op>\^?=)["\']?(?P<value>[^\]"\']*)["\']?)?\]'
+)
+# The charset from the <meta> tags, in the first bytes of the page.
+META_CHARSET = re.compile(rb'<meta[^>]+charset=["\']?([\w.:-]+)', re.IGNORECASE)
+HEADER_CHARSET = re.compile(r'charset=["\']?([\w.:-]+)', re.IGNORECASE)
+
+
+def get_parser_backend():
+    # lxml is a few times faster than the pure-Python 'html.parser', so we are using it whenever it's installed.
+    if settings.SCRAPER_PARSER != "auto":
+        return settings.SCRAPER_PARSER
+    try:
+        import lxml  # noqa: F401
+        return "lxml"
+    except ImportError:
+        return "html.parser"
+
+
+def _compile_tag_matcher(selector):
+    """
+    Turning a simple CSS selector list into a function which checks the tag name and the attributes of a tag.
+    The function is used by SoupStrainer, so only the nodes we need are built while the page is parsed.
+    Returns None if the selector is too complex to be checked this way.
+    """
+    rules = []
+    for compound in selector.split(","):
+        match = SIMPLE_SELECTOR.match(compound.strip())
+        if not match:
+            return None
+        classes, attrs = set(), {}
+        for part in SELECTOR_PART.finditer(match.group("rest")):
+            if part.group("cls"):
+                classes.add(part.group("cls"))
+            else:
+                attrs[part.group("attr")] = part.group("value")
+        rules.append((match.group("tag"), classes, attrs))
+
+    def matches(name, tag_attrs):
+        for tag, classes, attrs in rules:
+            if tag and tag != name:
+                continue
+            tag_classes = tag_attrs.get("class") or ""
+            if isinstance(tag_classes, str):
+                tag_classes = tag_classes.split()
+            if not classes.issubset(tag_classes):
+                continue
+            if all(_attr_value(tag_attrs.get(key)) == value for key, value in attrs.items()):
+                return True
+        return False
+    return matches
+
+
+def css_to_xpath(selector):
+    """
+    Translating a CSS selector list into an XPath expression relative to the current element, e.g.
+    'span.date time' -> ".//span[contains(concat(' ', normalize-space(@class), ' '), ' date ')]//time".
+    Only the tag names, classes, [attr], [attr=value], [attr^=value] and the descendant combinator are supported,
+    which is everything our specs are using. Returns None for anything else.
+    """
+    paths = []
+    for compound in selector.split(","):
+        steps = []
+        for step in compound.split():
+            match = XPATH_STEP.match(step)
+            if not match:
+                return None
+            predicates = []
+            for part in XPATH_STEP_PART.finditer(match.group("rest")):
+                attr, value = part.group("attr"), part.group("value")
+                if part.group("cls"):
+                    predicates.append(f"contains(concat(' ', normalize-space(@class), ' '), ' {part.group('cls')} ')")
+                elif part.group("op") is None:
+                    predicates.append(f"@{attr}")
+                elif part.group("op") == "=":
+                    predicates.append(f"@{attr}='{value}'")
+                else:
+                    predicates.append(f"starts-with(@{attr}, '{value}')")
+            steps.append((match.group("tag") or "*") + "".join(f"[{predicate}]" for predicate in predicates))
+        if not steps:
+            return None
+        paths.append(".//" + "//".join(steps))
+    return " | ".join(paths)
+
+
+def compile_xpath(selector):
+    # The compiled XPath of a CSS selector, or None if lxml isn't installed or the selector can't be translated.
+    if etree is None:
+        return None
+    path = css_to_xpath(selector)
+    return etree.XPath(path) if path else None
+
+
+if etree is not None:
+    # The text of an element (like BeautifulSoup's get_text()), and all the text nodes inside it.
+    ELEMENT_TEXT = etree.XPath("string()")
+    TEXT_NODES = etree.XPath(".//text()")
+
+
+def _inside(text, excluded, root):
+    # Whether a text node from TEXT_NODES is inside one of the excluded elements. A tail belongs to the parent.
+    element = text.getparent()
+    if text.is_tail:
+        element = element.getparent()
+    while element is not None and element is not root:
+        if element in excluded:
+            return True
+        element = element.getparent()
+    return False
+
+
+def detect_encoding(content, default="utf-8"):
+    # The encoding of a page: from the byte order mark, the <meta> tags or the default.
+    for bom, encoding in ((codecs.BOM_UTF8, "utf-8"), (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16")):
+        if content.startswith(bom):
+            return encoding
+    match = META_CHARSET.search(content[:4096])
+    if match:
+        try:
+            return codecs.lookup(match.group(1).decode("ascii")).name
+        except LookupError:
+            pass
+    return default
+
+
+def header_encoding(headers):
+    """
+    The encoding from the Content-Type header, or None if the website didn't send one.
+    Unlike response.encoding, there is no ISO-8859-1 default for the text/* pages without a charset.
+    """
+    match = HEADER_CHARSET.search(headers.get("Content-Type", ""))
+    if match:
+        try:
+            return codecs.lookup(match.group(1)).name
+        except LookupError:
+            pass
+    return None
+
+
+def _attr_value(value):
+    # Multi-valued attributes (like 'rel') are lists in BeautifulSoup.
+    return " ".join(value) if isinstance(value, list) else value
+
+
+@lru_cache(maxsize=1024)
+def _strptime(raw_date, date_format):
+    # Most jobs on a page share a handful of dates, and strptime is surprisingly slow.
+    return datetime.datetime.strptime(raw_date, date_format).date()
+
+
+def parse_relative_date(raw_date):
+    """
+    Remote.co has a time stamp in a form of 'hours/days/weeks ago'.
+    Therefore, we want to form a proper date based on a time stamp from the website so we can use
+    the DateField in the Jobs model.
+    """
+    today = datetime.date.today()
+    if 'hours' in raw_date:
+        return today
+    elif 'days' in raw_date:
+        return today - datetime.timedelta(days=int(raw_date[:2]))
+    elif 'week' in raw_date:
+        return today - datetime.timedelta(days=(int(raw_date[0])*7))
+    elif 'month' in raw_date:
+        return today - datetime.timedelta(days=(int(raw_date[0])*3))
+    return None
+
+
+class Field:
+    """
+    How to extract one value from a listing card.
+    - 'selector' is a CSS selector inside the card (None means the card itself);
+    - 'attr' is the attribute we want (None means the text of the element);
+    - 'exclude' is a CSS selector for the child elements whose text we want to drop (e.g. labels);
+    - 'clean' is a function for the final clean up of the value.
+    """
+
+    def __init__(self, selector=None, attr=None, exclude=None, clean=None):
+        self.selector = sv.compile(selector) if selector else None
+        # Simple selectors are checked directly against the tags, which is much faster than a full CSS match.
+        matcher = _compile_tag_matcher(selector) if selector else None
+        self.matcher = (lambda tag: matcher(tag.name, tag.attrs)) if matcher else None
+        self.attr = attr
+        self.exclude = sv.compile(exclude) if exclude else None
+        self.clean = clean
+        # The same selectors in XPath, for the pages parsed with lxml.
+        self.xpath = compile_xpath(selector) if selector else None
+        self.exclude_xpath = compile_xpath(exclude) if exclude else None
+        self.xpath_ready = etree is not None and (not selector or self.xpath is not None) and \
+            (not exclude or self.exclude_xpath is not None)
+
+    def select(self, card):
+        if self.matcher:
+            return card.find(self.matcher)
+        return self.selector.select_one(card) if self.selector else card
+
+    def extract(self, card):
+        # The card is either an lxml element or a BeautifulSoup tag, depending on how the page was parsed.
+        if etree is not None and isinstance(card, etree._Element):
+            value = self._extract_element(card)
+        else:
+            value = self._extract_tag(card)
+        if value is None:
+            return None
+        value = self.clean(value) if self.clean else value
+        return value.strip() or None
+
+    def _extract_tag(self, card):
+        element = self.select(card)
+        if element is None:
+            return None
+        if self.attr:
+            return _attr_value(element.get(self.attr))
+        if self.exclude:
+            excluded = {id(string) for tag in self.exclude.select(element) for string in tag.strings}
+            return "".join(string for string in element.strings if id(string) not in excluded)
+        return element.get_text()
+
+    def _extract_element(self, card):
+        if self.xpath is None:
+            element = card
+        else:
+            found = self.xpath(card)
+            element = found[0] if found else None
+        if element is None:
+            return None
+        if self.attr:
+            return element.get(self.attr)
+        if self.exclude_xpath:
+            excluded = set(self.exclude_xpath(element))
+            return "".join(text for text in TEXT_NODES(element) if not _inside(text, excluded, element))
+        return ELEMENT_TEXT(element)
+
+
+class CardScan:
+    # What we learned from the cards of a page, apart from the jobs themselves.
+    def __init__(self):
+        self.failures = Counter()
+        self.skipped = 0
+        self.stopped = False
+
+
+class SiteSpec:
+    """
+    Everything we need to know to scrape listing pages of one website.
+    - 'seeds' are the first pages of the categories we are crawling;
+    - 'container' is a CSS selector for a single job card;
+    - 'title', 'company', 'link' and 'date' are the Fields extracted from the card;
+    - 'link_base' is prepended to the extracted link;
+    - 'date_format' is either a strptime format or a function which turns the raw value into a date;
+    - 'pagination' is a CSS selector for the links to the next pages.
+    The selectors are compiled once, when the spec is created.
+    """
+
+    def __init__(self, name, label, seeds, container, title, company, link, date, link_base="",
+                 date_format=None, date_required=True, pagination=None):
+        self.name = name
+        self.label = label
+        self.seeds = seeds
+        self.container = sv.compile(container)
+        self.title = title
+        self.company = company
+        self.link = link
+        self.date = date
+        self.link_base = link_base
+        self.date_format = date_format
+        # If the date is not required, the jobs without the date are saved with today's date.
+        self.date_required = date_required
+        self.pagination = sv.compile(pagination) if pagination else None
+
+        # Only the job cards and the pagination links are built while the page is parsed.
+        selectors = ", ".join(selector for selector in (container, pagination) if selector)
+        matcher = _compile_tag_matcher(selectors)
+        self.strainer = SoupStrainer(matcher) if matcher else None
+        # The same checks for a single tag, used when the page is parsed while it's downloaded.
+        self.card_matcher = _compile_tag_matcher(container)
+        self.link_matcher = _compile_tag_matcher(pagination) if pagination else None
+        self.streamable = self.card_matcher is not None and (pagination is None or self.link_matcher is not None)
+        # With lxml, the page is parsed into an lxml tree and searched with XPath, which is many times faster
+        # than building a BeautifulSoup tree and matching CSS selectors in Python.
+        self.container_xpath = compile_xpath(container)
+        self.pagination_xpath = compile_xpath(pagination) if pagination else None
+        self.xpath_ready = (
+            self.container_xpath is not None
+            and (pagination is None or self.pagination_xpath is not None)
+            and all(field.xpath_ready for field in (title, company, link, date))
+        )
+
+    def uses_xpath(self):
+        return self.xpath_ready and get_parser_backend() == "lxml"
+
+    def make_soup(self, content):
+        return BeautifulSoup(content, get_parser_backend(), parse_only=self.strainer)
+
+    def make_tree(self, content):
+        # The lxml tree of the page. Returns None for an empty page.
+        # Plain lxml elements, lxml.html's own element classes only slow the lookups down.
+        parser = etree.HTMLParser(encoding=detect_encoding(content) if isinstance(content, bytes) else None)
+        try:
+            return etree.fromstring(content, parser)
+        except (etree.XMLSyntaxError, ValueError):
+            return None
+
+    def parse_card(self, html):
+        # A single card from its HTML, parsed the same way as the whole pages (see django_jobs/streaming.py).
+        if self.uses_xpath():
+            page = etree.fromstring(html, etree.HTMLParser())
+            found = self.container_xpath(page) if page is not None else []
+            return found[0] if found else None
+        return self.container.select_one(BeautifulSoup(html, get_parser_backend()))
+
+    def parse_date(self, raw_date):
+        if raw_date is None:
+            return None if self.date_required else datetime.date.today()
+        if callable(self.date_format):
+            return self.date_format(raw_date)
+        return _strptime(raw_date, self.date_format)
+
+    def card_link(self, card):
+        # Only the link of the card, so we can check if we already have the job before extracting the rest.
+        try:
+            link = self.link.extract(card)
+        except (ValueError, IndexError, TypeError):
+            return None
+        return f"{self.link_base}{link}" if link is not None else None
+
+    def extract(self, card, failures):
+        # Extracting a single job from the card. Returns None (and counts the failed field) if a field is missing.
+        values = {}
+        for field in ("title", "company", "link", "date"):
+            try:
+                values[field] = getattr(self, field).extract(card)
+                if field == "date":
+                    values[field] = self.parse_date(values[field])
+            except (ValueError, IndexError, TypeError):
+                values[field] = None
+            if values[field] is None:
+                failures[field] += 1
+                return None
+
+        return JobRecord(
+            title=values["title"],
+            company=values["company"],
+            date=values["date"],
+            link=f"{self.link_base}{values['link']}",
+        )
+
+    def same_host_links(self, url, hrefs):
+        # Only the links to the same host are followed.
+        host = urlsplit(url).netloc
+        links = []
+        for href in hrefs:
+            if href:
+                link = urljoin(url, href)
+                if urlsplit(link).netloc == host:
+                    links.append(link)
+        return links
+
+    def find_links(self, page, url):
+        # Searching the page (an lxml tree or a BeautifulSoup) for links to the next pages.
+        if self.pagination is None or page is None:
+            return []
+        if etree is not None and isinstance(page, etree._Element):
+            return self.same_host_links(url, [element.get("href") for element in self.pagination_xpath(page)])
+        return self.same_host_links(url, [tag.get("href") for tag in self.pagination.select(page)])
+
+    def scan_cards(self, cards, scan, known=None, stop_after=None):
+        """
+        Extracting the jobs from the cards, one card at a time. The failures and the skipped cards are counted
+        in 'scan' (a CardScan).
+        If 'known' links are given, the cards we already have are skipped before the rest of their fields are
+        extracted. The listings are ordered newest first, so after 'stop_after' cards in a row which were known
+        before the crawl we stop: everything after that is something we already have. The cards the crawl saved
+        from another category are skipped, but they neither count nor break the run.
+        """
+        known_in_a_row = 0
+        for card in cards:
+            if known is not None:
+                link = self.card_link(card)
+                if link is not None and link in known:
+                    scan.skipped += 1
+                    if not known.known_before(link):
+                        continue
+                    known_in_a_row += 1
+                    if stop_after and known_in_a_row >= stop_after:
+                        scan.stopped = True
+                        return
+                    continue
+                known_in_a_row = 0
+
+            record = self.extract(card, scan.failures)
+            if record is not None:
+                yield record
+
+    def parse(self, content, url, known=None, stop_after=None):
+        """
+        Parsing the listing page.
+        The cards we already have are skipped (see scan_cards), and if the parsing stopped early, the pagination
+        links are not followed.
+        """
+        if self.uses_xpath():
+            page = self.make_tree(content)
+            cards = self.container_xpath(page) if page is not None else []
+        else:
+            page = self.make_soup(content)
+            cards = self.container.select(page)
+        scan = CardScan()
+        records = list(self.scan_cards(cards, scan, known, stop_after))
+        links = [] if scan.stopped else self.find_links(page, url)
+        return ParseResult(records, links, scan.failures, scan.skipped, scan.stopped)
+
+    def stream(self, chunks, url, known=None, stop_after=None, encoding=None):
+        # Parsing the page while it's downloaded, see django_jobs/streaming.py.
+        from .streaming import PageStream
+        return PageStream(self, chunks, url, known, stop_after, encoding)
+
+
+# All the sources we are scraping. Adding a new source means adding a new spec here.
+SITES = {}
+
+
+def register(spec):
+    SITES[spec.name] = spec
+    return spec
+
+
+register(SiteSpec(
+    name="remote_co",
+    label="Remote Co",
+    seeds=[
+        "https://remote.co/remote-jobs/developer/",
+        "https://remote.co/remote-jobs/it/",
+        "https://remote.co/remote-jobs/qa/",
+    ],
+    container="a.card.m-0.border-left-0.border-right-0.border-top-0.border-bottom",
+    title=Field("span.font-weight-bold.larger"),
+    # The company name is followed by labels (<small> tags) and '|' separators which we don't need.
+    company=Field(
+        "p.m-0.text-secondary",
+        exclude="span small",
+        clean=lambda value: value.replace("\xa0", "").replace("|", ""),
+    ),
+    link=Field(attr="href"),
+    date=Field("date"),
+    link_base="https://remote.co",
+    date_format=parse_relative_date,
+    pagination="a.page-numbers, a.next",
+))
+
+register(SiteSpec(
+    name="weworkremotely",
+    label="We Work Remotely",
+    seeds=[
+        "https://weworkremotely.com/categories/remote-programming-jobs",
+        "https://weworkremotely.com/categories/remote-full-stack-programming-jobs",
+        "https://weworkremotely.com/categories/remote-back-end-programming-jobs",
+        "https://weworkremotely.com/categories/remote-front-end-programming-jobs",
+        "https://weworkremotely.com/categories/remote-devops-sysadmin-jobs",
+    ],
+    container="li.feature",
+    title=Field("span.title"),
+    # There are multiple <span class="company"> tags, the first one is the name of the Company.
+    company=Field("span.company"),
+    link=Field("a[href^='/remote-jobs/']", attr="href"),
+    # Not each job has date posted on this website.
+    date=Field("span.date time", attr="datetime"),
+    link_base="https://weworkremotely.com",
+    date_format="%Y-%m-%dT%H:%M:%SZ",
+    date_required=False,
+    pagination="a[rel=next]",
+))
+
+register(SiteSpec(
+    name="remotive",
+    label="Remotive",
+    seeds=[
+        "https://remotive.io/remote-jobs/software-dev",
+        "https://remotive.io/remote-jobs/devops",
+        "https://remotive.io/remote-jobs/data",
+        "https://remotive.io/remote-jobs/qa",
+    ],
+    container="li.tw-cursor-pointer",
+    title=Field("a.job-tile-title"),
+    company=Field("span[itemprop='hiringOrganization']"),
+    link=Field("a.job-tile-title", attr="href"),
+    date=Field("span[itemprop='datePosted']"),
+    link_base="https://remotive.io/",
+    date_format="%Y-%m-%d %H:%M:%S",
+    pagination="a[rel=next]",
+))
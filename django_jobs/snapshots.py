@@ -0,0 +1,155 @@
+from django.conf import settings
+from django.utils import timezone
+from pathlib import Path
+import gzip
+import logging
+import os
+import tempfile
+from .ingestion import IngestionResult, ingest_jobs
+from .models import PageSnapshot
+from .sites import SITES
+
+
+logger = logging.getLogger("django_jobs.scraping")
+
+# How much of a snapshot is read from the disk at a time.
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def snapshots_enabled():
+    return bool(settings.SCRAPER_SNAPSHOT_DIR)
+
+
+def snapshot_path(content_hash):
+    # The files are spread over 256 directories, so no directory gets too big.
+    return Path(settings.SCRAPER_SNAPSHOT_DIR) / content_hash[:2] / f"{content_hash}.html.gz"
+
+
+def write_snapshot(content, content_hash):
+    """
+    Saving the compressed page under its content hash, unless we already have it.
+    The file is written next to its final place and renamed, so a crashed write never leaves half a page behind.
+    Returns True if a new file was written.
+    """
+    path = snapshot_path(content_hash)
+    if path.exists():
+        return False
+    path.parent.mkdir(parents=True, exist_ok=True)
+    descriptor, temporary = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as output:
+            output.write(content)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+    return True
+
+
+class SnapshotWriter:
+    """
+    Compressing a page into the snapshot store while it's downloaded, for the pages parsed as a stream.
+    The name of the file (the content hash) is known only at the end, so the page goes to a temporary file first:
+    'commit' moves it to its place, 'discard' drops it (e.g. when only a part of the page was downloaded).
+    """
+
+    def __init__(self):
+        directory = Path(settings.SCRAPER_SNAPSHOT_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        descriptor, self.temporary = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        self._raw = os.fdopen(descriptor, "wb")
+        self._output = gzip.GzipFile(fileobj=self._raw, mode="wb", mtime=0)
+
+    def write(self, chunk):
+        self._output.write(chunk)
+
+    def _close(self):
+        self._output.close()
+        self._raw.close()
+
+    def commit(self, content_hash):
+        self._close()
+        path = snapshot_path(content_hash)
+        if path.exists():
+            os.unlink(self.temporary)
+            return False
+        path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(self.temporary, path)
+        return True
+
+    def discard(self):
+        self._close()
+        os.unlink(self.temporary)
+
+
+def add_snapshot(source, url, content_hash, size, fetched=None):
+    # Every fetch gets its own PageSnapshot row, even if the file is the same.
+    return PageSnapshot.objects.create(
+        source=source,
+        url=url,
+        content_hash=content_hash,
+        size=size,
+        fetched=fetched or timezone.now(),
+    )
+
+
+def save_snapshot(source, url, content, content_hash, fetched=None):
+    """
+    Keeping a fetched page, so it can be parsed again later without the network.
+    Identical pages are stored only once (the file is named after the content hash), but every fetch gets its own
+    PageSnapshot row, so we know what every page looked like at any time.
+    """
+    write_snapshot(content, content_hash)
+    return add_snapshot(source, url, content_hash, len(content), fetched)
+
+
+def open_snapshot(content_hash):
+    # The page is decompressed while it's read, so it's never in memory in its compressed and raw form at once.
+    return gzip.open(snapshot_path(content_hash), "rb")
+
+
+def iter_snapshot(content_hash, chunk_size=READ_CHUNK_SIZE):
+    # Streaming the raw page in chunks, for the parse stage of the pipeline, which parses the page while it's read.
+    with open_snapshot(content_hash) as snapshot:
+        yield from iter(lambda: snapshot.read(chunk_size), b"")
+
+
+def read_snapshot(content_hash):
+    # The whole raw page, for the parsers, which need all of it anyway.
+    with open_snapshot(content_hash) as snapshot:
+        return snapshot.read()
+
+
+def reparse_snapshots(since=None, until=None, sources=None):
+    """
+    Running the current parsers over the stored pages and saving the jobs we didn't have.
+    Nothing is downloaded. A page which was fetched many times without changes is parsed only once.
+    - since / until: the range of the fetch times;
+    - sources: the names of the sources (all of them by default).
+    Returns the number of parsed pages and an IngestionResult with the totals.
+    """
+    snapshots = PageSnapshot.objects.order_by("fetched", "id")
+    if since:
+        snapshots = snapshots.filter(fetched__gte=since)
+    if until:
+        snapshots = snapshots.filter(fetched__lt=until)
+    if sources:
+        snapshots = snapshots.filter(source__in=sources)
+
+    seen = set()
+    pages = inserted = duplicates = 0
+    for source, url, content_hash in snapshots.values_list("source", "url", "content_hash").iterator():
+        if (url, content_hash) in seen or source not in SITES:
+            continue
+        seen.add((url, content_hash))
+        try:
+            content = read_snapshot(content_hash)
+        except OSError as e:
+            logger.warning(f"The snapshot {content_hash} of {url} can't be read. See the Exception: {e}")
+            continue
+        parsed = SITES[source].parse(content, url)
+        result = ingest_jobs(parsed.records)
+        pages += 1
+        inserted += result.inserted
+        duplicates += result.duplicates
+    return pages, IngestionResult(inserted=inserted, duplicates=duplicates)
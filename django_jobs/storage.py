@@ -0,0 +1,76 @@
+"""
+Tuning the database for many scraper writes alongside the web reads.
+- SQLite: every new connection is switched to WAL (readers don't wait for the writer, and the other way around)
+  with the PRAGMAs from the settings, and the connections are kept open (CONN_MAX_AGE);
+- PostgreSQL: the new jobs of a scrape are loaded with COPY into a temporary staging table and merged into the
+  jobs table from there, with a single INSERT ... ON CONFLICT which also gives us the ids of the new rows.
+The database itself is selected with DATABASE_URL (see django_aggregator/settings.py).
+"""
+from django.conf import settings
+import csv
+import io
+from .models import Jobs
+
+
+STAGING_TABLE = "django_jobs_jobs_staging"
+STAGING_COLUMNS = ["title", "company_id", "date", "link"]
+
+
+def sqlite_pragmas():
+    # The PRAGMAs run on every new SQLite connection.
+    return [
+        f"PRAGMA journal_mode = {settings.SQLITE_JOURNAL_MODE}",
+        f"PRAGMA synchronous = {settings.SQLITE_SYNCHRONOUS}",
+        f"PRAGMA busy_timeout = {settings.SQLITE_BUSY_TIMEOUT}",
+        # A negative cache size is in KiB instead of pages.
+        f"PRAGMA cache_size = -{settings.SQLITE_CACHE_SIZE}",
+        f"PRAGMA mmap_size = {settings.SQLITE_MMAP_SIZE}",
+        "PRAGMA temp_store = MEMORY",
+    ]
+
+
+def configure_connection(sender, connection, **kwargs):
+    # Connected to the 'connection_created' signal (see django_jobs/apps.py).
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for pragma in sqlite_pragmas():
+            cursor.execute(pragma)
+
+
+def uses_copy(connection):
+    return connection.vendor == "postgresql" and settings.SCRAPER_INGEST_COPY
+
+
+def staging_csv(rows):
+    # The rows in the CSV format COPY reads. None is written as an empty unquoted field, which COPY reads as NULL.
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    return buffer
+
+
+def copy_jobs(connection, rows):
+    """
+    Inserting the jobs (tuples of STAGING_COLUMNS) through COPY and a staging table, on PostgreSQL.
+    The links which are in the table already are skipped, like with bulk_create(ignore_conflicts=True).
+    Returns the ids of the inserted jobs by their links. It has to run inside a transaction, the staging table
+    is emptied when it's committed.
+    """
+    quote = connection.ops.quote_name
+    columns = ", ".join(quote(column) for column in STAGING_COLUMNS)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TEMPORARY TABLE IF NOT EXISTS {quote(STAGING_TABLE)} "
+            f"(title text, company_id bigint, date date, link text) ON COMMIT DELETE ROWS"
+        )
+        # copy_expert belongs to the psycopg2 cursor, the cursor of Django passes it on.
+        cursor.copy_expert(f"COPY {quote(STAGING_TABLE)} ({columns}) FROM STDIN WITH (FORMAT csv)", staging_csv(rows))
+        cursor.execute(
+            f"INSERT INTO {quote(Jobs._meta.db_table)} ({columns}) "
+            f"SELECT {columns} FROM {quote(STAGING_TABLE)} "
+            f"ON CONFLICT ({quote('link')}) DO NOTHING RETURNING {quote('link')}, {quote('id')}"
+        )
+        job_ids = dict(cursor.fetchall())
+        cursor.execute(f"TRUNCATE {quote(STAGING_TABLE)}")
+    return job_ids
@@ -0,0 +1,159 @@
+"""
+Parsing a listing page while it's downloaded.
+The bytes are fed to an incremental tokenizer (html.parser) which doesn't build the page at all. It only keeps the
+HTML of the job card it's in, and once the closing tag of the card is seen, the card is parsed on its own with the
+same Fields as a whole page, and its job is yielded right away.
+So the memory used for a page is about one card and one chunk, whatever the size of the page, and the jobs can be
+saved before the rest of the page arrives.
+"""
+from collections import deque
+from html import escape
+from html.parser import HTMLParser
+import codecs
+from .sites import CardScan, detect_encoding
+
+
+# How much of the page is held back to find its encoding, like the prescan of the HTML standard. The <meta> tags
+# are in the <head>, so we also stop looking at the <body>.
+ENCODING_SNIFF_SIZE = 1024
+
+# The elements which never have a closing tag.
+VOID_ELEMENTS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "track", "wbr",
+}
+
+
+class CardTokenizer(HTMLParser):
+    """
+    Finding the job cards and the pagination links in the HTML fed to it, in pieces of any size.
+    - 'on_card(html)' is called with the HTML of every card once it's closed;
+    - 'on_link(href)' is called with every pagination link.
+    Only the elements with the same name as the card are counted, so a card is closed by its own closing tag
+    even if the HTML inside is a bit broken.
+    """
+
+    def __init__(self, card_matcher, link_matcher, on_card, on_link):
+        super().__init__(convert_charrefs=True)
+        self.card_matcher = card_matcher
+        self.link_matcher = link_matcher
+        self.on_card = on_card
+        self.on_link = on_link
+        self._card = None
+        self._card_tag = None
+        self._depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        self._start(tag, attrs, closed=tag in VOID_ELEMENTS)
+
+    def handle_startendtag(self, tag, attrs):
+        self._start(tag, attrs, closed=True)
+
+    def _start(self, tag, attrs, closed):
+        attrs = {name: value or "" for name, value in attrs}
+        if self.link_matcher and self.link_matcher(tag, attrs):
+            self.on_link(attrs.get("href"))
+
+        if self._card is None:
+            if not self.card_matcher(tag, attrs):
+                return
+            self._card, self._card_tag, self._depth = [], tag, 0
+        self._card.append(self.get_starttag_text())
+        if tag == self._card_tag and not closed:
+            self._depth += 1
+        elif self._depth == 0:
+            # A card without any content, e.g. <img class="card">.
+            self._close_card()
+
+    def handle_endtag(self, tag):
+        if self._card is None:
+            return
+        self._card.append(f"</{tag}>")
+        if tag == self._card_tag:
+            self._depth -= 1
+            if self._depth == 0:
+                self._close_card()
+
+    def handle_data(self, data):
+        if self._card is not None:
+            self._card.append(escape(data, quote=False))
+
+    def _close_card(self):
+        html = "".join(self._card)
+        self._card = None
+        self.on_card(html)
+
+
+class PageStream(CardScan):
+    """
+    The jobs of a listing page, parsed from the chunks of bytes as they come.
+    Iterating over it yields the JobRecords. The cards we already have are skipped and the parsing stops early
+    in the same way as SiteSpec.parse does, and then the rest of the chunks is never read.
+    After the iteration, 'failures', 'skipped' and 'stopped' are set, and 'links' has the pagination links
+    (only if the whole page was read).
+    Specs whose selectors are too complex for the tokenizer read the whole page and parse it as usual.
+    The page is decoded with 'encoding' (the charset of the Content-Type header) if it's given, or else with the
+    encoding found at the start of the page, like SiteSpec.parse does (see detect_encoding).
+    """
+
+    def __init__(self, spec, chunks, url, known=None, stop_after=None, encoding=None):
+        super().__init__()
+        self.spec = spec
+        self.chunks = chunks
+        self.url = url
+        self.known = known
+        self.stop_after = stop_after
+        self.encoding = encoding
+        self.links = []
+
+    def __iter__(self):
+        if not self.spec.streamable:
+            return self._parse_whole_page()
+        return self.spec.scan_cards(self._cards(), self, self.known, self.stop_after)
+
+    def _parse_whole_page(self):
+        result = self.spec.parse(b"".join(self.chunks), self.url, self.known, self.stop_after)
+        self.failures.update(result.failures)
+        self.skipped, self.stopped, self.links = result.skipped, result.stopped, result.links
+        yield from result.records
+
+    def _parse_cards(self, ready):
+        while ready:
+            card = self.spec.parse_card(ready.popleft())
+            if card is not None:
+                yield card
+
+    def _sniffed_chunks(self):
+        # Without an encoding, the first chunks are held back until there is enough of the page to find it.
+        if self.encoding is not None:
+            yield from self.chunks
+            return
+        head = b""
+        for chunk in self.chunks:
+            if self.encoding is not None:
+                yield chunk
+                continue
+            head += chunk
+            # Only the complete tags, a chunk can end in the middle of the name of the encoding.
+            encoding = detect_encoding(head[:head.rfind(b">") + 1], default=None)
+            if encoding or len(head) >= ENCODING_SNIFF_SIZE or b"<body" in head.lower():
+                self.encoding = encoding or "utf-8"
+                yield head
+        if self.encoding is None:
+            self.encoding = detect_encoding(head)
+            yield head
+
+    def _cards(self):
+        ready = deque()
+        hrefs = []
+        tokenizer = CardTokenizer(self.spec.card_matcher, self.spec.link_matcher, ready.append, hrefs.append)
+        decoder = None
+        for chunk in self._sniffed_chunks():
+            # A chunk can end in the middle of a character.
+            decoder = decoder or codecs.getincrementaldecoder(self.encoding)(errors="replace")
+            tokenizer.feed(decoder.decode(chunk))
+            yield from self._parse_cards(ready)
+        decoder = decoder or codecs.getincrementaldecoder(self.encoding or "utf-8")(errors="replace")
+        tokenizer.feed(decoder.decode(b"", final=True))
+        tokenizer.close()
+        yield from self._parse_cards(ready)
+        self.links = self.spec.same_host_links(self.url, hrefs)
@@ -1,252 +1,332 @@
 from __future__ import absolute_import, unicode_literals
-from celery import shared_task
-from bs4 import BeautifulSoup
-import requests
-import random
-import datetime
-from .models import Jobs, Company
-from django.core.exceptions import ObjectDoesNotExist
-
-
-headers_list = [
-    {  # Firefox/Linux
-        'User-Agent': 'Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:86.0) Gecko/20100101 Firefox/86.0',  # Change
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-        'Accept-Language': 'en-US,en;q=0.5',
-        'Connection': 'keep-alive',
-        'Upgrade-Insecure-Requests': '1',
-        'If-Modified-Since': 'Fri, 19 Mar 2021 05:07:23 GMT',
-        'Cache-Control': 'max-age=0',
-    },
-    {  # Chrome/Linux
-        'authority': 'remote.co',
-        'sec-ch-ua': '"Google Chrome";v="89", "Chromium";v="89", ";Not A Brand";v="99"',
-        'sec-ch-ua-mobile': '?0',
-        'upgrade-insecure-requests': '1',
-        'user-agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) '
-                      'Chrome/89.0.4389.82 Safari/537.36',
-        'accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,'
-                  'image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.9',
-        'sec-fetch-site': 'none',
-        'sec-fetch-mode': 'navigate',
-        'sec-fetch-user': '?1',
-        'sec-fetch-dest': 'document',
-        'accept-language': 'en-US,en;q=0.9',
-    },
-]
+from celery import chain, chord, shared_task
+from django.conf import settings
+from functools import partial
+from itertools import islice
+import hashlib
+import logging
+import time
+from .caching import bump_data_version
+from .fetching import get_fetch_engine
+from .frontier import CrawlFrontier, crawl
+from .ingestion import ingest_jobs
+from .known_links import CrawlLinks, get_known_links
+from .metrics import ScrapeMetrics
+from .models import PageValidator
+from . import pipeline
+from .retention import archive_old_jobs
+from .scheduling import claim_due_sources
+from .sites import SITES, header_encoding
+from .snapshots import SnapshotWriter, add_snapshot, save_snapshot, snapshots_enabled
+
+
+logger = logging.getLogger("django_jobs.scraping")
+
+
+def check_response(url, name, page, error, metrics):
+    """
+    Counting a downloaded page in the metrics.
+    Returns False if there is nothing to parse: the download failed, the website answered with an error,
+    or with '304 Not Modified'.
+    """
+    label = SITES[name].label
+    metrics.add(name, pages=1)
+    if error is not None:
+        metrics.add(name, errors=1)
+        logger.warning(f"Fetching from '{label}' failed ({url}). See the Exception: {error}")
+        return False
+
+    metrics.add(name, fetch_seconds=getattr(page, "fetch_seconds", 0))
+    if page.status_code == 304:
+        metrics.add(name, pages_unchanged=1, bytes_downloaded=len(page.content))
+        return False
+    if page.status_code >= 400:
+        metrics.add(name, errors=1, bytes_downloaded=len(page.content))
+        logger.warning(f"Fetching from '{label}' failed ({url}). The website answered with {page.status_code}.")
+        return False
+    return True
+
+
+def scrape_page(url, name, page, error, validators=None, metrics=None, crawl_links=None):
+    """
+    Parsing and saving a single downloaded page.
+    Returns the links to the next pages of the same category, so the crawl can continue.
+    If the page didn't change since the last run (the website answered with '304 Not Modified' or the content hash
+    is the same), the page is skipped completely.
+    The time spent in every phase and the numbers of jobs are recorded in 'metrics'.
+    'crawl_links' are the known links of the crawl, by source (see CrawlLinks).
+    """
+    spec = SITES[name]
+    label = spec.label
+    metrics = metrics or ScrapeMetrics()
+    if not check_response(url, name, page, error, metrics):
+        return []
+    metrics.add(name, bytes_downloaded=len(page.content))
+
+    validator = (validators or {}).get(url) or PageValidator(url=url)
+    content_hash = hashlib.sha256(page.content).hexdigest()
+    if snapshots_enabled():
+        # Keeping the raw page, so it can be parsed again if our parser misses something.
+        with metrics.timer(name, "persist"):
+            try:
+                save_snapshot(name, url, page.content, content_hash)
+            except OSError as e:
+                logger.warning(f"Saving the snapshot of {url} failed. See the Exception: {e}")
 
+    if validator.content_hash == content_hash:
+        metrics.add(name, pages_unchanged=1)
+        return []
 
-@shared_task
-def scrape_content_from_remote_co():
+    try:
+        # The jobs we saw recently are skipped, and the parsing stops once we reach the jobs we already have.
+        known = crawl_links[name] if crawl_links else CrawlLinks(get_known_links(spec))
+        with metrics.timer(name, "parse"):
+            parsed = spec.parse(page.content, url, known=known, stop_after=settings.SCRAPER_EARLY_STOP)
+        metrics.add_failures(name, parsed.failures)
+
+        with metrics.timer(name, "persist"):
+            # Saving all the jobs from the page in bulk. Jobs we already have (based on the link) are skipped.
+            result = ingest_jobs(parsed.records)
+            known.add(record.link for record in parsed.records)
+
+            # The validators are saved only after the jobs are saved, so a failed page is scraped again next time.
+            validator.etag = page.headers.get("ETag", "")
+            validator.last_modified = page.headers.get("Last-Modified", "")
+            validator.content_hash = content_hash
+            validator.save()
+    except Exception as e:
+        metrics.add(name, errors=1)
+        logger.exception(f"Scraping from '{label}' ({url}) failed. See the Exception: {e}")
+        return []
+
+    metrics.add(
+        name,
+        cards_found=len(parsed.records) + parsed.skipped + sum(parsed.failures.values()),
+        inserted=result.inserted,
+        duplicates=result.duplicates + parsed.skipped,
+    )
+    logger.info(
+        f"Scraping from '{label}' ({url}) finished: {result.inserted} new jobs, "
+        f"{result.duplicates + parsed.skipped} duplicates."
+    )
+    return parsed.links
+
+
+def scrape_page_stream(url, name, page, error, validators=None, metrics=None, crawl_links=None):
     """
-    With this scraper function, we are scraping content from Remote.co webiste.
-    We are using the scraper to extract the following data:
-    - Company name;
-    - Title/Job opening;
-    - Date posted;
-    - The final link for applying for a job;
+    Parsing and saving a single page while it's downloaded (the response has to be fetched with stream=True).
+    The jobs are saved in batches of SCRAPER_STREAM_BATCH as soon as their cards are read, and once the parsing
+    reaches the jobs we already have, the rest of the page isn't downloaded at all.
+    The page is hashed and kept as a snapshot on the way, but only a page which was read to the end gets its
+    content hash and snapshot saved.
+    Returns the links to the next pages, like scrape_page.
     """
+    spec = SITES[name]
+    metrics = metrics or ScrapeMetrics()
+    if not check_response(url, name, page, error, metrics):
+        page.close()
+        return []
+
+    validator = (validators or {}).get(url) or PageValidator(url=url)
+    hasher = hashlib.sha256()
+    snapshot = None
+    if snapshots_enabled():
+        try:
+            snapshot = SnapshotWriter()
+        except OSError as e:
+            logger.warning(f"Saving the snapshot of {url} failed. See the Exception: {e}")
+
+    downloaded = {"bytes": 0, "seconds": 0.0}
+
+    def chunks():
+        body = page.iter_content(settings.SCRAPER_STREAM_CHUNK_SIZE)
+        while True:
+            started = time.perf_counter()
+            chunk = next(body, None)
+            downloaded["seconds"] += time.perf_counter() - started
+            if chunk is None:
+                return
+            downloaded["bytes"] += len(chunk)
+            hasher.update(chunk)
+            if snapshot is not None:
+                snapshot.write(chunk)
+            yield chunk
+
+    inserted = duplicates = records = 0
+    known = crawl_links[name] if crawl_links else CrawlLinks(get_known_links(spec))
+    stream = spec.stream(
+        chunks(), url, known=known, stop_after=settings.SCRAPER_EARLY_STOP, encoding=header_encoding(page.headers),
+    )
+    try:
+        # The download, the parsing and the saving are interleaved. The time spent waiting for the chunks is
+        # the fetch time, the time spent in ingest_jobs is the persist time, and the rest is parsing.
+        started = time.perf_counter()
+        persist_seconds = 0.0
+        jobs = iter(stream)
+        for batch in iter(lambda: list(islice(jobs, settings.SCRAPER_STREAM_BATCH)), []):
+            persist_started = time.perf_counter()
+            result = ingest_jobs(batch)
+            known.add(record.link for record in batch)
+            persist_seconds += time.perf_counter() - persist_started
+            records += len(batch)
+            inserted += result.inserted
+            duplicates += result.duplicates
+        metrics.add(
+            name,
+            bytes_downloaded=downloaded["bytes"],
+            fetch_seconds=downloaded["seconds"],
+            parse_seconds=time.perf_counter() - started - downloaded["seconds"] - persist_seconds,
+            persist_seconds=persist_seconds,
+        )
+        metrics.add_failures(name, stream.failures)
+
+        with metrics.timer(name, "persist"):
+            validator.etag = page.headers.get("ETag", "")
+            validator.last_modified = page.headers.get("Last-Modified", "")
+            # The hash of a part of the page means nothing.
+            validator.content_hash = "" if stream.stopped else hasher.hexdigest()
+            validator.save()
+            if snapshot is not None:
+                if stream.stopped:
+                    snapshot.discard()
+                else:
+                    snapshot.commit(validator.content_hash)
+                    add_snapshot(name, url, validator.content_hash, downloaded["bytes"])
+                snapshot = None
+    except Exception as e:
+        metrics.add(name, errors=1)
+        logger.exception(f"Scraping from '{spec.label}' ({url}) failed. See the Exception: {e}")
+        return []
+    finally:
+        page.close()
+        if snapshot is not None:
+            snapshot.discard()
+
+    metrics.add(
+        name,
+        cards_found=records + stream.skipped + sum(stream.failures.values()),
+        inserted=inserted,
+        duplicates=duplicates + stream.skipped,
+    )
+    logger.info(
+        f"Scraping from '{spec.label}' ({url}) finished: {inserted} new jobs, "
+        f"{duplicates + stream.skipped} duplicates."
+    )
+    return stream.links
+
+
+def scrape_sources(names, engine=None, stream=None):
+    """
+    Crawling the given sources in one pass.
+    We start from the first page of every category and follow the pagination links. The pages are downloaded
+    in parallel by the fetch engine (the shared one, unless 'engine' is given) and each page is parsed and saved
+    as soon as its download is finished, or while it's downloaded with 'stream' (SCRAPER_STREAMING by default).
+    The validators from the last run are sent with every request, so unchanged pages cost us almost nothing.
+    Returns the metrics of the run, which are also saved as a ScrapeRun for every source.
+    """
+    frontier = CrawlFrontier()
+    for name in names:
+        for url in SITES[name].seeds:
+            frontier.add(url, name)
 
-    # The link from which the data is scraped.
-    URL = "https://remote.co/remote-jobs/developer/"
-    # Used for creating the application link.
-    base_url = "https://remote.co"
+    validators = {validator.url: validator for validator in PageValidator.objects.all()}
 
-    # From created headers_list, we are randomly choosing one of the headers for the request.
-    headers = random.choice(headers_list)
+    def request_headers(url):
+        validator = validators.get(url)
+        return validator.conditional_headers() if validator else None
 
-    # Assigning randomly selected header to requests.
-    page = requests.get(URL, headers=headers)
+    metrics = ScrapeMetrics()
+    stream = settings.SCRAPER_STREAMING if stream is None else stream
+    # The links the crawl saves are known to the next pages, but only the links from before count for the early stop.
+    crawl_links = {name: CrawlLinks(get_known_links(SITES[name])) for name in names}
+    handle_page = partial(
+        scrape_page_stream if stream else scrape_page, validators=validators, metrics=metrics, crawl_links=crawl_links,
+    )
+    crawl(engine or get_fetch_engine(), frontier, handle_page, request_headers, stream=stream)
+    metrics.save()
 
-    try:
-        soup = BeautifulSoup(page.content, 'html.parser')
-
-        # Searching for the <a> tag which contains all the job results we need.
-        results = soup.find_all("a", class_="card m-0 border-left-0 border-right-0 border-top-0 border-bottom")
-
-        for jobs in results:
-            # Searching for a content for each job post.
-            comp = jobs.find("p", class_="m-0 text-secondary")
-
-            for span in comp("span"):
-                # Removing labels we don't need which can be found as <span> tag in another <span> tag.
-                # Doing this, we are creating a clean company name.
-                if span:
-                    # If we have <small> tag within <span> tag, we will extract and remove the data by using
-                    # decompose().
-                    # Unlike decompose(), extract() method returns the data (but in this case, we don't need it).
-                    span.small.decompose()
-
-            # Removing '\xa0' and '|' from html so we can get clean company name to save.
-            company = comp.text.replace("\xa0", "").replace("|", "").strip()
-
-            # Extracting the job title from HTML.
-            title = jobs.find("span", class_="font-weight-bold larger").text.strip()
-            # Extracting full link for job application.
-            full_link = f"{base_url}{jobs['href'].strip()}"  # link for applying
-
-            # This particular site has a time stamp in a form of 'hours/days/weeks ago'.
-            # Therefore, we want to form a proper date based on a time stamp from the website so we can use
-            # the DateField in the Jobs model.
-            raw_date = jobs.find('date').text.strip()
-            if 'hours' in raw_date:
-                date = datetime.datetime.now()
-            elif 'days' in raw_date:
-                date = datetime.datetime.now() - datetime.timedelta(days=int(raw_date[:2]))
-            elif 'week' in raw_date:
-                date = datetime.datetime.now() - datetime.timedelta(days=(int(raw_date[0])*7))
-            elif 'month' in raw_date:
-                date = datetime.datetime.now() - datetime.timedelta(days=(int(raw_date[0])*3))
-
-            # Accessing the company or creating a new company.
-            # In both cases, we are using the company name to create a Job Post.
-            obj, created = Company.objects.get_or_create(name=company)
-
-            # Creating a Job Post based on extracted data from HTML.
-            try:
-                if Jobs.objects.get(link=full_link):
-                    # If we have a link for the job in our database, we are skipping it because we avoid creating
-                    # multiple models for the same job post.
-                    pass
-            except ObjectDoesNotExist:
-                Jobs.objects.create(title=title, company=obj, date=date.date(), link=full_link)
+    # The cached pages are invalidated only if something new was actually added.
+    if metrics.inserted:
+        bump_data_version()
+    return metrics
 
-    except Exception as e:
-        print(f"The scraping from 'Remote Co' failed. See exception: {e}")
 
+def dispatch_wave(wave, crawl):
+    # Every page is fetched and parsed on its own, and the whole wave is saved at once when all of them are parsed.
+    chord(chain(fetch_page.s(page), parse_page.s()) for page in wave)(persist_pages.s(crawl))
 
-@shared_task
-def scrape_weworkremotely():
-    """
-    We are using this function to scrape the data from WeWorkRemotely website.
-    The data we are searching for are:
-    - Company;
-    - Title/Job opening;
-    - Date posted;
-    - Final link for applying for a job.
-    """
 
-    # The link from which developers jobs_app are being scraped.
-    URL = "https://weworkremotely.com/categories/remote-programming-jobs"
+def start_pipeline(names, scheduled=False):
+    # Crawling the given sources through the fetch, parse and persist queues (see django_jobs/pipeline.py).
+    wave, crawl = pipeline.start_crawl(names, scheduled=scheduled)
+    if wave:
+        dispatch_wave(wave, crawl)
 
-    # Base url we are using for creating the link for job application.
-    base_url = "https://weworkremotely.com"
 
-    # We randomize headers from headers_list so the website won't detect we are using requests library.
-    # And we are avoiding being blocked by the website.
-    headers = random.choice(headers_list)
+@shared_task
+def dispatch_due_scrapes():
+    # Started by beat every few minutes. The sources which are due are crawled together by the pipeline.
+    names = claim_due_sources()
+    if names:
+        start_pipeline(names, scheduled=True)
+    return names
 
-    # Assigning randomly selected header to requests.
-    page = requests.get(URL, headers=headers)
 
+# The fetch and parse tasks never raise: a failed task would fail the whole chord, so the wave would never be saved
+# and the run never finished (no ScrapeRun, nothing for the scheduler). A failed page is passed on as an error.
+@shared_task
+def fetch_page(page):
     try:
-        soup = BeautifulSoup(page.content, 'html.parser')
-
-        # List of results.
-        results = soup.find_all("li", class_="feature")
-
-        for result in results:
-            # In this for loop, we are searching for: company name, title, application link and the time posted.
-
-            # Depending on a company and a job post itself, there are different number of links which are included in
-            # the result variable. Sometimes, there are only one link, and sometimes there are multiple links ("href").
-            # Therefore, we are searching for all <a> tags.
-            a_tags = result.find_all("a")
-            url = a_tags[1]['href']
-            full_link = f"{base_url}{url}"
-
-            # Getting the job title name.
-            title = result.find("span", class_="title").text.strip()
-
-            # Getting the Company name.
-            # result.find_all("span", class_="company") returns a list because there are multiple results with the
-            # same class name within <span> tag.
-            company_result = result.find_all("span", class_="company")
-            # Based on html research, I've discovered that the first result from a list is a name of the Company.
-            company = company_result[0].text.strip()
-
-            # Getting the date.
-            if result.find("span", class_="date"):
-                # Not each job has date posted on this website.
-                # If there is, we are cleaning the date data.
-                raw_date = result.find("time")["datetime"]
-                date = datetime.datetime.strptime(raw_date, "%Y-%m-%dT%H:%M:%SZ").date()
-            else:
-                # If not, we are adding the job post with today's date.
-                date = datetime.date.today()
-
-            # Getting or creating the company we will use while creating the job post.
-            obj, created = Company.objects.get_or_create(name=company)
+        return pipeline.fetch_page(page)
+    except Exception as e:
+        logger.exception(f"Fetching {page['url']} failed. See the Exception: {e}")
+        return pipeline.failed_page(page, e)
 
-            try:
-                # Use link as something that is unique in our database.
-                # We are checking if there is a link for application in the database.
-                # If there is, we are skipping that result because we already have that job in our database.
-                if Jobs.objects.get(link=full_link):
-                    pass
-            except ObjectDoesNotExist:
-                # If there is no such link, we are creating a Job object.
-                Jobs.objects.create(title = title, company=obj, date=date, link=full_link)
 
+# Only the results of the parse stage are kept, for the chord which waits for the whole wave.
+@shared_task(bind=True, ignore_result=False)
+def parse_page(self, page):
+    try:
+        parsed = pipeline.parse_page(page)
     except Exception as e:
-        print(f"Scraping from 'We Work Remotely' failed. See the Exception: {e}")
+        logger.exception(f"Parsing {page['url']} failed. See the Exception: {e}")
+        parsed = pipeline.failed_page(page, e)
+    return dict(parsed, task_id=self.request.id)
+
 
+@shared_task(bind=True)
+def persist_pages(self, pages, crawl):
+    wave, crawl = pipeline.persist_pages(pages, crawl)
+    if not self.request.is_eager:
+        # The parsed pages are saved, their results can go.
+        for page in pages:
+            self.app.AsyncResult(page["task_id"]).forget()
+    if wave:
+        dispatch_wave(wave, crawl)
 
 
 @shared_task
-def scrape_remotive():
-    """
-    We are using this function to scrape the data from WeWorkRemotely website.
-    The data we are searching for are:
-    - Company;
-    - Title/Job opening;
-    - Date posted;
-    - Final link for applying for a job;
-    """
+def scrape_all_sources():
+    # Scraping every source we have with a single task.
+    scrape_sources(list(SITES))
+
+
+@shared_task
+def scrape_content_from_remote_co():
+    scrape_sources(["remote_co"])
 
-    # The url we are using for scraping.
-    URL = "https://remotive.io/remote-jobs/software-dev"
-    # We use 'base_url' for creating the final link for application.
-    base_url = "https://remotive.io/"
 
-    # We are mixing the headers from headers_list so we can cover up tools we are using for web scraping and
-    # prevent potential block from the website.
-    headers = random.choice(headers_list)
+@shared_task
+def scrape_weworkremotely():
+    scrape_sources(["weworkremotely"])
 
-    # Assigning randomly selected headers while we are sending the request to the website.
-    page = requests.get(URL, headers=headers)
 
-    try:
-        soup = BeautifulSoup(page.content, 'html.parser')
-
-        # Getting the tag we need and which contains the data we want for our models.
-        results = soup.find_all("li", class_="tw-cursor-pointer")
-        for result in results:
-            # From 'raw' variable we can extract 2 things we need: title and the link.
-            raw = result.find("a", class_="job-tile-title")
-            # Getting the title from a job post.
-            title = raw.text.strip()
-            # Getting the application link.
-            link = f"{base_url}{raw['href']}"
-
-            # Getting the company name.
-            company = result.find("span", itemprop="hiringOrganization").text.strip()
-            # Getting the post date.
-            raw_date = result.find("span", itemprop="datePosted").text.strip()
-            date = datetime.datetime.strptime(raw_date, "%Y-%m-%d %H:%M:%S").date()
-
-            # Getting or creating the company we will use while creating the job post.
-            obj, created = Company.objects.get_or_create(name=company)
+@shared_task
+def scrape_remotive():
+    scrape_sources(["remotive"])
 
-            try:
-                # Use link as something that is unique in our database.
-                # We are checking if there is a link for application in the database.
-                # If there is, we are skipping that result because we already have that job in our database.
-                if Jobs.objects.get(link=link):
-                    pass
-            except ObjectDoesNotExist:
-                # If there is no such link, we are creating a Job object.
-                Jobs.objects.create(title=title, company=obj, date=date, link=link)
 
-    except Exception as e:
-        print(f"Scraping from 'Remotive' failed. See the Exception: {e}")
\ No newline at end of file
+@shared_task
+def archive_old_jobs_task():
+    # Moving the jobs older than JOBS_RETENTION_DAYS into the archive.
+    return archive_old_jobs()
@@ -0,0 +1,69 @@
+from django.test import TestCase, TransactionTestCase
+from django_jobs.benchmarks import run_benchmarks, load_fixture
+from django_jobs.benchmarks.load import DEFAULT_BUDGETS, check_budgets, percentile, run_load_test, seed_dataset
+from django_jobs.benchmarks.synthetic import generate_page
+from django_jobs.models import Company, Jobs
+from django_jobs.sites import SITES
+
+
+class TestBenchmarks(TestCase):
+    """
+    Test Case for the offline scraper benchmarks.
+    We are checking that the recorded and generated pages can be parsed, and that nothing is left in the database.
+    """
+    def test_fixtures(self):
+        # Every card from the recorded pages should be parsed without failures.
+        for source, cards in (("remote_co", 6), ("weworkremotely", 5), ("remotive", 5)):
+            result = SITES[source].parse(load_fixture(source), SITES[source].seeds[0])
+            self.assertEqual(len(result.records), cards)
+            self.assertFalse(result.failures)
+
+        # The generated pages have exactly the number of cards we asked for.
+        for source in SITES:
+            result = SITES[source].parse(generate_page(source, 25), SITES[source].seeds[0])
+            self.assertEqual(len(result.records), 25)
+            self.assertEqual(len({record.link for record in result.records}), 25)
+
+    def test_run_benchmarks(self):
+        results = run_benchmarks(sizes=[10], repeat=1)
+
+        # Four stages for the recorded page and the generated page of every source.
+        self.assertEqual(len(results), len(SITES) * 2 * 4)
+        for row in results:
+            self.assertGreater(row["cards"], 0)
+            self.assertGreater(row["peak_memory_kib"], 0)
+        # All the benchmarks are rolled back.
+        self.assertEqual(Jobs.objects.count(), 0)
+
+
+class TestLoadTest(TransactionTestCase):
+    """
+    Test Case for the load tests of the web pages.
+    The clients are threads with their own database connections, so the data has to be committed.
+    """
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual([percentile(values, percent) for percent in (50, 95, 99)], [50, 95, 99])
+        self.assertEqual(percentile([7], 99), 7)
+        self.assertIsNone(percentile([], 50))
+
+    def test_run_load_test(self):
+        self.assertEqual(seed_dataset(companies=5, jobs=60, archived=10, skew=1.5, runs=30),
+                         {"companies": 5, "jobs": 60, "archived": 10, "runs": 30})
+        # The first company has the most jobs.
+        counts = list(Company.objects.order_by("id").values_list("job_count", flat=True))
+        self.assertEqual(sum(counts), 60)
+        self.assertEqual(max(counts), counts[0])
+
+        results = run_load_test(clients=2, requests=5)
+        self.assertEqual([row["name"] for row in results], list(DEFAULT_BUDGETS))
+        for row in results:
+            self.assertEqual((row["requests"], row["errors"]), (5, 0))
+            self.assertLessEqual(row["p50_ms"], row["p99_ms"])
+            self.assertGreater(row["bytes_mean"], 0)
+        self.assertEqual([failure for failure in check_budgets(results) if "queries" in failure], [])
+
+        # A page over its budget fails.
+        failures = check_budgets(results, {"homepage": {"queries": 0, "p95_ms": 0}})
+        self.assertEqual(len(failures), 2)
+        self.assertTrue(all(failure.startswith("homepage:") for failure in failures))
@@ -0,0 +1,118 @@
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.test import TransactionTestCase, override_settings
+from django_aggregator.asgi import application
+from django_jobs.events import get_hub
+from django_jobs.models import Jobs, Company
+import datetime
+import json
+
+
+def create_job(company, number):
+    return Jobs.objects.create(
+        title=f"Job {number}",
+        company=company,
+        date=datetime.date(2021, 4, 27),
+        link=f"https://some-link-{number}",
+    )
+
+
+def parse_events(body):
+    # The (id, jobs) of every event in the body, without the keepalive comments.
+    events = []
+    for block in body.decode().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if not line.startswith(":"))
+        if fields:
+            events.append((int(fields["id"]), json.loads(fields["data"])))
+    return events
+
+
+@override_settings(JOBS_EVENTS_POLL_INTERVAL=0.01, JOBS_EVENTS_KEEPALIVE=5, JOBS_EVENTS_QUEUE_SIZE=2)
+class TestJobEvents(TransactionTestCase):
+    """
+    Test Case for the stream of new jobs served by the ASGI application.
+    We are checking the events the subscribers get, the catching up after a reconnect and the slow clients.
+    The application reads the database from another thread, so the jobs have to be committed.
+    """
+    def setUp(self):
+        self.company = Company.objects.create(name="Company One")
+        self.jobs = [create_job(self.company, number) for number in range(1, 3)]
+
+    def connect(self, headers=(), query_string=b""):
+        return ApplicationCommunicator(application, {
+            "type": "http",
+            "method": "GET",
+            "path": "/events/jobs/",
+            "headers": list(headers),
+            "query_string": query_string,
+        })
+
+    async def receive_event(self, communicator):
+        while True:
+            message = await communicator.receive_output(2)
+            events = parse_events(message["body"])
+            if events:
+                return events
+
+    async def disconnect(self, communicator):
+        await communicator.send_input({"type": "http.disconnect"})
+        await communicator.wait(2)
+
+    async def test_subscribers(self):
+        # Two subscribers get every new batch of jobs, published once by the hub.
+        first, second = self.connect(), self.connect()
+        for communicator in (first, second):
+            await communicator.send_input({"type": "http.request"})
+            start = await communicator.receive_output(2)
+            self.assertEqual(start["status"], 200)
+            self.assertIn((b"content-type", b"text/event-stream; charset=utf-8"), start["headers"])
+            self.assertEqual(await communicator.receive_output(2), {
+                "type": "http.response.body", "body": b": keepalive\n\n", "more_body": True,
+            })
+        self.assertEqual(len(get_hub().subscribers), 2)
+
+        job = await sync_to_async(create_job)(self.company, 3)
+        for communicator in (first, second):
+            [(event_id, jobs)] = await self.receive_event(communicator)
+            self.assertEqual(event_id, job.id)
+            self.assertEqual([(data["id"], data["title"], data["company"]) for data in jobs],
+                             [(job.id, "Job 3", "Company One")])
+
+        # The polling stops with the last subscriber.
+        for communicator in (first, second):
+            await self.disconnect(communicator)
+        self.assertEqual(get_hub().subscribers, set())
+        self.assertIsNone(get_hub()._poller)
+
+    async def test_reconnect(self):
+        # A client which comes back gets the jobs it missed, from the id of the last event it got.
+        communicator = self.connect(headers=[(b"last-event-id", str(self.jobs[0].id).encode())])
+        await communicator.send_input({"type": "http.request"})
+        await communicator.receive_output(2)
+        [(event_id, jobs)] = await self.receive_event(communicator)
+        self.assertEqual(event_id, self.jobs[1].id)
+        self.assertEqual([data["title"] for data in jobs], ["Job 2"])
+        await self.disconnect(communicator)
+
+    async def test_replay_before_queue(self):
+        # A job published while a client catches up comes only through the queue, not with the missed jobs too.
+        hub = get_hub()
+        subscriber = await hub.subscribe()
+        self.assertEqual(subscriber.last_id, self.jobs[1].id)
+        hub.publish([{"id": self.jobs[1].id + 1}])
+        self.assertEqual(subscriber.last_id, self.jobs[1].id)
+        self.assertEqual(parse_events(subscriber.queue.get_nowait())[0][0], self.jobs[1].id + 1)
+        hub.unsubscribe(subscriber)
+
+    async def test_slow_subscriber(self):
+        # A subscriber whose queue is full is dropped, and its stream ends.
+        hub = get_hub()
+        subscriber = await hub.subscribe()
+        other = await hub.subscribe()
+        for number in range(3):
+            hub.publish([{"id": 100 + number}])
+        self.assertNotIn(subscriber, hub.subscribers)
+        self.assertIsNone(subscriber.queue.get_nowait())
+        hub.unsubscribe(subscriber)
+        hub.unsubscribe(other)
+        self.assertIsNone(hub._poller)
@@ -0,0 +1,240 @@
+from unittest import mock
+from django.contrib import admin
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django_jobs.admin import JobsAdmin
+from django_jobs.models import Jobs, Company
+from django_jobs.companies import CompanyResolver, get_company_resolver, reset_company_resolver
+from django_jobs.duplicates import collapse_duplicates
+from django_jobs.ingestion import JobRecord, ingest_jobs
+from django_jobs.search import search_jobs
+import datetime
+import io
+
+
+class TestIngestion(TestCase):
+    """
+    Test Case for the bulk ingestion used by the scraping tasks.
+    We are checking that new jobs are inserted, duplicates are skipped and companies are reused.
+    """
+    def test_ingest_jobs(self):
+        # Setting up an existing company and job, so we can see they are reused and not duplicated.
+        company = Company.objects.create(name="Company One")
+        Jobs.objects.create(
+            title="Job One",
+            company=company,
+            date=datetime.date(2021, 4, 15),
+            link="https://some-link-one",
+        )
+        records = [
+            JobRecord("Job One", "Company One", datetime.date(2021, 4, 15), "https://some-link-one"),
+            JobRecord("Job Two", "Company One", datetime.date(2021, 4, 16), "https://some-link-two"),
+            JobRecord("Job Three", "Company Two", datetime.date(2021, 4, 17), "https://some-link-three"),
+            # The same job twice in a single scrape.
+            JobRecord("Job Three", "Company Two", datetime.date(2021, 4, 17), "https://some-link-three"),
+        ]
+
+        # Companies are resolved in one query and all the new jobs are inserted with one statement.
+        # These jobs are old, so their links are looked up in the archive as well.
+        # The new jobs are added to the duplicate index, which is one lookup and one insert.
+        # The write lock is taken first, and the links are looked up again once we hold it.
+        with self.assertNumQueries(14):
+            result = ingest_jobs(records)
+
+        self.assertEqual(result.inserted, 2)
+        self.assertEqual(result.duplicates, 2)
+        self.assertEqual(Jobs.objects.count(), 3)
+        self.assertEqual(Company.objects.count(), 2)
+        self.assertEqual(Jobs.objects.get(link="https://some-link-two").company, company)
+        # The job counts and the latest dates of the companies are kept up to date.
+        company.refresh_from_db()
+        self.assertEqual((company.job_count, company.latest_job_date), (2, datetime.date(2021, 4, 16)))
+        self.assertEqual(Company.objects.get(name="Company Two").job_count, 1)
+
+        # Running the same scrape again shouldn't insert anything.
+        result = ingest_jobs(records)
+        self.assertEqual(result.inserted, 0)
+        self.assertEqual(result.duplicates, 4)
+        self.assertEqual(Jobs.objects.count(), 3)
+
+    def test_concurrent_insert(self):
+        # Another worker saves one of the jobs after we looked the links up: it isn't ours to count or to cluster.
+        company = Company.objects.create(name="Company One")
+        records = [
+            JobRecord("Job One", "Company One", datetime.date.today(), "https://some-link-one"),
+            JobRecord("Job Two", "Company One", datetime.date.today(), "https://some-link-two"),
+        ]
+        resolve = CompanyResolver.resolve
+
+        def resolve_and_insert(resolver, names):
+            Jobs.objects.create(title="Job One", company=company, date=datetime.date.today(),
+                                link="https://some-link-one")
+            return resolve(resolver, names)
+
+        with mock.patch.object(CompanyResolver, "resolve", resolve_and_insert), \
+                mock.patch("django_jobs.ingestion.assign_clusters", return_value=0) as assign_clusters, \
+                CaptureQueriesContext(connection) as queries:
+            result = ingest_jobs(records)
+        self.assertEqual((result.inserted, result.duplicates), (1, 1))
+        self.assertEqual([job[0] for job in assign_clusters.call_args[0][0]],
+                         [Jobs.objects.get(link="https://some-link-two").id])
+        # On SQLite, the write lock is taken before anything is read inside the transaction.
+        statements = [query["sql"] for query in queries]
+        first_savepoint = next(index for index, sql in enumerate(statements) if sql.startswith("SAVEPOINT"))
+        self.assertTrue(statements[first_savepoint + 1].startswith('UPDATE "django_jobs_jobs"'))
+
+    def test_copy_insert(self):
+        # With COPY, only the jobs COPY gives the ids of are counted and clustered, the others are duplicates.
+        records = [
+            JobRecord("Job One", "Company One", datetime.date.today(), "https://some-link-one"),
+            JobRecord("Job Two", "Company One", datetime.date.today(), "https://some-link-two"),
+            JobRecord("Job Three", "Company One", datetime.date.today(), "https://some-link-three"),
+        ]
+        job_ids = {"https://some-link-one": 101, "https://some-link-three": 103}
+        with mock.patch("django_jobs.ingestion.uses_copy", return_value=True), \
+                mock.patch("django_jobs.ingestion.copy_jobs", return_value=job_ids) as copy_jobs, \
+                mock.patch("django_jobs.ingestion.assign_clusters", return_value=0) as assign_clusters:
+            result = ingest_jobs(records)
+        self.assertEqual((result.inserted, result.duplicates), (len(job_ids), 1))
+        self.assertEqual([row[3] for row in copy_jobs.call_args[0][1]], [record.link for record in records])
+        self.assertEqual([job[0] for job in assign_clusters.call_args[0][0]], [101, 103])
+
+    def test_company_resolver(self):
+        # Small differences in the company names don't create new companies.
+        existing = Company.objects.create(name="Acme Inc.")
+        resolver = CompanyResolver(max_size=2)
+        names = ["Acme Inc.", "ACME, inc", " Acme ", "Globex", "globex corp", "Initech"]
+
+        # One lookup, one insert for the missing companies and one query to read their ids back.
+        with self.captureOnCommitCallbacks(execute=True), self.assertNumQueries(3):
+            ids = resolver.resolve(names)
+        self.assertEqual({ids["Acme Inc."], ids["ACME, inc"], ids[" Acme "]}, {existing.id})
+        self.assertEqual(ids["Globex"], ids["globex corp"])
+        self.assertEqual(Company.objects.count(), 3)
+        self.assertEqual(Company.objects.get(id=ids["Globex"]).name, "Globex")
+
+        # The recently used companies come from the cache, the oldest one was dropped.
+        self.assertEqual(len(resolver), 2)
+        with self.assertNumQueries(0):
+            self.assertEqual(resolver.resolve(["GLOBEX", "Initech Ltd"]), {
+                "GLOBEX": ids["Globex"], "Initech Ltd": ids["Initech"],
+            })
+        with self.assertNumQueries(1):
+            self.assertEqual(resolver.resolve(["acme"]), {"acme": existing.id})
+
+    def test_company_resolver_signals(self):
+        # A renamed or deleted company is dropped from the cache of the process.
+        resolver = get_company_resolver()
+        resolver.clear()
+        self.addCleanup(reset_company_resolver)
+        with self.captureOnCommitCallbacks(execute=True):
+            acme_id = resolver.resolve(["Acme"])["Acme"]
+            globex_id = resolver.resolve(["Globex"])["Globex"]
+        self.assertEqual(len(resolver), 2)
+
+        Company.objects.get(id=acme_id).delete()
+        self.assertEqual(len(resolver), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            ids = resolver.resolve(["Acme", "Globex"])
+        self.assertNotEqual(ids["Acme"], acme_id)
+        self.assertEqual(ids["Globex"], globex_id)
+
+        company = Company.objects.get(id=globex_id)
+        company.name = "Globex International"
+        company.save()
+        self.assertEqual(len(resolver), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(resolver.resolve(["Globex International"]), {"Globex International": globex_id})
+
+    def test_company_names(self):
+        # A name without letters or digits keeps its own company.
+        resolver = CompanyResolver()
+        with self.captureOnCommitCallbacks(execute=True):
+            ids = resolver.resolve(["???", "+++", " +++ "])
+        self.assertEqual(ids["+++"], ids[" +++ "])
+        self.assertNotEqual(ids["???"], ids["+++"])
+        self.assertEqual(Company.objects.get(id=ids["???"]).normalized_name, "???")
+
+        # The admin shows an error instead of failing on the unique constraint.
+        Company.objects.create(name="Acme Inc.")
+        form = admin.site._registry[Company].get_form(None)(data={"name": "ACME, inc", "job_count": 0})
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors["name"], ["This is the same company as 'Acme Inc.'."])
+        form = admin.site._registry[Company].get_form(None)(data={"name": "Globex", "job_count": 0})
+        self.assertTrue(form.is_valid())
+
+    def test_near_duplicates(self):
+        # The same job from three sources, written a bit differently, and a different job of the same company.
+        day = datetime.date(2021, 4, 15)
+        ingest_jobs([JobRecord("Senior Python Developer", "Acme", day, "https://remote.co/job/1")])
+        ingest_jobs([
+            JobRecord("Sr. Python Developer (Remote)", "Acme, Inc.", day, "https://weworkremotely.com/job/1"),
+            JobRecord("Frontend Developer", "Acme", day, "https://weworkremotely.com/job/2"),
+        ])
+        ingest_jobs([JobRecord("Senior Python Developer", "ACME Inc", day + datetime.timedelta(days=2),
+                               "https://remotive.io/job/1")])
+        # The same title much later is a new posting.
+        ingest_jobs([JobRecord("Senior Python Developer", "Acme", day + datetime.timedelta(days=90),
+                               "https://remotive.io/job/2")])
+
+        first = Jobs.objects.get(link="https://remote.co/job/1")
+        self.assertIsNone(first.cluster_id)
+        self.assertEqual(
+            set(Jobs.objects.filter(cluster_id=first.id).values_list("link", flat=True)),
+            {"https://weworkremotely.com/job/1", "https://remotive.io/job/1"},
+        )
+        # The listings, the search and the company stats show the first job of the cluster only.
+        self.assertEqual(Company.objects.get(normalized_name="acme").job_count, 3)
+        self.assertEqual(
+            set(collapse_duplicates(Jobs.objects.all()).values_list("link", flat=True)),
+            {"https://remote.co/job/1", "https://weworkremotely.com/job/2", "https://remotive.io/job/2"},
+        )
+        self.assertEqual(
+            [job.link for job in search_jobs("python")],
+            ["https://remotive.io/job/2", "https://remote.co/job/1"],
+        )
+
+        # Two openings of the same source are never the same posting, however alike they are.
+        ingest_jobs([
+            JobRecord("Software Engineer II", "Initech", day, "https://remotive.io/job/3"),
+            JobRecord("Software Engineer III", "Initech", day, "https://www.remotive.io/job/4"),
+        ])
+        self.assertFalse(Jobs.objects.filter(company__name="Initech", cluster_id__isnull=False).exists())
+
+    def test_index_duplicates_command(self):
+        # The jobs saved before the duplicate index existed are indexed and clustered by the command.
+        company = Company.objects.create(name="Acme")
+        for link in ("https://remote.co/job/1", "https://remotive.io/job/1"):
+            Jobs.objects.create(title="Python Developer", company=company, date=datetime.date(2021, 4, 15), link=link)
+
+        output = io.StringIO()
+        call_command("index_duplicates", stdout=output)
+        self.assertIn("Indexed 2 jobs, found 1 duplicates.", output.getvalue())
+        self.assertEqual(collapse_duplicates(Jobs.objects.all()).count(), 1)
+        self.assertEqual(Company.objects.get(name="Acme").job_count, 1)
+
+        # Running it again doesn't do anything.
+        call_command("index_duplicates", stdout=output)
+        self.assertIn("Indexed 0 jobs", output.getvalue())
+
+    def test_delete_canonical_job(self):
+        # Deleting the first job of a group of duplicates in the admin: the next one is listed instead of it.
+        day = datetime.date(2021, 4, 15)
+        ingest_jobs([JobRecord("Senior Python Developer", "Acme", day, "https://remote.co/job/1")])
+        ingest_jobs([JobRecord("Sr. Python Developer", "Acme, Inc.", day, "https://weworkremotely.com/job/1")])
+        ingest_jobs([JobRecord("Senior Python Developer", "ACME", day, "https://remotive.io/job/1")])
+
+        jobs_admin = JobsAdmin(Jobs, admin.site)
+        jobs_admin.delete_queryset(None, Jobs.objects.filter(link="https://remote.co/job/1"))
+        second = Jobs.objects.get(link="https://weworkremotely.com/job/1")
+        self.assertIsNone(second.cluster_id)
+        self.assertEqual(Jobs.objects.get(link="https://remotive.io/job/1").cluster_id, second.id)
+        self.assertEqual(Company.objects.get(normalized_name="acme").job_count, 1)
+
+        jobs_admin.delete_model(None, second)
+        self.assertEqual(
+            list(collapse_duplicates(Jobs.objects.all()).values_list("link", flat=True)), ["https://remotive.io/job/1"],
+        )
+        self.assertEqual(Company.objects.get(normalized_name="acme").job_count, 1)
@@ -0,0 +1,79 @@
+from django.test import TestCase, override_settings
+from django_jobs.models import Jobs, Company, ArchivedJob
+from django_jobs.caching import get_data_version
+from django_jobs.ingestion import JobRecord, ingest_jobs
+from django_jobs.dates import retention_cutoff
+from django_jobs.duplicates import collapse_duplicates
+from django_jobs.retention import archive_old_jobs, search_archive
+from django_jobs.tasks import archive_old_jobs_task
+import datetime
+
+
+class TestRetention(TestCase):
+    """
+    Test Case for moving the old jobs into the archive.
+    We are checking that only the old jobs are moved, in batches, and that they can still be found.
+    """
+    def setUp(self):
+        today = datetime.date.today()
+        ingest_jobs([
+            JobRecord("Old Python Job", "Company One", today - datetime.timedelta(days=400), "https://old-one"),
+            JobRecord("Old Django Job", "Company Two", today - datetime.timedelta(days=300), "https://old-two"),
+            JobRecord("Older Python Job", "Company One", today - datetime.timedelta(days=500), "https://old-three"),
+            JobRecord("New Python Job", "Company One", today, "https://new-one"),
+        ])
+
+    @override_settings(JOBS_RETENTION_DAYS=180)
+    def test_archive_old_jobs(self):
+        # The jobs are moved in two batches: two jobs, then the last one.
+        archived = archive_old_jobs(batch_size=2)
+
+        self.assertEqual(archived, 3)
+        self.assertEqual(list(Jobs.objects.values_list("link", flat=True)), ["https://new-one"])
+        self.assertEqual(ArchivedJob.objects.count(), 3)
+        # The company stats only count the jobs which are left, and the cached pages are invalidated.
+        company = Company.objects.get(name="Company One")
+        self.assertEqual((company.job_count, company.latest_job_date), (1, datetime.date.today()))
+        self.assertEqual(Company.objects.get(name="Company Two").job_count, 0)
+        self.assertEqual(get_data_version(), 1)
+
+        # The archived jobs are still there, through the archive.
+        self.assertEqual(
+            [job.link for job in search_archive(query="python")],
+            ["https://old-one", "https://old-three"],
+        )
+        self.assertEqual([job.title for job in search_archive(company="two")], ["Old Django Job"])
+        self.assertEqual(
+            [job.title for job in search_archive(since=retention_cutoff() - datetime.timedelta(days=150))],
+            ["Old Django Job"],
+        )
+
+        # Nothing is left to archive, and the scrapers don't bring the archived jobs back.
+        self.assertEqual(archive_old_jobs_task(), 0)
+        result = ingest_jobs([
+            JobRecord("Old Python Job", "Company One", datetime.date.today() - datetime.timedelta(days=400),
+                      "https://old-one"),
+        ])
+        self.assertEqual(result.inserted, 0)
+        self.assertFalse(Jobs.objects.filter(link="https://old-one").exists())
+
+    @override_settings(JOBS_RETENTION_DAYS=180)
+    def test_archive_canonical_job(self):
+        # The first job of a group of duplicates is archived: the oldest duplicate left is listed instead of it.
+        today = datetime.date.today()
+        ingest_jobs([JobRecord("Senior Go Developer", "Acme", today - datetime.timedelta(days=185), "https://go-one")])
+        ingest_jobs([
+            JobRecord("Sr. Go Developer", "Acme, Inc.", today - datetime.timedelta(days=175), "https://go-two"),
+            JobRecord("Senior Go Developer", "ACME", today - datetime.timedelta(days=174), "https://go-three"),
+        ])
+        self.assertEqual(Jobs.objects.filter(link__startswith="https://go-").exclude(cluster_id=None).count(), 2)
+        self.assertEqual(Company.objects.get(name="Acme").job_count, 1)
+
+        archive_old_jobs()
+
+        second = Jobs.objects.get(link="https://go-two")
+        self.assertIsNone(second.cluster_id)
+        self.assertEqual(Jobs.objects.get(link="https://go-three").cluster_id, second.id)
+        listed = collapse_duplicates(Jobs.objects.filter(link__startswith="https://go-"))
+        self.assertEqual(list(listed.values_list("link", flat=True)), ["https://go-two"])
+        self.assertEqual(Company.objects.get(name="Acme").job_count, 1)
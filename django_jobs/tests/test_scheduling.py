@@ -0,0 +1,77 @@
+from unittest import mock
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django_jobs.models import ScrapeRun, SourceSchedule
+from django_jobs.scheduling import claim_due_sources, record_runs
+from django_jobs.sites import SITES
+from django_jobs import tasks
+import datetime
+
+
+@override_settings(
+    SCRAPER_MIN_INTERVAL=60 * 60,
+    SCRAPER_MAX_INTERVAL=60 * 60 * 96,
+    SCRAPER_DEFAULT_INTERVAL=60 * 60 * 12,
+    SCRAPER_TARGET_NEW_JOBS=10,
+)
+class TestScheduling(TestCase):
+    """
+    Test Case for the adaptive scheduler of the scrapers.
+    We are checking that busy sources are scraped more often, and quiet or failing ones less often.
+    """
+    def run_source(self, source, started, inserted, pages=4, errors=0):
+        return ScrapeRun(
+            source=source,
+            started=started,
+            finished=started + datetime.timedelta(minutes=1),
+            pages=pages,
+            errors=errors,
+            inserted=inserted,
+        )
+
+    def test_claim_due_sources(self):
+        # New sources are due right away, and a claimed source isn't started again before its run is finished.
+        with mock.patch.object(tasks, "dispatch_wave") as dispatch_wave:
+            self.assertEqual(sorted(tasks.dispatch_due_scrapes()), sorted(SITES))
+            dispatch_wave.assert_called_once()
+            self.assertEqual(claim_due_sources(), [])
+
+        # The schedules are in the database, so they survive a restart.
+        later = timezone.now() + datetime.timedelta(hours=13)
+        self.assertEqual(sorted(claim_due_sources(now=later)), sorted(SITES))
+
+    def test_record_runs(self):
+        claim_due_sources()
+        now = timezone.now()
+        # A source which posts a lot, a quiet one and one which is down.
+        record_runs([
+            self.run_source("remote_co", now, inserted=120),
+            self.run_source("weworkremotely", now, inserted=0),
+            self.run_source("remotive", now, inserted=0, errors=4),
+        ])
+        schedules = {schedule.source: schedule for schedule in SourceSchedule.objects.all()}
+
+        # 120 jobs in 12 hours is 10 per hour, the target of 10 jobs per run would be 1 hour.
+        # The interval changes at most by half per run, though.
+        self.assertAlmostEqual(schedules["remote_co"].rate, 10)
+        self.assertEqual(schedules["remote_co"].interval, 60 * 60 * 6)
+        self.assertEqual(
+            schedules["remote_co"].next_run,
+            now + datetime.timedelta(minutes=1) + datetime.timedelta(hours=6),
+        )
+        # Nothing new and the failures make the interval longer.
+        self.assertEqual(schedules["weworkremotely"].interval, 60 * 60 * 24)
+        self.assertEqual(schedules["remotive"].interval, 60 * 60 * 24)
+        self.assertEqual(schedules["remotive"].failures, 1)
+        self.assertIsNone(schedules["remotive"].last_run)
+
+        # Next time, the busy source gets closer to the interval it needs, within the bounds.
+        record_runs([
+            self.run_source("remote_co", now + datetime.timedelta(hours=6), inserted=60),
+            self.run_source("remotive", now + datetime.timedelta(hours=24), inserted=0, errors=4),
+        ])
+        remote_co = SourceSchedule.objects.get(source="remote_co")
+        self.assertAlmostEqual(remote_co.rate, 10)
+        self.assertEqual(remote_co.interval, 60 * 60 * 3)
+        remotive = SourceSchedule.objects.get(source="remotive")
+        self.assertEqual((remotive.interval, remotive.failures), (60 * 60 * 48, 2))
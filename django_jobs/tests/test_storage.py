@@ -0,0 +1,82 @@
+from django.db import connection
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.test import TestCase, override_settings
+from django_jobs.storage import copy_jobs, uses_copy
+import os
+import tempfile
+
+
+class FakeCursor:
+    # Remembers the statements and the data loaded with COPY, and returns the given rows.
+    def __init__(self, rows):
+        self.rows = rows
+        self.statements = []
+        self.copied = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, sql, params=None):
+        self.statements.append(sql)
+
+    def copy_expert(self, sql, file):
+        self.statements.append(sql)
+        self.copied = file.read()
+
+    def fetchall(self):
+        return self.rows
+
+
+class FakeOperations:
+    def quote_name(self, name):
+        return f'"{name}"'
+
+
+class FakeConnection:
+    # A PostgreSQL connection, without psycopg2.
+    vendor = "postgresql"
+
+    def __init__(self, cursor):
+        self.ops = FakeOperations()
+        self._cursor = cursor
+
+    def cursor(self):
+        return self._cursor
+
+
+@override_settings(SQLITE_JOURNAL_MODE="WAL", SQLITE_SYNCHRONOUS="NORMAL", SQLITE_BUSY_TIMEOUT=1234)
+class TestStorage(TestCase):
+    """
+    Test Case for the storage backends.
+    We are checking the PRAGMAs of the SQLite connections and the COPY ingestion of PostgreSQL.
+    """
+    def test_sqlite_pragmas(self):
+        # Every new connection is switched to WAL (the test database is in memory, so a file is used here).
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        wrapper = DatabaseWrapper(dict(connection.settings_dict, NAME=os.path.join(directory.name, "db.sqlite3")))
+        self.addCleanup(wrapper.close)
+        with wrapper.cursor() as cursor:
+            values = [cursor.execute(f"PRAGMA {name}").fetchone()[0]
+                      for name in ("journal_mode", "synchronous", "busy_timeout")]
+        self.assertEqual(values, ["wal", 1, 1234])
+
+    def test_copy_jobs(self):
+        # The jobs go through the staging table, and the ids of the inserted ones come back.
+        self.assertFalse(uses_copy(connection))
+        with override_settings(SCRAPER_INGEST_COPY=True):
+            self.assertTrue(uses_copy(FakeConnection(None)))
+
+        cursor = FakeCursor([("https://some-link-1", 10)])
+        job_ids = copy_jobs(FakeConnection(cursor), [
+            ("Job, One", 1, "2021-04-27", "https://some-link-1"),
+            ("Job Two", 2, "2021-04-27", "https://some-link-2"),
+        ])
+        self.assertEqual(job_ids, {"https://some-link-1": 10})
+        self.assertEqual(cursor.copied, '"Job, One",1,2021-04-27,https://some-link-1\r\n'
+                                        'Job Two,2,2021-04-27,https://some-link-2\r\n')
+        self.assertIn('COPY "django_jobs_jobs_staging"', cursor.statements[1])
+        self.assertIn('ON CONFLICT ("link") DO NOTHING RETURNING "link", "id"', cursor.statements[2])
@@ -0,0 +1,586 @@
+from unittest import mock
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django_jobs.models import Jobs, PageValidator, ScrapeRun, PageSnapshot, SourceSchedule
+from django_jobs.fetching import FetchEngine
+from django_jobs.frontier import CrawlFrontier, crawl
+from django_jobs.known_links import CrawlLinks, KnownLinkIndex, reset_known_links
+from django_jobs.metrics import ScrapeMetrics
+from django_jobs.sites import SITES, css_to_xpath, detect_encoding, header_encoding
+from django_jobs.caching import get_data_version
+from django_jobs.snapshots import iter_snapshot, read_snapshot, snapshot_path
+from django_jobs import pipeline, tasks
+from celery import current_app
+from pathlib import Path
+import codecs
+import datetime
+import io
+import json
+import tempfile
+import threading
+import time
+
+
+REMOTE_CO_PAGE = """
+<html><body>
+<a class="card m-0 border-left-0 border-right-0 border-top-0 border-bottom" href="/job/python-developer/">
+    <span class="font-weight-bold larger">Python Developer</span>
+    <p class="m-0 text-secondary">Company One<span> | <small>Full-time</small></span></p>
+    <date>3 weeks ago</date>
+</a>
+<a class="page-numbers" href="/remote-jobs/developer/">1</a>
+<a class="page-numbers" href="/remote-jobs/developer/page/2/">2</a>
+</body></html>
+"""
+
+REMOTE_CO_SECOND_PAGE = """
+<html><body>
+<a class="card m-0 border-left-0 border-right-0 border-top-0 border-bottom" href="/job/django-developer/">
+    <span class="font-weight-bold larger">Django Developer</span>
+    <p class="m-0 text-secondary">Company One<span> | <small>Full-time</small></span></p>
+    <date>5 hours ago</date>
+</a>
+<a class="page-numbers" href="/remote-jobs/developer/">1</a>
+<a class="page-numbers" href="/remote-jobs/developer/page/2/">2</a>
+</body></html>
+"""
+
+WEWORKREMOTELY_PAGE = """
+<html><body><ul>
+<li class="feature">
+    <a href="/company/company-two">Logo</a>
+    <a href="/remote-jobs/company-two-backend-engineer">
+        <span class="company">Company Two</span>
+        <span class="title">Backend Engineer</span>
+        <span class="company">Anywhere</span>
+        <span class="date"><time datetime="2021-04-20T10:00:00Z">Apr 20</time></span>
+    </a>
+</li>
+</ul></body></html>
+"""
+
+REMOTIVE_PAGE = """
+<html><body><ul>
+<li class="tw-cursor-pointer">
+    <a class="job-tile-title" href="remote-jobs/software-dev/frontend-developer-1">Frontend Developer</a>
+    <span itemprop="hiringOrganization">Company Three</span>
+    <span itemprop="datePosted">2021-04-21 08:30:00</span>
+</li>
+</ul></body></html>
+"""
+
+
+class FakeResponse:
+    # A small stand-in for requests.Response, with only the parts the scrapers are using.
+    def __init__(self, content, status_code=200, headers=None):
+        self.content = content.encode()
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.chunks_read = 0
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.content), chunk_size):
+            self.chunks_read += 1
+            yield self.content[start:start + chunk_size]
+
+    def close(self):
+        pass
+
+
+PAGES = {
+    "https://remote.co/remote-jobs/developer/": REMOTE_CO_PAGE,
+    "https://remote.co/remote-jobs/developer/page/2/": REMOTE_CO_SECOND_PAGE,
+    "https://weworkremotely.com/categories/remote-programming-jobs": WEWORKREMOTELY_PAGE,
+    "https://remotive.io/remote-jobs/software-dev": REMOTIVE_PAGE,
+}
+
+
+def fake_fetch(engine, url, headers=None, stream=False):
+    return FakeResponse(PAGES.get(url, "<html></html>"))
+
+
+class TestScrapingTasks(TestCase):
+    """
+    Test Case for the scraping tasks.
+    HTTP is stubbed out, so we are checking only the parsing and saving of the jobs.
+    """
+    def setUp(self):
+        # Every test gets its own engine, so no real sessions are shared between the tests.
+        self.engine = FetchEngine(max_workers=2, per_host_limit=1, timeout=1)
+        patcher = mock.patch.object(tasks, "get_fetch_engine", return_value=self.engine)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.engine.close)
+        # The known links are kept in memory between the runs, but the database is emptied after every test.
+        reset_known_links()
+        self.addCleanup(reset_known_links)
+        # The snapshots of the pages go to a temporary directory.
+        snapshot_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(snapshot_dir.cleanup)
+        snapshot_settings = override_settings(SCRAPER_SNAPSHOT_DIR=snapshot_dir.name)
+        snapshot_settings.enable()
+        self.addCleanup(snapshot_settings.disable)
+        self.snapshot_dir = Path(snapshot_dir.name)
+
+    @mock.patch.object(FetchEngine, "fetch", fake_fetch)
+    def test_scrape_all_sources(self):
+        tasks.scrape_all_sources()
+
+        self.assertEqual(Jobs.objects.count(), 4)
+        job = Jobs.objects.get(title="Python Developer")
+        self.assertEqual(job.company.name, "Company One")
+        self.assertEqual(job.link, "https://remote.co/job/python-developer/")
+        self.assertEqual(job.date, datetime.date.today() - datetime.timedelta(days=21))
+
+        job = Jobs.objects.get(title="Backend Engineer")
+        self.assertEqual(job.company.name, "Company Two")
+        self.assertEqual(job.link, "https://weworkremotely.com/remote-jobs/company-two-backend-engineer")
+        self.assertEqual(job.date, datetime.date(2021, 4, 20))
+
+        job = Jobs.objects.get(title="Frontend Developer")
+        self.assertEqual(job.company.name, "Company Three")
+        self.assertEqual(job.date, datetime.date(2021, 4, 21))
+
+        # The second page of the category is found through the pagination links.
+        job = Jobs.objects.get(title="Django Developer")
+        self.assertEqual(job.date, datetime.date.today())
+
+        # The cached pages are invalidated only when new jobs are added.
+        self.assertEqual(get_data_version(), 1)
+
+        # Every source gets the numbers of the run.
+        run = ScrapeRun.objects.get(source="remote_co")
+        self.assertEqual(run.pages, 4)
+        self.assertEqual(run.inserted, 2)
+        self.assertEqual(run.cards_found, 2)
+        self.assertEqual(run.bytes_downloaded, sum(len(page.encode()) for page in (
+            REMOTE_CO_PAGE, REMOTE_CO_SECOND_PAGE, "<html></html>", "<html></html>",
+        )))
+        self.assertGreater(run.parse_seconds, 0)
+
+        # Scraping the same pages again shouldn't create any new jobs.
+        tasks.scrape_all_sources()
+        self.assertEqual(Jobs.objects.count(), 4)
+        self.assertEqual(get_data_version(), 1)
+
+    @mock.patch.object(FetchEngine, "fetch", fake_fetch)
+    def test_pipeline(self):
+        # The stages run one after another in the test, the chords included.
+        current_app.conf.task_always_eager = True
+        self.addCleanup(setattr, current_app.conf, "task_always_eager", False)
+        with mock.patch.object(pipeline, "ingest_jobs", wraps=pipeline.ingest_jobs) as ingest_jobs:
+            self.assertEqual(tasks.dispatch_due_scrapes(), ["remote_co", "remotive", "weworkremotely"])
+
+        self.assertEqual(Jobs.objects.count(), 4)
+        self.assertEqual(Jobs.objects.get(title="Django Developer").company.name, "Company One")
+        self.assertEqual(get_data_version(), 2)
+        # Two waves: the first pages of all the sources, then the pagination links of remote.co.
+        self.assertEqual(ingest_jobs.call_count, 3 + 1)
+        run = ScrapeRun.objects.get(source="remote_co")
+        self.assertEqual((run.pages, run.inserted, run.cards_found), (4, 2, 2))
+        pages = sum(run.pages for run in ScrapeRun.objects.all())
+        self.assertEqual(PageSnapshot.objects.count(), pages)
+        self.assertEqual(PageValidator.objects.count(), pages)
+
+        # The scheduler learns from the runs of the scheduled scrapes.
+        schedule = SourceSchedule.objects.get(source="remote_co")
+        self.assertEqual(schedule.last_run, run.started)
+        self.assertGreater(schedule.rate, 0)
+
+    def test_pipeline_failures(self):
+        # A page which fails in a stage doesn't fail the wave: the run is finished and the scheduler learns from it.
+        current_app.conf.task_always_eager = True
+        self.addCleanup(setattr, current_app.conf, "task_always_eager", False)
+
+        parse_page = pipeline.parse_page
+
+        def broken_fetch(engine, url, headers=None, stream=False):
+            if "remotive" in url:
+                raise ValueError("Broken page")
+            return fake_fetch(engine, url, headers, stream)
+
+        def broken_parse(page):
+            if page["source"] == "weworkremotely":
+                raise ValueError("Broken parser")
+            return parse_page(page)
+
+        with mock.patch.object(FetchEngine, "fetch", broken_fetch), \
+                mock.patch.object(pipeline, "parse_page", broken_parse):
+            tasks.dispatch_due_scrapes()
+
+        self.assertEqual(Jobs.objects.filter(link__contains="remote.co").count(), 2)
+        self.assertEqual(Jobs.objects.count(), 2)
+        run = ScrapeRun.objects.get(source="remotive")
+        self.assertEqual((run.pages, run.errors), (4, 4))
+        self.assertEqual(ScrapeRun.objects.get(source="weworkremotely").errors, 5)
+        self.assertEqual(SourceSchedule.objects.get(source="remotive").failures, 1)
+
+    @mock.patch.object(FetchEngine, "fetch", fake_fetch)
+    def test_pipeline_stages(self):
+        # Everything the stages pass on is plain JSON, so it can go through the broker.
+        wave, crawl = pipeline.start_crawl(["remotive"])
+        self.assertEqual(wave[0], {
+            "url": "https://remotive.io/remote-jobs/software-dev",
+            "source": "remotive",
+            "headers": {},
+            "known_hash": "",
+            "crawl_links": [],
+        })
+        fetched = json.loads(json.dumps(pipeline.fetch_page(wave[0])))
+        # The parse stage reads the snapshot in chunks, and parses it while it's read.
+        with mock.patch.object(pipeline, "iter_snapshot", wraps=iter_snapshot) as read_chunks:
+            page = pipeline.parse_page(fetched)
+        read_chunks.assert_called_once_with(fetched["content_hash"])
+        self.assertEqual(page["records"], [[
+            "Frontend Developer", "Company Three", "2021-04-21",
+            "https://remotive.io/remote-jobs/software-dev/frontend-developer-1",
+        ]])
+        # The raw page goes to the parse workers through the snapshot directory.
+        self.assertNotIn("content", page)
+        self.assertEqual(read_snapshot(page["content_hash"]), REMOTIVE_PAGE.encode())
+
+        # The jobs are known only once they are saved: after a failed save, the page gives the same jobs again.
+        with mock.patch.object(pipeline, "ingest_jobs", side_effect=ValueError("Broken database")), \
+                self.assertLogs("django_jobs.scraping", "ERROR"):
+            self.assertEqual(pipeline.save_wave([page], ScrapeMetrics()), ([], 0))
+        self.assertEqual(pipeline.parse_page(fetched)["records"], page["records"])
+
+        wave, crawl = pipeline.persist_pages(json.loads(json.dumps([page])), json.loads(json.dumps(crawl)))
+        self.assertEqual(wave, [])
+        self.assertEqual(Jobs.objects.count(), 1)
+        self.assertEqual(ScrapeRun.objects.get(source="remotive").inserted, 1)
+        self.assertEqual(pipeline.parse_page(fetched)["skipped"], 1)
+        # The next waves of the crawl get the links it saved, so they don't count toward their early stop.
+        self.assertEqual(crawl["links"], {"remotive": [page["records"][0][3]]})
+
+        # The next time, the page has the same hash and isn't parsed at all.
+        wave, crawl = pipeline.start_crawl(["remotive"])
+        page = pipeline.parse_page(pipeline.fetch_page(wave[0]))
+        self.assertTrue(page["unchanged"])
+        self.assertNotIn("records", page)
+
+    @mock.patch.object(FetchEngine, "fetch", fake_fetch)
+    @override_settings(SCRAPER_STREAM_CHUNK_SIZE=64, SCRAPER_STREAM_BATCH=1)
+    def test_scrape_streaming(self):
+        # The pages are parsed while they are downloaded, and the result is the same.
+        metrics = tasks.scrape_sources(list(SITES), stream=True)
+        self.assertEqual(Jobs.objects.count(), 4)
+        self.assertEqual(Jobs.objects.get(title="Django Developer").company.name, "Company One")
+        self.assertEqual(metrics.counters["remote_co"]["pages"], 4)
+        self.assertEqual(metrics.counters["remote_co"]["bytes_downloaded"], sum(len(page.encode()) for page in (
+            REMOTE_CO_PAGE, REMOTE_CO_SECOND_PAGE, "<html></html>", "<html></html>",
+        )))
+        # The whole pages were read, so they have their hashes and snapshots.
+        validator = PageValidator.objects.get(url="https://remotive.io/remote-jobs/software-dev")
+        self.assertEqual(read_snapshot(validator.content_hash), REMOTIVE_PAGE.encode())
+        self.assertEqual(PageSnapshot.objects.count(), sum(run.pages for run in ScrapeRun.objects.all()))
+
+    def test_scrape_streaming_stops_early(self):
+        # Once we reach the jobs we already have, the rest of the page isn't downloaded.
+        cards = "".join(
+            f'<li class="tw-cursor-pointer"><a class="job-tile-title" href="job-{i}">Job {i}</a>'
+            f'<span itemprop="hiringOrganization">Company</span>'
+            f'<span itemprop="datePosted">2021-04-21 08:30:00</span></li>'
+            for i in range(50)
+        )
+        response = FakeResponse(f"<ul>{cards}</ul>")
+        url = "https://remotive.io/remote-jobs/software-dev"
+        with override_settings(SCRAPER_STREAM_CHUNK_SIZE=256):
+            tasks.scrape_page_stream(url, "remotive", response, None)
+            chunks = response.chunks_read
+            self.assertEqual(Jobs.objects.count(), 50)
+
+            response = FakeResponse(f"<ul>{cards}</ul>")
+            metrics = ScrapeMetrics()
+            validators = {url: PageValidator.objects.get(url=url)}
+            tasks.scrape_page_stream(url, "remotive", response, None, validators=validators, metrics=metrics)
+        self.assertLess(response.chunks_read, chunks / 2)
+        self.assertEqual(metrics.counters["remotive"]["duplicates"], 3)
+        # Only a part of the page was read, so there is no hash and no snapshot of it.
+        self.assertEqual(PageValidator.objects.get(url=url).content_hash, "")
+        self.assertEqual(PageSnapshot.objects.filter(url=url).count(), 1)
+
+    def test_unchanged_pages_are_skipped(self):
+        # The website sends an ETag and answers with '304 Not Modified' when the client already has the page.
+        sent_headers = []
+
+        def fetch(engine, url, headers=None, stream=False):
+            sent_headers.append(headers or {})
+            if url == "https://remotive.io/remote-jobs/software-dev":
+                if (headers or {}).get("If-None-Match") == '"v1"':
+                    return FakeResponse("", status_code=304)
+                return FakeResponse(REMOTIVE_PAGE, headers={"ETag": '"v1"'})
+            return FakeResponse(PAGES.get(url, "<html></html>"))
+
+        with mock.patch.object(FetchEngine, "fetch", fetch):
+            tasks.scrape_all_sources()
+            self.assertEqual(PageValidator.objects.get(url="https://remotive.io/remote-jobs/software-dev").etag, '"v1"')
+
+            # On the second run, nothing is parsed or saved: one page answers with 304 and the rest have the same hash.
+            sent_headers.clear()
+            with mock.patch.object(tasks, "ingest_jobs") as ingest_jobs:
+                tasks.scrape_all_sources()
+            ingest_jobs.assert_not_called()
+            self.assertIn({"If-None-Match": '"v1"'}, sent_headers)
+
+    @mock.patch.object(FetchEngine, "fetch", fake_fetch)
+    def test_snapshots(self):
+        # Every fetched page is kept, compressed and named after its hash, so the same page is stored only once.
+        tasks.scrape_all_sources()
+        tasks.scrape_all_sources()
+        snapshot = PageSnapshot.objects.filter(url="https://remotive.io/remote-jobs/software-dev").first()
+        self.assertEqual(read_snapshot(snapshot.content_hash), REMOTIVE_PAGE.encode())
+        self.assertTrue(snapshot_path(snapshot.content_hash).exists())
+        self.assertEqual(PageSnapshot.objects.count(), sum(run.pages for run in ScrapeRun.objects.all()))
+        files = list(self.snapshot_dir.glob("*/*.html.gz"))
+        self.assertEqual(len(files), PageSnapshot.objects.values("content_hash").distinct().count())
+
+        # The jobs missed by the parsers can be brought back from the snapshots, without the network.
+        Jobs.objects.filter(link__startswith="https://remote.co").delete()
+        output = io.StringIO()
+        with mock.patch.object(FetchEngine, "fetch") as fetch:
+            call_command("reparse_snapshots", "--source", "remote_co", "--since", "2021-01-01", stdout=output)
+        fetch.assert_not_called()
+        self.assertEqual(Jobs.objects.filter(link__startswith="https://remote.co").count(), 2)
+        self.assertIn("2 new jobs", output.getvalue())
+
+
+class BlockingSession:
+    # A requests.Session which holds every request for a moment, and counts the requests in flight per host.
+    created = []
+
+    def __init__(self):
+        self.active = 0
+        self.max_active = 0
+        self.urls = []
+        self._lock = threading.Lock()
+        BlockingSession.created.append(self)
+
+    def mount(self, prefix, adapter):
+        self.adapter = adapter
+
+    def get(self, url, headers=None, timeout=None, stream=False):
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            self.urls.append(url)
+        time.sleep(0.05)
+        with self._lock:
+            self.active -= 1
+        return FakeResponse("<html></html>")
+
+    def close(self):
+        pass
+
+
+class TestFetchEngine(TestCase):
+    """
+    Test Case for the engine which downloads the pages.
+    We are checking the sessions of the hosts and the limit of the requests sent to a host at the same time.
+    """
+    def test_per_host_limit(self):
+        BlockingSession.created = []
+        limiter = mock.Mock(**{"wait.return_value": 0})
+        engine = FetchEngine(max_workers=8, per_host_limit=2, timeout=1, limiter=limiter)
+        self.addCleanup(engine.close)
+        urls = [f"https://remote.co/page/{number}/" for number in range(6)]
+        urls += [f"https://remotive.io/page/{number}/" for number in range(2)]
+        frontier = CrawlFrontier(max_pages=len(urls))
+        for url in urls:
+            frontier.add(url, url.split("/")[2])
+        results = []
+        with mock.patch("django_jobs.fetching.requests.Session", BlockingSession):
+            crawl(engine, frontier, lambda url, source, response, error: results.append((url, error)) or [])
+
+        self.assertEqual(sorted(url for url, error in results), sorted(urls))
+        self.assertTrue(all(error is None for url, error in results))
+        # One session (and one connection pool) per host, reused for all its pages.
+        self.assertEqual(len(BlockingSession.created), 2)
+        sessions = {session.urls[0].split("/")[2]: session for session in BlockingSession.created}
+        self.assertEqual(len(sessions["remote.co"].urls), 6)
+        self.assertEqual(sessions["remote.co"].adapter._pool_maxsize, 2)
+        # There were 8 threads, but never more than 2 requests to one host at the same time.
+        self.assertEqual(sessions["remote.co"].max_active, 2)
+        self.assertEqual(limiter.record.call_count, 8)
+
+    def test_streamed_response_holds_host(self):
+        # A streamed response keeps its place in the limit of the host until its body is read or it's closed.
+        limiter = mock.Mock(**{"wait.return_value": 0})
+        engine = FetchEngine(max_workers=2, per_host_limit=1, timeout=1, limiter=limiter)
+        self.addCleanup(engine.close)
+        with mock.patch("django_jobs.fetching.requests.Session", BlockingSession):
+            response = engine.fetch("https://remote.co/page/1/", stream=True)
+            limit = engine._host_limits["remote.co"]
+            self.assertFalse(limit.acquire(blocking=False))
+            self.assertEqual(b"".join(response.iter_content(4)), b"<html></html>")
+            self.assertTrue(limit.acquire(blocking=False))
+            limit.release()
+
+            response = engine.fetch("https://remote.co/page/2/", stream=True)
+            self.assertFalse(limit.acquire(blocking=False))
+            # Closing it twice (or after reading it) releases the place only once.
+            response.close()
+            response.close()
+            self.assertTrue(limit.acquire(blocking=False))
+            limit.release()
+
+            # Without 'stream', the body is already read when fetch returns.
+            engine.fetch("https://remote.co/page/3/")
+            self.assertTrue(limit.acquire(blocking=False))
+            limit.release()
+
+
+class TestCrawlFrontier(TestCase):
+    """Test Case for the queue of pages waiting to be scraped."""
+    def test_frontier(self):
+        frontier = CrawlFrontier(max_pages=2)
+
+        self.assertTrue(frontier.add("https://remote.co/remote-jobs/developer/", "remote_co"))
+        # The same url (with or without a fragment) is queued only once.
+        self.assertFalse(frontier.add("https://remote.co/remote-jobs/developer/#top", "remote_co"))
+        self.assertTrue(frontier.add("https://remote.co/remote-jobs/developer/page/2/", "remote_co"))
+        # The source reached its limit of pages.
+        self.assertFalse(frontier.add("https://remote.co/remote-jobs/developer/page/3/", "remote_co"))
+        # Other sources have their own limit.
+        self.assertTrue(frontier.add("https://remotive.io/remote-jobs/software-dev", "remotive"))
+
+        self.assertEqual(len(frontier), 3)
+        self.assertEqual(frontier.pop(), ("https://remote.co/remote-jobs/developer/", "remote_co"))
+        self.assertEqual(len(frontier), 2)
+
+    def test_crawl_failures(self):
+        # A url which fails in any way doesn't stop the crawl: the other urls and their next pages are still crawled.
+        engine = FetchEngine(max_workers=1, per_host_limit=1, timeout=1)
+        self.addCleanup(engine.close)
+        frontier = CrawlFrontier()
+        for url in ("https://remote.co/1", "https://remote.co/2", "https://remote.co/3"):
+            frontier.add(url, "remote_co")
+        handled = []
+
+        def broken_fetch(url, headers=None, stream=False):
+            if url.endswith("/1"):
+                raise ValueError("Malformed url")
+            return FakeResponse("")
+
+        def handle_page(url, source, response, error):
+            handled.append((url, type(error).__name__ if error else None))
+            if url.endswith("/2"):
+                raise ValueError("Broken page")
+            return ["https://remote.co/4"] if url.endswith("/3") else []
+
+        with mock.patch.object(engine, "fetch", broken_fetch), self.assertLogs("django_jobs.scraping", "ERROR"):
+            crawl(engine, frontier, handle_page)
+        self.assertEqual(sorted(handled), [
+            ("https://remote.co/1", "ValueError"), ("https://remote.co/2", None),
+            ("https://remote.co/3", None), ("https://remote.co/4", None),
+        ])
+
+
+class TestSiteSpecs(TestCase):
+    """Test Case for the site specs, which are used to parse the listing pages."""
+    def test_parser_backends(self):
+        # Both parser backends should give the same jobs and pagination links.
+        spec = SITES["remote_co"]
+        results = []
+        for backend in ("html.parser", "lxml"):
+            with override_settings(SCRAPER_PARSER=backend):
+                results.append(spec.parse(REMOTE_CO_PAGE.encode(), "https://remote.co/remote-jobs/developer/"))
+
+        self.assertEqual(results[0], results[1])
+        self.assertEqual([record.company for record in results[0].records], ["Company One"])
+        self.assertEqual(results[0].links, [
+            "https://remote.co/remote-jobs/developer/",
+            "https://remote.co/remote-jobs/developer/page/2/",
+        ])
+        self.assertFalse(results[0].failures)
+
+    def test_xpath(self):
+        # The selectors of the specs are translated to XPath for lxml, the ones we can't translate are left alone.
+        self.assertEqual(
+            css_to_xpath("span.date time, a[href^='/jobs/']"),
+            ".//span[contains(concat(' ', normalize-space(@class), ' '), ' date ')]//time"
+            " | .//a[starts-with(@href, '/jobs/')]",
+        )
+        self.assertIsNone(css_to_xpath("li > a"))
+        self.assertTrue(all(spec.xpath_ready for spec in SITES.values()))
+        # The encoding comes from the page itself, and the page is decoded the same way by both backends.
+        page = '<html><head><meta charset="iso-8859-1"></head><body>' + REMOTIVE_PAGE.replace(
+            "Company Three", "Compañía Tres") + "</body></html>"
+        self.assertEqual(detect_encoding(page.encode("latin-1")), "iso8859-1")
+        self.assertEqual(detect_encoding(codecs.BOM_UTF8 + b"<html>"), "utf-8")
+        for backend in ("html.parser", "lxml"):
+            with override_settings(SCRAPER_PARSER=backend):
+                result = SITES["remotive"].parse(page.encode("latin-1"), SITES["remotive"].seeds[0])
+            self.assertEqual([record.company for record in result.records], ["Compañía Tres"])
+
+    def test_streaming(self):
+        # Parsing the pages from small chunks gives the same jobs and links as parsing the whole pages.
+        for name, page in (("remote_co", REMOTE_CO_PAGE), ("weworkremotely", WEWORKREMOTELY_PAGE),
+                           ("remotive", REMOTIVE_PAGE.replace("Company Three", "Compañía Tres"))):
+            spec = SITES[name]
+            content = page.encode()
+            stream = spec.stream((content[start:start + 7] for start in range(0, len(content), 7)), spec.seeds[0])
+            result = spec.parse(content, spec.seeds[0])
+            self.assertEqual(list(stream), result.records)
+            self.assertEqual(stream.links, result.links)
+            self.assertFalse(stream.failures)
+
+        # The page is decoded with the encoding of the Content-Type header, or the one at the start of the page.
+        page = REMOTIVE_PAGE.replace("Company Three", "Compañía Tres")
+        content = page.replace("<html>", '<html><head><meta charset="windows-1252"></head>').encode("cp1252")
+        for encoding, chunk_size in ((None, 7), (None, 4096), ("cp1252", 7)):
+            stream = SITES["remotive"].stream(
+                (content[start:start + chunk_size] for start in range(0, len(content), chunk_size)),
+                SITES["remotive"].seeds[0], encoding=encoding,
+            )
+            self.assertEqual([record.company for record in stream], ["Compañía Tres"])
+        self.assertEqual(header_encoding({"Content-Type": "text/html; charset=ISO-8859-1"}), "iso8859-1")
+        self.assertIsNone(header_encoding({"Content-Type": "text/html"}))
+
+        # The jobs are yielded as soon as their cards are closed, before the rest of the page arrives.
+        chunks = iter([REMOTIVE_PAGE.encode(), b"<li class='tw-cursor-pointer'>"])
+        stream = iter(SITES["remotive"].stream(chunks, SITES["remotive"].seeds[0]))
+        self.assertEqual(next(stream).company, "Company Three")
+        self.assertEqual(next(chunks), b"<li class='tw-cursor-pointer'>")
+
+    def test_missing_fields(self):
+        # The cards with missing fields are skipped and counted, the rest of the page is still saved.
+        broken_card = '<li class="tw-cursor-pointer"><a class="job-tile-title">Job</a></li>'
+        page = REMOTIVE_PAGE.replace("</ul>", f"{broken_card}</ul>")
+        result = SITES["remotive"].parse(page.encode(), "https://remotive.io/remote-jobs/software-dev")
+
+        self.assertEqual(len(result.records), 1)
+        self.assertEqual(result.failures, {"company": 1})
+
+    def test_early_stop(self):
+        # The newest jobs are on the top of the page. Once we reach the jobs we already have, the parsing stops.
+        cards = "".join(
+            f'<li class="tw-cursor-pointer"><a class="job-tile-title" href="job-{i}">Job {i}</a>'
+            f'<span itemprop="hiringOrganization">Company</span>'
+            f'<span itemprop="datePosted">2021-04-21 08:30:00</span></li>'
+            for i in range(10)
+        )
+        page = f'<ul>{cards}</ul><a rel="next" href="?page=2">Next</a>'.encode()
+        # Job 0 is new, job 1 is a known job pinned to the top, job 2 is new, and jobs 3-9 are the ones we already have.
+        known = KnownLinkIndex([f"https://remotive.io/job-{i}" for i in (1, 3, 4, 5, 6, 7, 8, 9)])
+
+        result = SITES["remotive"].parse(page, "https://remotive.io/remote-jobs/software-dev", known, stop_after=3)
+
+        self.assertEqual([record.title for record in result.records], ["Job 0", "Job 2"])
+        self.assertEqual(result.skipped, 4)
+        self.assertTrue(result.stopped)
+        self.assertEqual(result.links, [])
+
+        # The jobs this crawl saved from another category are skipped, but only the jobs we had before the crawl
+        # count toward the early stop: the new jobs 6 and 7 below the shared jobs 3-5 are still found.
+        known = CrawlLinks(KnownLinkIndex([f"https://remotive.io/job-{i}" for i in (1, 8, 9)]))
+        known.add(f"https://remotive.io/job-{i}" for i in (3, 4, 5))
+        result = SITES["remotive"].parse(page, "https://remotive.io/remote-jobs/software-dev", known, stop_after=3)
+        self.assertEqual([record.title for record in result.records], ["Job 0", "Job 2", "Job 6", "Job 7"])
+        self.assertEqual(result.skipped, 6)
+        self.assertFalse(result.stopped)
+
+        # Without the known links, the whole page is parsed and the pagination is followed.
+        result = SITES["remotive"].parse(page, "https://remotive.io/remote-jobs/software-dev")
+        self.assertEqual(len(result.records), 10)
+        self.assertEqual(result.links, ["https://remotive.io/remote-jobs/software-dev?page=2"])
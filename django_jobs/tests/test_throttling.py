@@ -0,0 +1,133 @@
+from unittest import mock
+from django.db import OperationalError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django_jobs.fetching import FetchEngine
+from django_jobs.metrics import prometheus_metrics
+from django_jobs.models import HostThrottle
+from django_jobs import throttling
+from django_jobs.throttling import (
+    DatabaseThrottleStore, HostRateLimiter, MemoryThrottleStore, new_throttle, parse_retry_after, reserve,
+)
+import datetime
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, text="", headers=None):
+        self.status_code = status_code
+        self.text = text
+        self.content = text.encode()
+        self.headers = headers or {}
+
+
+class FakeSession:
+    # Answers with robots.txt and the given pages, and remembers what was asked.
+    def __init__(self, robots="", pages=None):
+        self.robots = robots
+        self.pages = pages or {}
+        self.urls = []
+
+    def get(self, url, headers=None, timeout=None, stream=False):
+        self.urls.append(url)
+        if url.endswith("/robots.txt"):
+            return FakeResponse(text=self.robots)
+        return self.pages.get(url) or FakeResponse(text="<html></html>")
+
+
+@override_settings(SCRAPER_HOST_RATE=1.0, SCRAPER_HOST_MAX_RATE=4.0, SCRAPER_HOST_BURST=2, SCRAPER_ROBOTS_TTL=3600)
+class TestThrottling(TestCase):
+    """
+    Test Case for the rate limits of the hosts.
+    We are checking the token buckets, the answers which slow us down and the limits from robots.txt.
+    """
+    def setUp(self):
+        self.now = timezone.now()
+
+    def test_token_bucket(self):
+        throttle = new_throttle("remote.co", self.now)
+        # A small burst goes right away, the next requests are spread out.
+        self.assertEqual([reserve(throttle, self.now) for i in range(2)], [0, 0])
+        waits = [reserve(throttle, self.now) for i in range(3)]
+        self.assertGreater(waits[0], 0)
+        self.assertLess(waits[0], waits[1])
+        self.assertLess(waits[1], waits[2])
+        # The rate goes up while the host answers normally, but never over the maximum.
+        self.assertAlmostEqual(throttle.rate, 1.25)
+        for i in range(100):
+            reserve(throttle, self.now)
+        self.assertEqual(throttle.rate, 4.0)
+
+    def test_retry_after(self):
+        self.assertEqual(parse_retry_after("120"), 120)
+        self.assertEqual(parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT", now=datetime.datetime(
+            2015, 10, 21, 7, 27, tzinfo=datetime.timezone.utc,
+        )), 60)
+        self.assertIsNone(parse_retry_after("soon"))
+        self.assertIsNone(parse_retry_after(None))
+
+        # The host asks us to wait: the rate is halved and nothing is sent until the time is up.
+        limiter = HostRateLimiter(store=MemoryThrottleStore())
+        limiter._robots["remote.co"] = (None, float("inf"))
+        limiter.record("https://remote.co/remote-jobs/", FakeResponse(429, headers={"Retry-After": "30"}))
+        with mock.patch.object(throttling.time, "sleep") as sleep:
+            waited = limiter.wait("https://remote.co/remote-jobs/")
+        self.assertGreaterEqual(waited, 29)
+        sleep.assert_called_once_with(waited)
+        status = limiter.status()
+        self.assertEqual([(limit["host"], limit["rate"], limit["blocked"]) for limit in status],
+                         [("remote.co", 0.5, True)])
+
+    def test_crawl_delay(self):
+        # robots.txt is downloaded once, and its Crawl-delay caps the rate (without bursts).
+        session = FakeSession(robots="User-agent: *\nCrawl-delay: 5\n")
+        limiter = HostRateLimiter(store=MemoryThrottleStore())
+        with mock.patch.object(throttling.time, "sleep"):
+            waits = [limiter.wait("https://remotive.io/remote-jobs/qa", session) for i in range(3)]
+        self.assertEqual(session.urls, ["https://remotive.io/robots.txt"])
+        for waited, expected in zip(waits, [0, 5, 10]):
+            self.assertAlmostEqual(waited, expected, places=1)
+
+    def test_shared_store(self):
+        # Two workers share the buckets through the database.
+        first = HostRateLimiter(store=DatabaseThrottleStore())
+        second = HostRateLimiter(store=DatabaseThrottleStore())
+        for limiter in (first, second):
+            limiter._robots["weworkremotely.com"] = (None, float("inf"))
+        with mock.patch.object(throttling.time, "sleep"):
+            self.assertEqual(first.wait("https://weworkremotely.com/"), 0)
+            self.assertEqual(second.wait("https://weworkremotely.com/"), 0)
+            self.assertGreater(first.wait("https://weworkremotely.com/"), 0)
+        self.assertLess(HostThrottle.objects.get(host="weworkremotely.com").tokens, 0)
+
+        # On SQLite, the write lock is taken before the bucket is read, so two workers never read the same tokens.
+        with CaptureQueriesContext(connection) as queries:
+            with DatabaseThrottleStore().throttle("weworkremotely.com"):
+                pass
+        statements = [query["sql"] for query in queries if not query["sql"].startswith(("SAVEPOINT", "RELEASE"))]
+        self.assertTrue(statements[0].startswith("UPDATE"))
+        self.assertTrue(statements[1].startswith("SELECT"))
+
+        # The buckets are kept in memory while the database can't be used, with a warning.
+        with mock.patch.object(DatabaseThrottleStore, "throttle", side_effect=OperationalError("locked")), \
+                self.assertLogs("django_jobs.scraping", "WARNING") as logs:
+            self.assertEqual(first.wait("https://weworkremotely.com/"), 0)
+        self.assertEqual(len(first.fallback.all()), 1)
+        self.assertIn("falling back to the memory of this process", logs.output[0])
+
+        # The current wait times are in the metrics.
+        with mock.patch.object(throttling, "_limiter", first):
+            self.assertIn('django_jobs_host_wait_seconds{host="weworkremotely.com"}', prometheus_metrics())
+
+    def test_fetch_engine(self):
+        # Every download waits for its turn, and the answers of the host are recorded.
+        session = FakeSession(pages={"https://remote.co/a": FakeResponse(503, headers={"Retry-After": "10"})})
+        limiter = HostRateLimiter(store=MemoryThrottleStore())
+        engine = FetchEngine(max_workers=1, per_host_limit=1, timeout=1, limiter=limiter)
+        self.addCleanup(engine.close)
+        with mock.patch.object(engine, "_host_state", return_value=(session, mock.MagicMock())), \
+                mock.patch.object(throttling.time, "sleep"):
+            self.assertEqual(engine.fetch("https://remote.co/a").status_code, 503)
+            response = engine.fetch("https://remote.co/b")
+        self.assertGreaterEqual(response.wait_seconds, 9)
+        self.assertEqual(session.urls, ["https://remote.co/robots.txt", "https://remote.co/a", "https://remote.co/b"])
@@ -1,7 +1,27 @@
-from django.test import TestCase
+from django.test import RequestFactory, TestCase, override_settings
 from django.test.client import Client
-from django_jobs.models import Jobs, Company
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.views import generic
+from django_jobs.models import Jobs, Company, ScrapeRun, ArchivedJob
+from django.utils import timezone
+from django_jobs.caching import VersionedCacheMixin, bump_data_version, get_data_version
+from django_jobs.ingestion import JobRecord, ingest_jobs
+from django_jobs.metrics import ScrapeMetrics
+import csv
 import datetime
+import io
+import json
+
+
+class HeadersView(VersionedCacheMixin, generic.View):
+    # A cached page with headers of its own.
+    def get(self, request):
+        response = HttpResponse("Job One", content_type="text/plain; charset=utf-8")
+        response["Vary"] = "Accept-Language"
+        response["Content-Language"] = "en"
+        response["X-Jobs-Count"] = "1"
+        return response
 
 
 class TestViewsets(TestCase):
@@ -12,6 +32,8 @@ class TestViewsets(TestCase):
     def setUp(self):
         # Setting the Client so we can access the response.
         self.client = Client()
+        # The database is emptied after every test, so the cached pages have to go as well.
+        cache.clear()
 
     def test_homepage(self):
         # Testing the Homepage viewset.
@@ -33,6 +55,208 @@ class TestViewsets(TestCase):
         self.assertIn(f"{job.date:%B %d, %Y}".encode(), response.content)
         self.assertTemplateUsed(response, "django_jobs/homepage.html")
 
+    @override_settings(JOBS_PAGE_SIZE=2)
+    def test_homepage_pagination(self):
+        # Testing that the Homepage shows the newest jobs first, split into pages of a fixed size.
+        company = Company.objects.create(name="Company One")
+        jobs = [
+            Jobs.objects.create(
+                title=f"Job {number}",
+                company=company,
+                date=datetime.date(2021, 4, day),
+                link=f"https://some-link-{number}",
+            )
+            for number, day in ((1, 15), (2, 20), (3, 20), (4, 27), (5, 10))
+        ]
+
+        # The jobs and their companies are fetched with a single query (the other one is the data version).
+        with self.assertNumQueries(2):
+            response = self.client.get('')
+        self.assertEqual(list(response.context["jobs_list"]), [jobs[3], jobs[2]])
+
+        # The next page starts right after the last job of the previous page, even when the dates are the same.
+        response = self.client.get('', {'after': response.context["next_cursor"]})
+        self.assertEqual(list(response.context["jobs_list"]), [jobs[1], jobs[0]])
+
+        response = self.client.get('', {'after': response.context["next_cursor"]})
+        self.assertEqual(list(response.context["jobs_list"]), [jobs[4]])
+        self.assertIsNone(response.context["next_cursor"])
+
+        # A broken cursor shows the first page.
+        response = self.client.get('', {'after': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context["jobs_list"]), [jobs[3], jobs[2]])
+
+    def test_page_cache(self):
+        # Testing that the pages are cached until the scrapers add new jobs.
+        company = Company.objects.create(name="Company One")
+        Jobs.objects.create(title="Job One", company=company, link="https://some-link-one")
+        response = self.client.get('')
+        self.assertIn(b"Job One", response.content)
+
+        # A job added without a new data version doesn't show up: the cached page is served with a single query.
+        Jobs.objects.create(title="Job Two", company=company, link="https://some-link-two")
+        with self.assertNumQueries(1):
+            response = self.client.get('')
+        self.assertNotIn(b"Job Two", response.content)
+
+        # After the scrapers add new jobs, the data version goes up and the page is built again.
+        bump_data_version()
+        response = self.client.get('')
+        self.assertIn(b"Job Two", response.content)
+        self.assertEqual(get_data_version(), 1)
+
+    def test_page_cache_headers(self):
+        # The cached page comes back with the headers of the response, not only its content type.
+        request = RequestFactory().get("/headers/")
+        response = HeadersView.as_view()(request)
+        with self.assertNumQueries(1):
+            cached = HeadersView.as_view()(request)
+        self.assertEqual(cached.content, b"Job One")
+        self.assertEqual(list(cached.items()), list(response.items()))
+        self.assertEqual(cached["Vary"], "Accept-Language")
+        self.assertEqual(cached["X-Jobs-Count"], "1")
+
+    def test_metrics(self):
+        # Testing the metrics endpoint, which shows the numbers from the scraping runs in the Prometheus format.
+        now = timezone.now()
+        for inserted in (3, 5):
+            ScrapeRun.objects.create(
+                source="remotive",
+                started=now - datetime.timedelta(minutes=inserted),
+                finished=now,
+                pages=2,
+                inserted=inserted,
+                parse_seconds=0.5,
+            )
+        # The parse failures are added up when the runs are saved.
+        for _ in range(2):
+            metrics = ScrapeMetrics()
+            metrics.add("weworkremotely", pages=1)
+            metrics.add_failures("weworkremotely", {"company": 1})
+            metrics.save()
+        with self.assertNumQueries(4):
+            response = self.client.get('/metrics/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        self.assertIn(b'django_jobs_scrape_runs_total{source="remotive"} 2', response.content)
+        self.assertIn(b'django_jobs_scrape_inserted_total{source="remotive"} 8', response.content)
+        self.assertIn(b'django_jobs_scrape_phase_seconds_total{source="remotive",phase="parse"} 1.0', response.content)
+        self.assertIn(
+            b'django_jobs_scrape_parse_failures_total{source="weworkremotely",field="company"} 2', response.content
+        )
+        # The gauges show the last run.
+        self.assertIn(b'django_jobs_scrape_last_run_inserted{source="remotive"} 3', response.content)
+        self.assertIn(b'django_jobs_scrape_last_run_inserted{source="weworkremotely"} 0', response.content)
+
+    @override_settings(JOBS_EXPORT_CHUNK_SIZE=2)
+    def test_export(self):
+        # Testing the CSV and JSON Lines exports, streamed in chunks, with the date and company filters.
+        company_1 = Company.objects.create(name="Company, One")
+        company_2 = Company.objects.create(name="Company Two")
+        jobs = [
+            Jobs.objects.create(
+                title=f"Job {number}",
+                company=company,
+                date=datetime.date(2021, 4, day),
+                link=f"https://some-link-{number}",
+            )
+            for number, company, day in ((1, company_1, 15), (2, company_2, 20), (3, company_1, 27))
+        ]
+
+        response = self.client.get('/export/jobs.csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertTrue(response["Content-Type"].startswith("text/csv"))
+        # The header and two chunks of rows.
+        chunks = list(response.streaming_content)
+        self.assertEqual(len(chunks), 3)
+        rows = list(csv.reader(io.StringIO(b"".join(chunks).decode())))
+        self.assertEqual(rows[0], ["id", "title", "company_id", "company", "date", "link", "cluster_id"])
+        self.assertEqual(rows[1], [str(jobs[0].id), "Job 1", str(company_1.id), "Company, One", "2021-04-15",
+                                   "https://some-link-1", ""])
+        self.assertEqual([row[1] for row in rows[1:]], ["Job 1", "Job 2", "Job 3"])
+
+        response = self.client.get('/export/jobs.ndjson', {'since': '2021-04-16', 'company': company_1.id})
+        self.assertTrue(response["Content-Type"].startswith("application/x-ndjson"))
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], [{
+            "id": jobs[2].id,
+            "title": "Job 3",
+            "company_id": company_1.id,
+            "company": "Company, One",
+            "date": "2021-04-27",
+            "link": "https://some-link-3",
+            "cluster_id": None,
+        }])
+
+        response = self.client.get('/export/jobs.csv', {'since': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(JOBS_FEED_LIMIT=2)
+    def test_jobs_feed(self):
+        # Testing the JSON feed of new jobs, with its cursor, ETag and compression.
+        company = Company.objects.create(name="Company One")
+        jobs = [
+            Jobs.objects.create(
+                title=f"Job {number}",
+                company=company,
+                date=datetime.date(2021, 4, 27),
+                link=f"https://some-link-{number}",
+            )
+            for number in range(1, 4)
+        ]
+
+        response = self.client.get('/api/jobs/')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([job["title"] for job in data["jobs"]], ["Job 1", "Job 2"])
+        self.assertEqual(data["jobs"][0]["company"], "Company One")
+        self.assertEqual((data["next_since"], data["more"]), (jobs[1].id, True))
+        data = self.client.get('/api/jobs/', {'since': data["next_since"]}).json()
+        self.assertEqual([job["id"] for job in data["jobs"]], [jobs[2].id])
+        self.assertEqual((data["next_since"], data["more"]), (jobs[2].id, False))
+
+        # Nothing new: a single query, and no body.
+        response = self.client.get('/api/jobs/', {'since': jobs[2].id})
+        self.assertEqual(response.json()["jobs"], [])
+        with self.assertNumQueries(1):
+            not_modified = self.client.get('/api/jobs/', {'since': jobs[2].id}, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified["ETag"], response["ETag"])
+        self.assertEqual(not_modified.content, b"")
+
+        # A new job changes the ETag.
+        job = Jobs.objects.create(title="Job 4", company=company, date=datetime.date(2021, 4, 28), link="https://4")
+        response = self.client.get('/api/jobs/', {'since': jobs[2].id}, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual([job["id"] for job in response.json()["jobs"]], [job.id])
+
+        # Large responses are compressed.
+        response = self.client.get('/api/jobs/', HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(self.client.get('/api/jobs/', {'since': 'latest'}).status_code, 400)
+
+    @override_settings(JOBS_PAGE_SIZE=1)
+    def test_archive(self):
+        # Testing the archive page, which searches the old jobs moved out of the Jobs table.
+        for number, company in ((1, "Company One"), (2, "Company Two"), (3, "Company One")):
+            ArchivedJob.objects.create(
+                title=f"Job {number}",
+                company_name=company,
+                date=datetime.date(2020, 1, number),
+                link=f"https://archived-link-{number}",
+            )
+
+        response = self.client.get('/archive/', {'company': 'one'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, "django_jobs/archive.html")
+        self.assertEqual([job.title for job in response.context["jobs_list"]], ["Job 3"])
+        self.assertIn(b"?company=one&page=2", response.content)
+
+        response = self.client.get('/archive/', {'company': 'one', 'page': 2})
+        self.assertEqual([job.title for job in response.context["jobs_list"]], ["Job 1"])
+
     def test_company_detail(self):
         # Testing Company Detail Viewset.
         # Setting up the the few companies so we can see what response is returning and what is not returning.
@@ -132,6 +356,26 @@ class TestViewsets(TestCase):
         self.assertNotIn(f"{job_3.link}".encode(), response.content)
         self.assertNotIn(f"{job_3.date:%B %d, %Y}".encode(), response.content)
 
+    @override_settings(JOBS_PAGE_SIZE=2)
+    def test_company_detail_pagination(self):
+        # Testing that the company page shows the jobs newest first, split into pages, with the cached job count.
+        ingest_jobs([
+            JobRecord(f"Job {number}", "Company One", datetime.date(2021, 4, day), f"https://some-link-{number}")
+            for number, day in ((1, 15), (2, 20), (3, 27))
+        ])
+        ingest_jobs([JobRecord("Job 4", "Company Two", datetime.date(2021, 4, 30), "https://some-link-4")])
+        company = Company.objects.get(name="Company One")
+
+        # The data version, the company and one page of its jobs. The jobs are never counted.
+        with self.assertNumQueries(3):
+            response = self.client.get(f"/{company.id}/")
+        self.assertEqual([job.title for job in response.context["jobs_list"]], ["Job 3", "Job 2"])
+        self.assertIn(b"3 jobs, the latest one posted on April 27, 2021", response.content)
+
+        response = self.client.get(f"/{company.id}/", {'after': response.context["next_cursor"]})
+        self.assertEqual([job.title for job in response.context["jobs_list"]], ["Job 1"])
+        self.assertIsNone(response.context["next_cursor"])
+
     def test_search_viewset(self):
         # Testing the search view which will show us the results of our query.
         # Setting companies and jobs with different names to see if queryset is filtered properly.
@@ -220,4 +464,38 @@ class TestViewsets(TestCase):
         self.assertIn(f"{company_1.name}".encode(), response.content)
         self.assertIn(f"{job_1.title}".encode(), response.content)
         self.assertIn(f"{job_1.link}".encode(), response.content)
-        self.assertIn(f"{job_1.date:%B %d, %Y}".encode(), response.content)
\ No newline at end of file
+        self.assertIn(f"{job_1.date:%B %d, %Y}".encode(), response.content)
+
+    def test_search_index(self):
+        # Testing the full-text search: prefixes, ranking and keeping the index in sync with the database.
+        company = Company.objects.create(name="Acme")
+        backend = Jobs.objects.create(
+            title="Backend Developer",
+            company=company,
+            date=datetime.date(2021, 4, 15),
+            link="https://acme-backend",
+        )
+        python = Jobs.objects.create(
+            title="Python Backend Developer",
+            company=company,
+            date=datetime.date(2021, 4, 16),
+            link="https://acme-python",
+        )
+
+        # Every word is a prefix, and all the words have to match.
+        response = self.client.get('/search_jobs/', {'query': 'dev back'})
+        self.assertEqual(set(response.context["object_list"]), {backend, python})
+        response = self.client.get('/search_jobs/', {'query': 'pyth dev'})
+        self.assertEqual(list(response.context["object_list"]), [python])
+        # Punctuation doesn't break the search.
+        response = self.client.get('/search_jobs/', {'query': '"python" (*'})
+        self.assertEqual(list(response.context["object_list"]), [python])
+
+        # Renaming the company and deleting a job are reflected in the index.
+        company.name = "Globex"
+        company.save()
+        python.delete()
+        response = self.client.get('/search_jobs/', {'query': 'globex'})
+        self.assertEqual(list(response.context["object_list"]), [backend])
+        response = self.client.get('/search_jobs/', {'query': 'acme'})
+        self.assertNotIn(b"Backend Developer", response.content)
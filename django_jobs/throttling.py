@@ -0,0 +1,265 @@
+"""
+Rate limits per host, so the scrapers go as fast as every website allows, and not faster.
+Every host has a token bucket (HostThrottle). Every request takes a token, and the worker sleeps until the token
+is there. The buckets are kept in the database by default, so all the workers and processes share them.
+- The rate goes up a little with every request, up to SCRAPER_HOST_MAX_RATE, or the Crawl-delay from robots.txt;
+- '429 Too Many Requests' and '503 Service Unavailable' halve the rate, and nothing is sent to the host until
+  the time from the Retry-After header (or a minute, without the header);
+- If the database can't be used (e.g. it's locked for too long), the buckets are kept in the process instead.
+"""
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+from urllib.robotparser import RobotFileParser
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+import datetime
+import logging
+import requests
+import threading
+import time
+from .models import HostThrottle
+
+
+logger = logging.getLogger("django_jobs.scraping")
+
+# The additive increase (requests per second, with every request) and the multiplicative decrease of the rate.
+RATE_INCREASE = 0.05
+RATE_DECREASE = 0.5
+# We never go slower than a request every 20 seconds, and never wait longer than an hour for a host.
+MIN_RATE = 0.05
+DEFAULT_RETRY_AFTER = 60
+MAX_RETRY_AFTER = 60 * 60
+THROTTLED_STATUSES = {429, 503}
+
+
+def new_throttle(host, now=None):
+    return HostThrottle(
+        host=host,
+        tokens=settings.SCRAPER_HOST_BURST,
+        rate=settings.SCRAPER_HOST_RATE,
+        updated=now or timezone.now(),
+    )
+
+
+def host_limit(throttle):
+    # The highest rate the host allows us.
+    if throttle.crawl_delay:
+        return max(min(settings.SCRAPER_HOST_MAX_RATE, 1 / throttle.crawl_delay), MIN_RATE)
+    return settings.SCRAPER_HOST_MAX_RATE
+
+
+def refill(throttle, now):
+    """
+    The tokens of the bucket at the time the next request can start, and that time.
+    Nothing comes back while the host is blocked.
+    """
+    start = max(now, throttle.blocked_until or now)
+    rate = min(throttle.rate, host_limit(throttle))
+    # With a Crawl-delay, the requests are never sent in bursts.
+    burst = 1 if throttle.crawl_delay else settings.SCRAPER_HOST_BURST
+    elapsed = max((start - throttle.updated).total_seconds(), 0)
+    return min(throttle.tokens + elapsed * rate, burst), start, rate
+
+
+def reserve(throttle, now):
+    """
+    Taking a token for a request. Returns how many seconds the request has to wait.
+    The token is taken right away, even if it isn't there yet, so the requests which wait for the same host
+    are spread out instead of all starting at the same moment.
+    """
+    tokens, start, rate = refill(throttle, now)
+    throttle.tokens = tokens - 1
+    throttle.updated = start
+    if start == now:
+        # Speeding up only while the host isn't blocking us.
+        throttle.rate = min(rate + RATE_INCREASE, host_limit(throttle))
+    return (start - now).total_seconds() + max(-throttle.tokens / rate, 0)
+
+
+def current_wait(throttle, now):
+    # How long a new request would wait, without taking a token.
+    tokens, start, rate = refill(throttle, now)
+    return (start - now).total_seconds() + max((1 - tokens) / rate, 0)
+
+
+def slow_down(throttle, now, retry_after=None):
+    # The host told us we are too fast. The rate is halved only once, not for every request which was in flight.
+    if throttle.blocked_until is None or throttle.blocked_until <= now:
+        throttle.rate = max(throttle.rate * RATE_DECREASE, MIN_RATE)
+    delay = min(DEFAULT_RETRY_AFTER if retry_after is None else retry_after, MAX_RETRY_AFTER)
+    throttle.blocked_until = max(throttle.blocked_until or now, now + datetime.timedelta(seconds=delay))
+    throttle.tokens = min(throttle.tokens, 0)
+
+
+def parse_retry_after(value, now=None):
+    # Retry-After is either a number of seconds or an HTTP date.
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+    try:
+        until = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if until.tzinfo is None:
+        until = until.replace(tzinfo=datetime.timezone.utc)
+    return max((until - (now or timezone.now())).total_seconds(), 0)
+
+
+class MemoryThrottleStore:
+    # The buckets of a single process. Used when the workers don't have to share them, and as the fallback.
+
+    def __init__(self):
+        self._throttles = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def throttle(self, host):
+        with self._lock:
+            if host not in self._throttles:
+                self._throttles[host] = new_throttle(host)
+            yield self._throttles[host]
+
+    def all(self):
+        with self._lock:
+            return sorted(self._throttles.values(), key=lambda throttle: throttle.host)
+
+
+class DatabaseThrottleStore:
+    """
+    The buckets shared by all the workers. The row of the host is locked while its bucket is changed.
+    SQLite has no SELECT ... FOR UPDATE: two workers could read the same bucket, and the second one to write would
+    fail. So the transaction starts with an UPDATE which changes nothing but takes the write lock of the database
+    (like BEGIN IMMEDIATE), and the other workers wait for it (busy_timeout) before they read the bucket.
+    """
+
+    @contextmanager
+    def throttle(self, host):
+        with transaction.atomic():
+            if connection.vendor == "sqlite":
+                HostThrottle.objects.filter(host=host).update(host=F("host"))
+            throttle = HostThrottle.objects.select_for_update().filter(host=host).first()
+            if throttle is None:
+                # Another worker may be creating the same host, the unique key keeps just one of them.
+                HostThrottle.objects.bulk_create([new_throttle(host)], ignore_conflicts=True)
+                throttle = HostThrottle.objects.select_for_update().get(host=host)
+            yield throttle
+            throttle.save()
+
+    def all(self):
+        return list(HostThrottle.objects.order_by("host"))
+
+
+def get_throttle_store():
+    # 'database', 'memory' or the dotted path of a store class with the same methods.
+    store = settings.SCRAPER_THROTTLE_STORE
+    if store == "database":
+        return DatabaseThrottleStore()
+    if store == "memory":
+        return MemoryThrottleStore()
+    return import_string(store)()
+
+
+class HostRateLimiter:
+    """
+    Waiting for the turn of every request, and learning from the answers of the hosts.
+    The Crawl-delay of every host is read from its robots.txt, which is downloaded once per SCRAPER_ROBOTS_TTL.
+    """
+
+    def __init__(self, store=None):
+        self.store = store or get_throttle_store()
+        self.fallback = MemoryThrottleStore()
+        self._robots = {}
+        self._lock = threading.Lock()
+
+    def _update(self, host, change):
+        try:
+            with self.store.throttle(host) as throttle:
+                return change(throttle)
+        except DatabaseError as e:
+            logger.warning(
+                f"The rate limit of {host} can't be kept in the database, falling back to the memory of this process "
+                f"(it isn't shared with the other workers until the database works again). See the Exception: {e}"
+            )
+            with self.fallback.throttle(host) as throttle:
+                return change(throttle)
+
+    def crawl_delay(self, url, session=None, timeout=None):
+        parts = urlsplit(url)
+        with self._lock:
+            delay, checked = self._robots.get(parts.netloc, (None, None))
+        if checked is not None and time.monotonic() - checked < settings.SCRAPER_ROBOTS_TTL:
+            return delay
+
+        parser = RobotFileParser()
+        try:
+            response = (session or requests).get(
+                f"{parts.scheme}://{parts.netloc}/robots.txt", timeout=timeout or settings.SCRAPER_TIMEOUT,
+            )
+            if response.status_code == 200:
+                parser.parse(response.text.splitlines())
+                delay = parser.crawl_delay("*")
+        except requests.RequestException as e:
+            logger.warning(f"Fetching robots.txt of {parts.netloc} failed. See the Exception: {e}")
+        with self._lock:
+            self._robots[parts.netloc] = (float(delay) if delay else None, time.monotonic())
+        return self._robots[parts.netloc][0]
+
+    def wait(self, url, session=None, timeout=None):
+        # Sleeping until the request can be sent. Returns the number of seconds we waited.
+        crawl_delay = self.crawl_delay(url, session, timeout)
+
+        def take_token(throttle):
+            throttle.crawl_delay = crawl_delay
+            return reserve(throttle, timezone.now())
+
+        seconds = self._update(urlsplit(url).netloc, take_token)
+        if seconds > 0:
+            time.sleep(seconds)
+        return seconds
+
+    def record(self, url, response):
+        # Slowing down when the host asks us to.
+        if response.status_code not in THROTTLED_STATUSES:
+            return
+        host = urlsplit(url).netloc
+        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+        logger.warning(
+            f"{host} answered with {response.status_code}, slowing down "
+            f"(Retry-After: {retry_after if retry_after is not None else 'none'})."
+        )
+        self._update(host, lambda throttle: slow_down(throttle, timezone.now(), retry_after))
+
+    def status(self):
+        # The current rate and wait time of every host, for the metrics.
+        now = timezone.now()
+        try:
+            throttles = self.store.all()
+        except DatabaseError:
+            throttles = []
+        throttles = {throttle.host: throttle for throttle in throttles}
+        for throttle in self.fallback.all():
+            throttles.setdefault(throttle.host, throttle)
+        return [
+            {"host": host, "rate": throttle.rate, "wait_seconds": current_wait(throttle, now),
+             "blocked": bool(throttle.blocked_until and throttle.blocked_until > now)}
+            for host, throttle in sorted(throttles.items())
+        ]
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    # One limiter per process, so the robots.txt of every host is downloaded only once.
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = HostRateLimiter()
+        return _limiter
@@ -7,4 +7,9 @@ urlpatterns = [
     path('', views.Homepage.as_view(), name='homepage'),
     path('<int:pk>/', views.CompanyDetailView.as_view(), name='company-detail'),
     path('search_jobs/', views.SearchViewSet.as_view(), name='search'),
+    path('archive/', views.ArchiveView.as_view(), name='archive'),
+    path('export/jobs.csv', views.ExportView.as_view(export_format="csv"), name='export-csv'),
+    path('export/jobs.ndjson', views.ExportView.as_view(export_format="ndjson"), name='export-ndjson'),
+    path('api/jobs/', views.JobsFeedView.as_view(), name='jobs-feed'),
+    path('metrics/', views.MetricsView.as_view(), name='metrics'),
 ]
\ No newline at end of file
@@ -1,31 +1,214 @@
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import method_decorator
 from django.views import generic
+from django.views.decorators.gzip import gzip_page
+from .caching import VersionedCacheMixin
+from .duplicates import collapse_duplicates
+from .exports import EXPORT_COLUMNS, EXPORT_FIELDS, EXPORT_FORMATS, export_rows
+from .metrics import prometheus_metrics
+from .retention import search_archive
 from .models import Jobs, Company
-from django.db.models import Q
+from .search import search_jobs
+from django.db.models import Max, Q
+import datetime
 
 
-class Homepage(generic.ListView):
-    # A ListView for all the jobs from the database.
+class JobsCursorMixin:
+    """
+    Splitting a list of jobs, newest first, into pages with a cursor on (date, id) instead of an offset.
+    Every page is a single indexed query no matter how many jobs we have.
+    """
+    cursor_param = "after"
+
+    def get_cursor(self):
+        # The cursor is the date and the id of the last job from the previous page, e.g. '2021-04-27.123'.
+        try:
+            raw_date, raw_id = self.request.GET[self.cursor_param].split(".")
+            return datetime.date.fromisoformat(raw_date), int(raw_id)
+        except (KeyError, ValueError):
+            return None
+
+    def paginate_jobs(self, queryset):
+        queryset = queryset.order_by("-date", "-id")
+        cursor = self.get_cursor()
+        if cursor:
+            date, job_id = cursor
+            # (date, id) < cursor. The 'date__lte' part lets the database start from the cursor in the index.
+            queryset = queryset.filter(Q(date__lte=date), Q(date__lt=date) | Q(id__lt=job_id))
+
+        # Fetching one job more than we show, so we know if there is a next page.
+        jobs = list(queryset[:settings.JOBS_PAGE_SIZE + 1])
+        self.next_cursor = None
+        if len(jobs) > settings.JOBS_PAGE_SIZE:
+            jobs = jobs[:settings.JOBS_PAGE_SIZE]
+            self.next_cursor = f"{jobs[-1].date.isoformat()}.{jobs[-1].id}"
+        return jobs
+
+
+class Homepage(JobsCursorMixin, VersionedCacheMixin, generic.ListView):
+    # A ListView for all the jobs from the database, newest first.
     template_name = "django_jobs/homepage.html"
+    context_object_name = "jobs_list"
 
     def get_queryset(self):
-        return Jobs.objects.all()
+        # The same job from different sources is shown once.
+        return self.paginate_jobs(collapse_duplicates(Jobs.objects.select_related("company")))
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["next_cursor"] = self.next_cursor
+        return context
 
 
-class CompanyDetailView(generic.DetailView):
+class CompanyDetailView(JobsCursorMixin, VersionedCacheMixin, generic.DetailView):
     # A DetailView for each company we have in our database and jobs related to the company.
+    # The jobs are paginated like on the homepage, and the number of jobs is read from the company itself.
     template_name = "django_jobs/company_detail.html"
-    queryset = Company.objects.prefetch_related("jobs_set")
+    queryset = Company.objects.all()
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # The (company, date) index gives us the jobs of the company already in order.
+        context["jobs_list"] = self.paginate_jobs(collapse_duplicates(self.object.jobs_set.all()))
+        context["next_cursor"] = self.next_cursor
+        return context
 
 
-class SearchViewSet(generic.ListView):
+class SearchViewSet(VersionedCacheMixin, generic.ListView):
     # Adding a search view for search function.
+    # The jobs are found through the full-text index of job titles and company names, best matches first.
     model = Jobs
     template_name = "django_jobs/search_results.html"
 
+    def get_page(self):
+        try:
+            return max(int(self.request.GET.get("page", 1)), 1)
+        except ValueError:
+            return 1
+
+    def get_queryset(self):
+        # Searching for both, job titles and company names, based on a user's input.
+        query = self.request.GET.get('query')
+        page = self.get_page()
+        # Fetching one job more than we show, so we know if there is a next page.
+        object_list = search_jobs(query, offset=(page - 1) * settings.JOBS_PAGE_SIZE, limit=settings.JOBS_PAGE_SIZE + 1)
+        self.next_page = page + 1 if len(object_list) > settings.JOBS_PAGE_SIZE else None
+        return object_list[:settings.JOBS_PAGE_SIZE]
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["query"] = self.request.GET.get('query', '')
+        context["next_page"] = self.next_page
+        return context
+
+
+class ArchiveView(VersionedCacheMixin, generic.ListView):
+    """
+    Searching the archived (old) jobs, with the words from 'query' and an optional 'company', 'since' and 'until'.
+    It's a slower path than the rest of the website (LIKE queries, numbered pages), but it's rarely used.
+    """
+    template_name = "django_jobs/archive.html"
+    context_object_name = "jobs_list"
+
+    def get_date(self, name):
+        try:
+            return datetime.date.fromisoformat(self.request.GET[name])
+        except (KeyError, ValueError):
+            return None
+
+    def get_paginate_by(self, queryset):
+        return settings.JOBS_PAGE_SIZE
+
     def get_queryset(self):
-        # Filtering the queryset based on a user's input.
-        queryset = self.request.GET.get('query')
-        # Searching for both, job titles and company names.
-        object_list = Jobs.objects.filter(Q(title__contains=queryset) | Q(company__name__contains=queryset))
-        if object_list:
-            return object_list
\ No newline at end of file
+        return search_archive(
+            query=self.request.GET.get("query"),
+            company=self.request.GET.get("company"),
+            since=self.get_date("since"),
+            until=self.get_date("until"),
+        )
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # The filters without the page number, for the links to the other pages.
+        params = self.request.GET.copy()
+        params.pop("page", None)
+        context["query"] = self.request.GET.get("query", "")
+        context["filters"] = params.urlencode()
+        return context
+
+
+class MetricsView(generic.View):
+    # The scraping metrics (time per phase, downloaded bytes, new jobs...) in the Prometheus text format.
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(prometheus_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+class ExportView(generic.View):
+    """
+    Streaming all the jobs (with the company names) as CSV or JSON Lines, for the consumers of our data.
+    The response is written while the rows are read from the database, so the memory stays flat.
+    Filters (both optional):
+    - since: a date (YYYY-MM-DD), only the jobs from that date on;
+    - company: the id of a company, only the jobs of that company.
+    """
+    export_format = "csv"
+
+    def get(self, request, *args, **kwargs):
+        since = request.GET.get("since")
+        company = request.GET.get("company")
+        try:
+            since = datetime.date.fromisoformat(since) if since else None
+            company = int(company) if company else None
+        except ValueError:
+            return HttpResponseBadRequest("'since' has to be a date (YYYY-MM-DD) and 'company' a company id.")
+
+        stream, content_type = EXPORT_FORMATS[self.export_format]
+        response = StreamingHttpResponse(stream(export_rows(since=since, company=company)), content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="jobs.{self.export_format}"'
+        return response
+
+
+@method_decorator(gzip_page, name="dispatch")
+class JobsFeedView(generic.View):
+    """
+    The jobs added after a cursor, as JSON, for the consumers which poll us for new jobs.
+    - since: the id of the last job the client has (0 by default). Only the newer jobs are returned, oldest first,
+      at most JOBS_FEED_LIMIT of them, and 'next_since' is the cursor for the next request.
+    The ETag is built from the newest job id, so a client which sends it back in If-None-Match gets
+    '304 Not Modified' after a single lookup in the primary key index, until the scrapers add new jobs.
+    Large responses are gzipped for the clients which accept it.
+    """
+
+    def get(self, request, *args, **kwargs):
+        try:
+            since = max(int(request.GET.get("since", 0)), 0)
+        except ValueError:
+            return HttpResponseBadRequest("'since' has to be a job id.")
+
+        latest = Jobs.objects.aggregate(latest=Max("id"))["latest"] or 0
+        limit = settings.JOBS_FEED_LIMIT
+        etag = f'"jobs-{latest}-{since}-{limit}"'
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            not_modified["ETag"] = etag
+            return not_modified
+
+        # The jobs added after we read the newest id go to the next response, so the body matches the ETag.
+        # Duplicates are included, 'cluster_id' tells which jobs are the same posting.
+        rows = list(
+            Jobs.objects.filter(id__gt=since, id__lte=latest).order_by("id").values_list(*EXPORT_FIELDS)[:limit]
+        )
+        jobs = [dict(zip(EXPORT_COLUMNS, row)) for row in rows]
+        next_since = jobs[-1]["id"] if jobs else max(since, latest)
+        response = JsonResponse({
+            "jobs": jobs,
+            "next_since": next_since,
+            "more": next_since < latest,
+        }, json_dumps_params={"ensure_ascii": False})
+        response["ETag"] = etag
+        # The clients may keep the response, but have to ask us again (with If-None-Match) every time.
+        response["Cache-Control"] = "no-cache"
+        return response